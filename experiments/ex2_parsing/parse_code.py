@@ -6,8 +6,9 @@ Goal: Extract functions, classes, and metadata from Python files
 from tree_sitter import Language, Parser
 import os
 
-# Load the language library
-PY_LANGUAGE = Language('build/languages.so', 'python')
+# Load the language library (resolved next to this file so other exercises can import us)
+LANGUAGES_LIB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build', 'languages.so')
+PY_LANGUAGE = Language(LANGUAGES_LIB, 'python')
 
 # Create parser
 parser = Parser()
@@ -20,11 +21,12 @@ def read_file(filepath):
         return f.read()
 
 
-def extract_functions(tree, source_code):
+def extract_functions(tree, source_code, include_code=True):
     """
     Extract all function definitions from the AST
     
-    Returns list of dicts with function metadata
+    Returns list of dicts with function metadata. With include_code=False the
+    'code' string is left out; start_byte/end_byte still locate it.
     """
     functions = []
     
@@ -50,17 +52,19 @@ def extract_functions(tree, source_code):
                         docstring = source_code[expr.start_byte:expr.end_byte].decode('utf8')
                         docstring = docstring.strip('"""').strip("'''").strip()
             
-            # Extract full function code
-            full_code = source_code[node.start_byte:node.end_byte].decode('utf8')
-            
-            functions.append({
+            function = {
                 'name': func_name,
                 'parameters': params,
                 'docstring': docstring,
                 'start_line': node.start_point[0] + 1,
                 'end_line': node.end_point[0] + 1,
-                'code': full_code
-            })
+                'start_byte': node.start_byte,
+                'end_byte': node.end_byte,
+            }
+            if include_code:
+                # Extract full function code
+                function['code'] = source_code[node.start_byte:node.end_byte].decode('utf8')
+            functions.append(function)
         
         # Recursively process children
         for child in node.children:
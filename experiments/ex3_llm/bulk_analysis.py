@@ -0,0 +1,312 @@
+"""
+Bulk per-function LLM analysis with checkpoint/resume
+
+Example 5 analyses one function. Running that over every function
+extract_functions finds is tens of thousands of LLM calls, so this job:
+
+- streams functions from the parser straight into a bounded pool (only
+  `workers` requests in flight and a few more queued; only hashes of
+  finished functions are kept, never the code of the whole repository)
+- appends every finished analysis to results.jsonl as it completes; a
+  crashed or interrupted run resumes where it left off
+- keys results by a hash of model + prompt + function code, so unchanged
+  functions are skipped on re-runs (even if they moved), and switching
+  model or prompt re-analyses everything
+- prints throughput while it runs (and an ETA when `expected` is given)
+- turns the summaries into extra retrieval text: summary_chunks() yields
+  chunk dicts that can be embedded next to the code chunks
+
+Usage:
+    python bulk_analysis.py <repo> [out_dir] [--model llama3.2] [--workers 4]
+    python bulk_analysis.py <repo> --fake        # offline dry run with a fake model
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ex5_indexing'))
+from pipeline_index import discover_files, parse_python_file
+
+PROMPT_VERSION = 1  # bump when the prompt or schema changes: every function is re-analysed
+
+SYSTEM_PROMPT = """You are a code analyzer. Return your analysis as JSON with these exact fields:
+{
+  "function_name": "string",
+  "purpose": "string (one sentence)",
+  "summary": "string (2-3 sentence docstring-style summary)",
+  "parameters": ["array", "of", "strings"],
+  "complexity": "simple" or "moderate" or "complex"
+}
+
+Return ONLY the JSON, no explanations or markdown."""
+
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "function_name": {"type": "string"},
+        "purpose": {"type": "string"},
+        "summary": {"type": "string"},
+        "parameters": {"type": "array", "items": {"type": "string"}},
+        "complexity": {"type": "string", "enum": ["simple", "moderate", "complex"]},
+    },
+    "required": ["function_name", "purpose", "summary", "complexity"],
+}
+
+
+def content_hash(code, model):
+    """Result key: a new model, prompt text or PROMPT_VERSION never reuses old analyses"""
+    digest = hashlib.sha256()
+    for part in (model, f"v{PROMPT_VERSION}", SYSTEM_PROMPT, code):
+        digest.update(part.encode('utf8') + b'\0')
+    return digest.hexdigest()
+
+
+def iter_functions(root, model, parse_fn=parse_python_file):
+    """Yield every function in the repository as {'hash', 'file', 'function', 'start_line', 'code'}"""
+    for path in discover_files(root):
+        try:
+            functions = parse_fn(path)
+        except Exception as e:
+            print(f"⚠️  Could not parse {path}: {e}")
+            continue
+        for func in functions:
+            yield {
+                'hash': content_hash(func['code'], model),
+                'file': os.path.relpath(path, root),
+                'function': func['name'],
+                'start_line': func['start_line'],
+                'code': func['code'],
+            }
+
+
+# ============================================================================
+# ANALYZERS
+# ============================================================================
+
+def ollama_analyzer(model="llama3.2"):
+    """analyze_fn backed by Ollama, with streaming JSON validation and retry"""
+    from structured_output import StructuredCall, ollama_stream
+    from warm_start import KEEP_ALIVE, warm_up_ollama
+
+    warm_up_ollama(model, prefix=False)
+    chat_fn = ollama_stream(model, keep_alive=KEEP_ALIVE, temperature=0.0)
+
+    def analyze(func):
+        messages = [{"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": f"Analyze this function:\n\n{func['code']}"}]
+        return StructuredCall(chat_fn, messages, ANALYSIS_SCHEMA).run()
+
+    return analyze
+
+
+def fake_analyzer(seconds=0.02):
+    """Offline stand-in with a fixed per-call latency (for dry runs and demos)"""
+    def analyze(func):
+        time.sleep(seconds)
+        first_line = func['code'].split('\n', 1)[0]
+        lines = func['code'].count('\n') + 1
+        return {
+            'function_name': func['function'],
+            'purpose': f"Implements {func['function'].replace('_', ' ')}.",
+            'summary': f"{first_line.strip()} ({lines} lines).",
+            'parameters': [],
+            'complexity': 'simple' if lines < 10 else 'moderate' if lines < 40 else 'complex',
+        }
+    return analyze
+
+
+# ============================================================================
+# CHECKPOINT
+# ============================================================================
+
+class Checkpoint:
+    """Append-only results.jsonl; one line per finished function, flushed as it completes"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}  # hash -> record
+        if os.path.exists(path):
+            with open(path, encoding='utf8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # last line cut short by a crash: that function is simply redone
+                    if 'analysis' in record:
+                        self.done[record['hash']] = record
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'a', encoding='utf8')
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            if 'analysis' in record:
+                self.done[record['hash']] = record
+
+    def close(self):
+        self._file.close()
+
+
+# ============================================================================
+# JOB RUNNER
+# ============================================================================
+
+def run_job(functions, out_dir, analyze_fn, workers=4, progress_interval=5.0, max_errors=None,
+            expected=None):
+    """
+    Analyse every function not already in out_dir/results.jsonl
+
+    functions may be a generator (iter_functions): it is consumed only as
+    fast as the pool frees up, so the repository is never held in memory.
+    expected: number of functions, if known, for an ETA in the progress line.
+
+    Returns {'total', 'skipped', 'analyzed', 'errors', 'seconds', 'per_second'}.
+    """
+    checkpoint = Checkpoint(os.path.join(out_dir, 'results.jsonl'))
+    seen = set(checkpoint.done)
+    stats = {'total': 0, 'skipped': 0, 'analyzed': 0, 'errors': 0}
+    print(f"📋 {len(seen)} functions already analysed, analysing the rest with {workers} worker(s)")
+
+    def unseen():
+        for func in functions:
+            stats['total'] += 1
+            if func['hash'] in seen:  # unchanged (or duplicate) functions are skipped
+                stats['skipped'] += 1
+                continue
+            seen.add(func['hash'])
+            yield func
+
+    def analyze(func):
+        start = time.perf_counter()
+        record = {key: func[key] for key in ('hash', 'file', 'function', 'start_line')}
+        try:
+            record['analysis'] = analyze_fn(func)
+        except Exception as e:
+            record['error'] = str(e)
+        record['seconds'] = time.perf_counter() - start
+        checkpoint.write(record)
+        return record
+
+    start = time.perf_counter()
+    last_report = start
+    pending = set()
+    queue = unseen()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            # Keep at most 2 x workers submitted: memory stays flat on huge repos
+            while len(pending) < workers * 2:
+                func = next(queue, None)
+                if func is None:
+                    break
+                pending.add(pool.submit(analyze, func))
+            if not pending:
+                break
+            done, pending = wait(pending, timeout=progress_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                stats['analyzed' if 'analysis' in record else 'errors'] += 1
+            if max_errors is not None and stats['errors'] > max_errors:
+                for future in pending:
+                    future.cancel()
+                print(f"❌ Stopping: {stats['errors']} errors (resume later, finished work is kept)")
+                break
+
+            now = time.perf_counter()
+            if now - last_report >= progress_interval:
+                last_report = now
+                finished = stats['analyzed'] + stats['errors']
+                rate = finished / (now - start)
+                eta = ''
+                if expected and rate:
+                    eta = f", ETA {max(0, expected - stats['total']) / rate:.0f}s"
+                print(f"   ⏳ {finished} analysed, {stats['skipped']} skipped, {stats['total']} seen "
+                      f"({rate:.1f} functions/s{eta}, {stats['errors']} errors)")
+
+    checkpoint.close()
+    stats['seconds'] = time.perf_counter() - start
+    stats['per_second'] = (stats['analyzed'] + stats['errors']) / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+# ============================================================================
+# SUMMARIES AS RETRIEVAL TEXT
+# ============================================================================
+
+def summary_chunks(out_dir, functions):
+    """
+    One chunk per current function with an analysis, whose 'code' is the
+    natural-language summary, so it can go through the same embed/index path
+    as code chunks and match questions phrased in words rather than identifiers
+
+    Analyses are looked up by content hash, so moved or duplicated functions
+    get their summary and deleted ones drop out.
+    """
+    analyses = Checkpoint(os.path.join(out_dir, 'results.jsonl'))
+    analyses.close()
+    for func in functions:
+        record = analyses.done.get(func['hash'])
+        if record is None:
+            continue
+        analysis = record['analysis']
+        yield {
+            'file': func['file'],
+            'function': func['function'],
+            'start_line': func['start_line'],
+            'kind': 'summary',
+            'code': f"{func['function']}: {analysis.get('purpose', '')} {analysis.get('summary', '')}".strip(),
+        }
+
+
+def index_summaries(out_dir, functions, embed_fn, dimension, batch_size=64):
+    """Embed summary_chunks() into out_dir/summaries/index.faiss + metadata.jsonl"""
+    from pipeline_index import IndexWriter
+
+    writer = IndexWriter(os.path.join(out_dir, 'summaries'), dimension)
+    batch = []
+    for chunk in summary_chunks(out_dir, functions):
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            writer.write((batch, embed_fn([c['code'] for c in batch])))
+            batch = []
+    if batch:
+        writer.write((batch, embed_fn([c['code'] for c in batch])))
+    return writer.close(), writer.index.ntotal
+
+
+# Main execution
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    flags = sys.argv[1:]
+    root = args[0] if args else os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    out_dir = args[1] if len(args) > 1 else 'output/analysis'
+    model = flags[flags.index('--model') + 1] if '--model' in flags else "llama3.2"
+    workers = int(flags[flags.index('--workers') + 1]) if '--workers' in flags else 4
+
+    print("=" * 70)
+    print("BULK FUNCTION ANALYSIS")
+    print("=" * 70)
+    print(f"\n📂 Repository: {root}\n💾 Checkpoint: {out_dir}/results.jsonl\n")
+
+    if '--fake' in flags:
+        model = 'fake'
+    analyze_fn = fake_analyzer(0.1) if model == 'fake' else ollama_analyzer(model)
+    stats = run_job(iter_functions(root, model), out_dir, analyze_fn, workers=workers,
+                    progress_interval=2.0)
+    print(f"\n✓ {stats['analyzed']} analysed, {stats['skipped']} skipped, {stats['errors']} errors "
+          f"in {stats['seconds']:.1f}s ({stats['per_second']:.1f} functions/s)")
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ex6_benchmarks'))
+    from benchmark import hashing_embedder
+    embed = hashing_embedder()
+    # A second streaming pass: cheaper than keeping every function's code from the first
+    index_path, vectors = index_summaries(out_dir, iter_functions(root, model), embed, embed.dimension)
+    print(f"✓ {vectors} summaries indexed as extra retrieval text -> {index_path}")
+    print("\n✅ Bulk analysis complete! Re-run to see unchanged functions skipped.")
@@ -0,0 +1,250 @@
+"""
+Conversation memory with a bounded prompt
+
+Resending the whole history on every turn (Example 4 in ollama_llm_call.py)
+makes each prompt - and each answer - slower than the last. ConversationMemory
+keeps the prompt roughly constant in size:
+
+- the last max_turns exchanges are sent verbatim, within a token budget
+- older exchanges are folded into a running summary
+- each turn sends only the retrieved chunks the verbatim history doesn't
+  already contain; once the turn that carried a chunk is folded into the
+  summary, its code has left the prompt and it is sent again when needed
+- fetched chunks are cached by id, so retrieve() doesn't re-fetch bodies
+
+Usage:
+    memory = ConversationMemory(summarize_fn=ollama_summarizer("llama3.2"))
+    messages = memory.build_messages(question, retrieved_chunks)
+    answer = ollama.chat(model=MODEL, messages=messages)['message']['content']
+    memory.add_turn(question, answer)
+"""
+
+from collections import OrderedDict
+
+
+_encoding = None
+
+
+def count_tokens(text):
+    """Token count via tiktoken when available, otherwise ~4 characters per token"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:  # not installed, or the encoding can't be downloaded offline
+            _encoding = False
+    if _encoding is False:
+        return max(1, len(text) // 4)
+    return len(_encoding.encode(text))
+
+
+def truncating_summarizer(max_chars=600):
+    """Offline fallback: keep the first sentence of each folded exchange"""
+    def summarize(previous_summary, turns):
+        lines = [previous_summary] if previous_summary else []
+        for turn in turns:
+            answer = turn['assistant'].split('. ')[0].strip()
+            lines.append(f"- Q: {turn['user'][:120]} A: {answer[:200]}")
+        summary = '\n'.join(lines)
+        return summary[-max_chars:]
+    return summarize
+
+
+def ollama_summarizer(model, max_words=120):
+    """Summarize folded turns with a local Ollama model"""
+    import ollama
+
+    def summarize(previous_summary, turns):
+        transcript = '\n'.join(f"User: {t['user']}\nAssistant: {t['assistant']}" for t in turns)
+        prompt = (f"Current summary:\n{previous_summary or '(empty)'}\n\n"
+                  f"New conversation turns:\n{transcript}\n\n"
+                  f"Update the summary in at most {max_words} words. Keep function names, "
+                  f"file names and decisions. Return only the summary.")
+        response = ollama.chat(model=model, messages=[{"role": "user", "content": prompt}],
+                               options={"temperature": 0.0})
+        return response['message']['content'].strip()
+    return summarize
+
+
+class ConversationMemory:
+    """Bounded chat history: recent turns verbatim, older turns summarized"""
+
+    def __init__(self, system_prompt="You are a helpful code assistant. Answer using the "
+                                     "provided code context and cite file:line.",
+                 max_turns=4, history_budget=1500, context_budget=2000,
+                 summarize_fn=None):
+        self.system_prompt = system_prompt
+        self.max_turns = max_turns
+        self.history_budget = history_budget  # tokens of verbatim questions + answers
+        self.context_budget = context_budget  # tokens of code carried by verbatim turns (and cached)
+        self.summarize_fn = summarize_fn or truncating_summarizer()
+        self.summary = ""
+        self.turns = []
+        self.chunks = OrderedDict()  # chunk id -> chunk, least recently used first
+        self.chunk_hits = 0
+        self.chunk_misses = 0
+        self.chunks_sent = 0
+        self.chunks_reused = 0
+        self._pending = None  # the turn build_messages() prepared, completed by add_turn()
+
+    # ------------------------------------------------------------------ chunks
+
+    def known_chunk_ids(self):
+        """Ids whose code is in the verbatim history, i.e. in every prompt from now on"""
+        return list(OrderedDict.fromkeys(chunk_id for turn in self.turns for chunk_id in turn['chunk_ids']))
+
+    def add_chunks(self, chunks):
+        """
+        Cache retrieved chunks; returns only the ones not cached before
+
+        Chunks already cached are just marked as recently used. The chunks
+        passed in are never evicted by this call.
+        """
+        new_chunks = []
+        for chunk in chunks:
+            chunk_id = chunk['id']
+            if chunk_id in self.chunks:
+                self.chunks.move_to_end(chunk_id)
+                self.chunk_hits += 1
+            else:
+                self.chunks[chunk_id] = chunk
+                new_chunks.append(chunk)
+                self.chunk_misses += 1
+        self._evict_chunks(keep={chunk['id'] for chunk in chunks})
+        return new_chunks
+
+    def retrieve(self, query, search_ids_fn, fetch_fn, k=3):
+        """
+        Re-use cached chunks: search_ids_fn(query, k) only returns ids and
+        fetch_fn(ids) loads the bodies of the ids we don't already hold
+        """
+        ids = search_ids_fn(query, k)
+        missing = [chunk_id for chunk_id in ids if chunk_id not in self.chunks]
+        fetched = {chunk['id']: chunk for chunk in fetch_fn(missing)} if missing else {}
+        chunks = [self.chunks.get(chunk_id) or fetched[chunk_id] for chunk_id in ids]
+        self.add_chunks(chunks)
+        return chunks
+
+    def _evict_chunks(self, keep=()):
+        """Drop least recently used cached chunks over context_budget, never those in keep"""
+        tokens = sum(count_tokens(c['code']) for c in self.chunks.values())
+        for chunk_id in list(self.chunks):
+            if tokens <= self.context_budget:
+                break
+            if chunk_id not in keep:
+                tokens -= count_tokens(self.chunks.pop(chunk_id)['code'])
+
+    # ------------------------------------------------------------------- turns
+
+    def add_turn(self, user_message, assistant_message):
+        """Record a finished exchange (with the code build_messages sent for it)"""
+        pending, self._pending = self._pending, None
+        if pending is None or pending['user'] != user_message:
+            pending = {'user': user_message, 'content': user_message, 'chunk_ids': [], 'context_tokens': 0}
+        self.turns.append(dict(pending, assistant=assistant_message))
+        self._fold_old_turns()
+
+    def _turn_tokens(self):
+        return sum(count_tokens(t['user']) + count_tokens(t['assistant']) for t in self.turns)
+
+    def _context_tokens(self):
+        return sum(t['context_tokens'] for t in self.turns)
+
+    def _fold_old_turns(self):
+        """
+        Move turns beyond max_turns / the token budgets into the summary
+
+        The code a folded turn carried leaves the prompt with it, so its ids
+        drop out of known_chunk_ids() and are re-sent if retrieved again.
+        The latest turn is always kept.
+        """
+        folded = []
+        while self.turns and (len(self.turns) > self.max_turns
+                              or (len(self.turns) > 1 and (self._turn_tokens() > self.history_budget
+                                                           or self._context_tokens() > self.context_budget))):
+            folded.append(self.turns.pop(0))
+        if folded:
+            self.summary = self.summarize_fn(self.summary, folded)
+
+    # ---------------------------------------------------------------- messages
+
+    def _context_block(self, chunks):
+        parts = []
+        for chunk in sorted(chunks, key=lambda c: c['id']):  # id order: same chunks -> same bytes
+            location = chunk['id']
+            if 'file' in chunk and 'start_line' in chunk:
+                location = f"{chunk['file']}:{chunk['start_line']}"
+            parts.append(f"[{chunk['id']}] {location}\n```python\n{chunk['code']}\n```")
+        return '\n\n'.join(parts)
+
+    def build_messages(self, user_message, retrieved_chunks=()):
+        """
+        Messages for the next call: the fixed system prompt, recent turns
+        (each with the code it carried), then summary + code not sent
+        before + the new question
+
+        Everything that changes between calls comes last, so each prompt
+        starts with the same bytes as the previous one and the server's
+        prefix cache can skip re-reading the system prompt and history.
+        """
+        retrieved_chunks = list(retrieved_chunks)
+        self.add_chunks(retrieved_chunks)
+        known = set(self.known_chunk_ids())
+        new_chunks = list({chunk['id']: chunk for chunk in retrieved_chunks
+                           if chunk['id'] not in known}.values())
+        self.chunks_sent += len(new_chunks)
+        self.chunks_reused += len(retrieved_chunks) - len(new_chunks)
+
+        parts = []
+        context_tokens = 0
+        if new_chunks:
+            block = self._context_block(new_chunks)
+            context_tokens = count_tokens(block)
+            parts.append(f"Code context (referenced by id):\n{block}")
+        question = user_message
+        if retrieved_chunks:
+            ids = ', '.join(chunk['id'] for chunk in retrieved_chunks)
+            earlier = [chunk['id'] for chunk in retrieved_chunks if chunk['id'] in known]
+            note = f"; shown earlier in this conversation: {', '.join(earlier)}" if earlier else ""
+            question = f"{user_message}\n\n(Relevant chunks: {ids}{note})"
+        parts.append(question)
+        content = '\n\n'.join(parts)
+        self._pending = {'user': user_message, 'content': content,
+                         'chunk_ids': [chunk['id'] for chunk in new_chunks],
+                         'context_tokens': context_tokens}
+
+        messages = [{"role": "system", "content": self.system_prompt}]
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn['content']})
+            messages.append({"role": "assistant", "content": turn['assistant']})
+        if self.summary:
+            content = f"Summary of the earlier conversation:\n{self.summary}\n\n{content}"
+        messages.append({"role": "user", "content": content})
+        return messages
+
+    def prompt_tokens(self, messages):
+        return sum(count_tokens(m['content']) for m in messages)
+
+
+# Main execution
+if __name__ == "__main__":
+    print("=" * 70)
+    print("BOUNDED CONVERSATION MEMORY")
+    print("=" * 70)
+
+    memory = ConversationMemory(max_turns=3)
+    chunk = {'id': 'billing.py:calculate_total', 'file': 'billing.py', 'start_line': 23,
+             'code': "def calculate_total(items):\n    return sum(item.price for item in items)"}
+
+    print(f"\n  {'turn':>4} {'prompt tokens':>14} {'verbatim turns':>15} {'summary chars':>14}")
+    for turn in range(1, 13):
+        question = f"Follow-up question #{turn} about calculate_total and missing prices?"
+        messages = memory.build_messages(question, [chunk])
+        answer = f"Answer {turn}. " + "It sums item prices and could use getattr(item, 'price', 0). " * 3
+        memory.add_turn(question, answer)
+        print(f"  {turn:>4} {memory.prompt_tokens(messages):>14} {len(memory.turns):>15} "
+              f"{len(memory.summary):>14}")
+
+    print(f"\n  Chunks: {memory.chunks_sent} sent, {memory.chunks_reused} re-used from the history")
+    print("\n💡 Prompt size levels off instead of growing with every turn")
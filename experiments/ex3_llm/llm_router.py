@@ -0,0 +1,424 @@
+"""
+Hedged and fallback routing over several LLM backends
+
+simple_llm_call.py picks one provider with USE_ANTHROPIC / USE_OPENAI flags
+and ollama_llm_call.py hard-codes MODEL, so one slow or stalled backend
+stalls the user. LLMRouter sits in front of several backends (Ollama,
+Anthropic, OpenAI):
+
+- the backend with the best latency EWMA (errors count as a penalty) is
+  tried first
+- if it hasn't answered by its own p95 latency, a hedged duplicate request
+  goes to the next backend; the first answer wins and the loser is cancelled
+- if a backend raises, the next one is tried (fallback)
+
+Backends are plain callables `fn(messages, cancel) -> str`, where cancel is
+a threading.Event the backend should check while generating (the backends
+below stream, so they stop within one token of cancellation). A backend
+stalled before its first token can't see the event, so every attempt runs
+on its own thread: a stuck call never delays a hedge, and the HTTP timeout
+of each backend eventually frees the thread. fake_backend() injects delay,
+stalls and errors for tests and demos.
+
+Usage:
+    router = LLMRouter([ollama_backend("llama3.2"), anthropic_backend(), openai_backend("gpt-4o-mini")])
+    answer = router.chat([{"role": "user", "content": "Where is auth handled?"}])
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+
+class AllBackendsFailed(RuntimeError):
+    """Every backend raised (or was cancelled) for one request"""
+
+    def __init__(self, errors):
+        self.errors = errors  # backend name -> exception
+        details = '; '.join(f"{name}: {error}" for name, error in errors.items())
+        super().__init__(f"All LLM backends failed ({details})")
+
+
+class Cancelled(Exception):
+    """Raised inside a backend that noticed its cancel event"""
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+def ollama_backend(model, timeout=60.0, **options):
+    """Streaming Ollama chat; stops reading (closing the request) once cancelled"""
+    import ollama
+
+    client = ollama.Client(timeout=timeout)
+
+    def call(messages, cancel):
+        parts = []
+        for chunk in client.chat(model=model, messages=messages, stream=True, **options):
+            if cancel.is_set():
+                raise Cancelled(model)
+            parts.append(chunk['message']['content'])
+        return ''.join(parts)
+
+    call.name = f"ollama:{model}"
+    return call
+
+
+def anthropic_backend(model="claude-sonnet-4-20250514", max_tokens=1024, api_key=None, timeout=60.0):
+    """Streaming Anthropic messages (same cancellation behaviour; system messages go to system=)"""
+    from anthropic import Anthropic
+
+    client = Anthropic(api_key=api_key or os.getenv('ANTHROPIC_API_KEY'), timeout=timeout)
+
+    def call(messages, cancel):
+        system = '\n\n'.join(m['content'] for m in messages if m['role'] == 'system')
+        kwargs = {'system': system} if system else {}
+        parts = []
+        with client.messages.stream(model=model, max_tokens=max_tokens,
+                                    messages=[m for m in messages if m['role'] != 'system'],
+                                    **kwargs) as stream:
+            for text in stream.text_stream:
+                if cancel.is_set():
+                    raise Cancelled(model)  # leaving the with block closes the response
+                parts.append(text)
+        return ''.join(parts)
+
+    call.name = f"anthropic:{model}"
+    return call
+
+
+def openai_backend(model, max_tokens=1024, api_key=None, timeout=60.0):
+    """Streaming OpenAI chat completions (same cancellation behaviour)"""
+    from openai import OpenAI
+
+    client = OpenAI(api_key=api_key or os.getenv('OPENAI_API_KEY'), timeout=timeout)
+
+    def call(messages, cancel):
+        parts = []
+        stream = client.chat.completions.create(model=model, messages=messages,
+                                                max_tokens=max_tokens, stream=True)
+        for chunk in stream:
+            if cancel.is_set():
+                stream.close()
+                raise Cancelled(model)
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+        return ''.join(parts)
+
+    call.name = f"openai:{model}"
+    return call
+
+
+def fake_backend(name, delay=0.05, jitter=0.0, stall_rate=0.0, stall_seconds=5.0,
+                 error_rate=0.0, seed=None):
+    """
+    Local stand-in that sleeps instead of generating
+
+    A stall sleeps stall_seconds (a hung backend); errors raise RuntimeError.
+    Sleeping happens in small steps so cancellation is honoured promptly,
+    like a streaming backend checking between tokens.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def call(messages, cancel):
+        with lock:
+            fail = rng.random() < error_rate
+            stalled = rng.random() < stall_rate
+            seconds = stall_seconds if stalled else max(0.0, delay + rng.uniform(-jitter, jitter))
+        if fail:
+            raise RuntimeError(f"{name} returned 503")
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            if cancel.wait(min(0.005, max(0.0, deadline - time.perf_counter()))):
+                raise Cancelled(name)
+        return f"[{name}] answer to: {messages[-1]['content'][:40]}"
+
+    call.name = name
+    return call
+
+
+# ============================================================================
+# LATENCY TRACKING
+# ============================================================================
+
+class BackendStats:
+    """EWMA + recent-window latency and error tracking for one backend"""
+
+    def __init__(self, name, alpha=0.2, window=200):
+        self.name = name
+        self.alpha = alpha
+        self.ewma = None          # seconds
+        self.error_ewma = 0.0     # smoothed error rate
+        self.recent = deque(maxlen=window)
+        self.calls = 0
+        self.wins = 0
+        self.errors = 0
+        self.hedged = 0           # times this backend was the slow primary
+        self.cancelled = 0
+
+    def _smooth(self, seconds):
+        self.ewma = seconds if self.ewma is None else self.alpha * seconds + (1 - self.alpha) * self.ewma
+
+    def record_success(self, seconds):
+        self.recent.append(seconds)
+        self._smooth(seconds)
+        self.error_ewma = (1 - self.alpha) * self.error_ewma
+
+    def record_error(self):
+        self.errors += 1
+        self.error_ewma = self.alpha + (1 - self.alpha) * self.error_ewma
+
+    def record_cancelled(self, seconds):
+        # Only a lower bound on its latency: it may raise the estimate (steering
+        # away from a stalled backend) but never lower it - a hedge cancelled
+        # a few ms after launch says nothing about how fast it would have been
+        self.cancelled += 1
+        if self.ewma is not None and seconds > self.ewma:
+            self._smooth(seconds)
+
+    def percentile(self, p):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    def as_dict(self):
+        p95 = self.percentile(95)
+        return {
+            'backend': self.name,
+            'calls': self.calls,
+            'wins': self.wins,
+            'errors': self.errors,
+            'hedged': self.hedged,
+            'cancelled': self.cancelled,
+            'ewma_ms': self.ewma * 1000 if self.ewma is not None else None,
+            'p95_ms': p95 * 1000 if p95 is not None else None,
+        }
+
+
+# ============================================================================
+# ROUTER
+# ============================================================================
+
+class LLMRouter:
+    """
+    Route chat requests over backends with hedging and fallback
+
+    hedge_percentile: a request is hedged once the primary is slower than
+    this percentile of its recent latencies (needs min_samples first;
+    until then default_deadline is used). error_penalty scales how much a
+    backend's smoothed error rate worsens its routing score. explore_rate
+    of requests go to the runner-up first, so a backend that recovered from
+    a bad patch gets its EWMA refreshed and can win the traffic back.
+    """
+
+    def __init__(self, backends, hedge_percentile=95, default_deadline=2.0, min_deadline=0.05,
+                 min_samples=20, alpha=0.2, error_penalty=4.0, explore_rate=0.05, seed=None):
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = list(backends)
+        self.stats = {b.name: BackendStats(b.name, alpha) for b in self.backends}
+        self.hedge_percentile = hedge_percentile
+        self.default_deadline = default_deadline
+        self.min_deadline = min_deadline
+        self.min_samples = min_samples
+        self.error_penalty = error_penalty
+        self.explore_rate = explore_rate
+        self._rng = random.Random(seed)
+        self.requests = 0
+        self.hedges = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        self._running = set()  # cancel events of attempts whose thread hasn't returned yet
+
+    def ranked(self):
+        """Backends ordered by latency EWMA x error penalty (untried ones first, in config order)"""
+        def score(item):
+            position, backend = item
+            stats = self.stats[backend.name]
+            if stats.calls == 0:
+                return (0, position)
+            ewma = stats.ewma if stats.ewma is not None else self.default_deadline
+            return (1, ewma * (1 + self.error_penalty * stats.error_ewma))
+        with self._lock:
+            ranked = [backend for _, backend in sorted(enumerate(self.backends), key=score)]
+            if len(ranked) > 1 and self._rng.random() < self.explore_rate:
+                ranked[0], ranked[1] = ranked[1], ranked[0]
+            return ranked
+
+    def deadline(self, backend):
+        """How long to wait on backend before hedging: its p95 (with enough samples)"""
+        stats = self.stats[backend.name]
+        with self._lock:
+            if len(stats.recent) < self.min_samples:
+                return self.default_deadline
+            return max(self.min_deadline, stats.percentile(self.hedge_percentile))
+
+    def _start(self, backend, messages, cancel):
+        """
+        Run one attempt on a thread of its own; returns a Future of (answer, seconds)
+
+        No shared pool: an attempt stuck before its first token (cancel can't
+        reach it) would otherwise hold a worker and queue later hedges behind it.
+        """
+        future = Future()
+
+        def run():
+            start = time.perf_counter()
+            try:
+                future.set_result((backend(messages, cancel), time.perf_counter() - start))
+            except Exception as e:
+                e.elapsed = time.perf_counter() - start
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._running.discard(cancel)
+
+        with self._lock:
+            self._running.add(cancel)
+        threading.Thread(target=run, name=f'llm-router-{backend.name}', daemon=True).start()
+        return future
+
+    def chat(self, messages):
+        """Answer text from whichever backend answers first; raises AllBackendsFailed"""
+        with self._lock:
+            self.requests += 1
+        queue = self.ranked()
+        in_flight = {}   # future -> (backend, cancel event, start time)
+        errors = {}
+
+        def launch():
+            backend = queue.pop(0)
+            cancel = threading.Event()
+            with self._lock:
+                self.stats[backend.name].calls += 1
+            future = self._start(backend, messages, cancel)
+            in_flight[future] = (backend, cancel, time.perf_counter())
+            return backend
+
+        primary = launch()
+        timeout = self.deadline(primary)
+        while in_flight:
+            done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # Primary (or current attempt) is past its deadline: hedge to the next backend
+                if queue:
+                    with self._lock:
+                        self.hedges += 1
+                        for backend, _, _ in in_flight.values():
+                            self.stats[backend.name].hedged += 1
+                    hedge = launch()
+                    timeout = self.deadline(hedge)
+                else:
+                    timeout = None  # nothing left to hedge with: wait for whoever answers
+                continue
+
+            for future in done:
+                backend, _, _ = in_flight.pop(future)
+                stats = self.stats[backend.name]
+                try:
+                    answer, seconds = future.result()
+                except Exception as e:
+                    errors[backend.name] = e
+                    with self._lock:
+                        stats.record_error()
+                    continue
+                with self._lock:
+                    stats.wins += 1
+                    stats.record_success(seconds)
+                self._cancel_losers(in_flight)
+                return answer
+
+            # Only failures completed: fall back to the next backend right away
+            if queue:
+                with self._lock:
+                    self.fallbacks += 1
+                fallback = launch()
+                timeout = self.deadline(fallback)
+            elif in_flight:
+                timeout = None
+        raise AllBackendsFailed(errors)
+
+    def _cancel_losers(self, in_flight):
+        now = time.perf_counter()
+        with self._lock:
+            for backend, cancel, start in in_flight.values():
+                cancel.set()
+                self.stats[backend.name].record_cancelled(now - start)
+        in_flight.clear()
+
+    def report(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedges': self.hedges,
+                'fallbacks': self.fallbacks,
+                'running': len(self._running),  # includes cancelled attempts still stuck in I/O
+                'backends': [self.stats[b.name].as_dict() for b in self.backends],
+            }
+
+    def close(self):
+        """Cancel every attempt still running (threads are daemons; nothing to join)"""
+        with self._lock:
+            for cancel in self._running:
+                cancel.set()
+
+
+# Main execution
+if __name__ == "__main__":
+    print("=" * 70)
+    print("HEDGED LLM ROUTING (fake backends)")
+    print("=" * 70)
+
+    def percentile(values, p):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    messages = [{"role": "user", "content": "Where is user authentication handled?"}]
+
+    def run(router, n=200):
+        latencies = []
+        for _ in range(n):
+            start = time.perf_counter()
+            router.chat(messages)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    def backends():
+        # Primary usually answers in ~20 ms but stalls 5% of the time; secondary is steady
+        return [fake_backend('local-fast', delay=0.02, jitter=0.005, stall_rate=0.05,
+                             stall_seconds=1.0, seed=1),
+                fake_backend('local-steady', delay=0.04, jitter=0.005, seed=2)]
+
+    single = LLMRouter(backends()[:1])
+    single_latencies = run(single)
+    single.close()
+
+    hedged = LLMRouter(backends(), default_deadline=0.1, seed=3)
+    hedged_latencies = run(hedged)
+
+    print(f"\n  {'setup':<16} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, latencies in (('single backend', single_latencies), ('hedged router', hedged_latencies)):
+        print(f"  {name:<16} {percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} "
+              f"{percentile(latencies, 99):>8.1f}")
+
+    report = hedged.report()
+    print(f"\n  {report['requests']} requests, {report['hedges']} hedged, {report['fallbacks']} fallbacks")
+    for b in report['backends']:
+        print(f"   {b['backend']:<14} wins {b['wins']:>4}  cancelled {b['cancelled']:>3}  "
+              f"EWMA {b['ewma_ms']:.1f} ms")
+    hedged.close()
+
+    print("\n🔁 Primary starts failing -> requests fall back")
+    flaky = LLMRouter([fake_backend('flaky', delay=0.01, error_rate=1.0),
+                       fake_backend('backup', delay=0.02)], explore_rate=0.0)
+    print(f"   {flaky.chat(messages)}")
+    print(f"   routing order now: {[b.name for b in flaky.ranked()]}")
+    flaky.close()
+
+    print("\n✅ Routing complete!")
@@ -4,9 +4,21 @@ Goal: Make your first LLM calls using local models
 """
 
 import ollama
+import os
+import sys
 import time
 
+# Hot-path instrumentation (see ex6_benchmarks/tracing.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ex6_benchmarks'))
+import tracing
+
+tracing.enable()
+
+# Warm-up, keep_alive and the stable system prefix (see warm_start.py)
+from warm_start import KEEP_ALIVE, ColdWarmStats, stable_prefix, warm_up_ollama
+
 MODEL = "llama3.2"  # or "codellama" or "mistral"
+cold_warm = ColdWarmStats()
 
 print("=" * 70)
 print("OLLAMA LLM SETUP")
@@ -25,6 +37,13 @@ try:
         print(f"  Available models: {model_names}")
         print(f"\n  Download it with: ollama pull {MODEL}")
         exit(1)
+
+    # Load the model now (not on the first question) and keep it resident.
+    # The load is the cold start; every chat below runs warm.
+    warm = warm_up_ollama(MODEL, keep_alive=KEEP_ALIVE)
+    cold_warm.record("model load", warm['load_seconds'])
+    print(f"✓ Model warmed up in {warm['load_seconds']:.2f}s "
+          f"(+{warm['prefix_seconds']:.2f}s system prefix), keep_alive={KEEP_ALIVE}")
     print()
 except Exception as e:
     print(f"❌ Cannot connect to Ollama: {e}")
@@ -37,16 +56,27 @@ except Exception as e:
 # HELPER FUNCTIONS
 # ============================================================================
 
+def record_token_counts(response):
+    """Feed Ollama's prompt/eval token counts into the tracing counters"""
+    tracing.incr("llm.tokens_in", response.get('prompt_eval_count') or 0)
+    tracing.incr("llm.tokens_out", response.get('eval_count') or 0)
+
+
 def call_llm_simple(prompt: str) -> str:
     """Make a simple LLM call"""
     print(f"📤 Sending prompt...")
     print(f"   Length: {len(prompt)} characters")
     
     try:
-        response = ollama.chat(
-            model=MODEL,
-            messages=[{"role": "user", "content": prompt}]
-        )
+        start = time.perf_counter()
+        with tracing.span("generate"):
+            response = ollama.chat(
+                model=MODEL,
+                keep_alive=KEEP_ALIVE,
+                messages=[{"role": "user", "content": prompt}]
+            )
+        cold_warm.record("generate", time.perf_counter() - start, warm=True)
+        record_token_counts(response)
         return response['message']['content']
     except Exception as e:
         return f"❌ Error: {e}"
@@ -59,13 +89,18 @@ def call_llm_with_system(system_prompt: str, user_prompt: str) -> str:
     print(f"   User: {len(user_prompt)} chars")
     
     try:
-        response = ollama.chat(
-            model=MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        )
+        start = time.perf_counter()
+        with tracing.span("generate"):
+            response = ollama.chat(
+                model=MODEL,
+                keep_alive=KEEP_ALIVE,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ]
+            )
+        cold_warm.record("generate", time.perf_counter() - start, warm=True)
+        record_token_counts(response)
         return response['message']['content']
     except Exception as e:
         return f"❌ Error: {e}"
@@ -79,15 +114,19 @@ def call_llm_streaming(prompt: str):
     try:
         stream = ollama.chat(
             model=MODEL,
+            keep_alive=KEEP_ALIVE,
             messages=[{"role": "user", "content": prompt}],
             stream=True
         )
         
         full_response = ""
-        for chunk in stream:
-            content = chunk['message']['content']
-            print(content, end="", flush=True)
-            full_response += content
+        with tracing.span("generate.stream"):
+            for chunk in stream:
+                content = chunk['message']['content']
+                print(content, end="", flush=True)
+                full_response += content
+                if chunk.get('done'):
+                    record_token_counts(chunk)
         
         print()  # New line after streaming
         return full_response
@@ -130,9 +169,10 @@ print("EXAMPLE 2: RAG-Style Prompt (With Code Context)")
 print("=" * 70)
 print("\nUse case: Providing retrieved code as context for the LLM\n")
 
-system_prompt = """You are a helpful code assistant. Answer questions based ONLY on the provided code context. 
-Always cite which file and line numbers you're referring to.
-Keep your answer concise and accurate."""
+# System prompt + instruction block, byte-identical on every RAG call and sent
+# first; the retrieved code and the question (which change) go after it, so
+# Ollama's prefix cache can reuse the already-processed system tokens.
+system_prompt = stable_prefix()
 
 code_context = """
 File: auth.py, Lines: 45-52
@@ -215,43 +255,36 @@ print("EXAMPLE 4: Multi-turn Conversation")
 print("=" * 70)
 print("\nUse case: Asking follow-up questions\n")
 
-conversation = []
-
-# First question
-question1 = """What does this function do?
+# Naively appending every turn to one list and resending it makes each call
+# slower than the last. ConversationMemory keeps the last few turns verbatim,
+# folds older ones into a summary and sends each code chunk only once.
+from conversation_memory import ConversationMemory, ollama_summarizer
 
-def calculate_total(items):
-    return sum(item.price for item in items)"""
+memory = ConversationMemory(max_turns=4, summarize_fn=ollama_summarizer(MODEL))
 
-print(f"👤 User: {question1}\n")
-
-response1 = ollama.chat(
-    model=MODEL,
-    messages=[{"role": "user", "content": question1}]
-)
-answer1 = response1['message']['content']
+calculate_total_chunk = {
+    "id": "billing.py:calculate_total",
+    "file": "billing.py",
+    "start_line": 23,
+    "code": "def calculate_total(items):\n    return sum(item.price for item in items)",
+}
 
-conversation = [
-    {"role": "user", "content": question1},
-    {"role": "assistant", "content": answer1}
+questions = [
+    ("What does calculate_total do?", [calculate_total_chunk]),
+    ("What if some items don't have a price attribute? How would you fix it?", []),
 ]
 
-print(f"🤖 Assistant: {answer1}\n")
-
-# Follow-up question
-question2 = "What if some items don't have a price attribute? How would you fix it?"
-
-print(f"👤 User: {question2}\n")
-
-conversation.append({"role": "user", "content": question2})
-
-response2 = ollama.chat(
-    model=MODEL,
-    messages=conversation
-)
-answer2 = response2['message']['content']
-
-print(f"🤖 Assistant: {answer2}\n")
+for question, retrieved in questions:
+    print(f"👤 User: {question}\n")
+    messages = memory.build_messages(question, retrieved)
+    with tracing.span("generate"):
+        response = ollama.chat(model=MODEL, messages=messages, keep_alive=KEEP_ALIVE)
+    record_token_counts(response)
+    answer = response['message']['content']
+    memory.add_turn(question, answer)
+    print(f"🤖 Assistant: {answer}\n")
+    print(f"   (prompt: {memory.prompt_tokens(messages)} tokens, "
+          f"{len(memory.turns)} verbatim turns kept)\n")
 
 input("⏸️  Press Enter to continue to Example 5...")
 
@@ -300,27 +333,42 @@ def process_user_data(user_id: int, data: dict, validate: bool = True) -> bool:
 
 user_prompt = f"Analyze this function:\n\n{code_to_analyze}"
 
-response = call_llm_with_system(system_prompt, user_prompt)
-
-print(f"\n📥 Response:\n{'-'*70}")
-print(response)
-print("-"*70)
-
-# Try to parse as JSON
+# Stream the answer into an incremental JSON parser: each field is validated
+# as soon as it is complete, a wrong shape aborts the stream right away and
+# the call is retried with format="json" (see structured_output.py)
 import json
+from structured_output import StructuredCall, StructuredOutputError, ollama_stream
+
+analysis_schema = {
+    "type": "object",
+    "properties": {
+        "function_name": {"type": "string"},
+        "purpose": {"type": "string"},
+        "parameters": {"type": "array", "items": {"type": "string"}},
+        "complexity": {"type": "string", "enum": ["simple", "moderate", "complex"]},
+        "line_count": {"type": "integer"},
+    },
+    "required": ["function_name", "purpose", "parameters", "complexity", "line_count"],
+}
+
+call = StructuredCall(
+    ollama_stream(MODEL, keep_alive=KEEP_ALIVE, temperature=0.0),
+    [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+    analysis_schema,
+)
+print(f"\n📥 Fields as they arrive:\n{'-'*70}")
+start_time = time.time()
 try:
-    # Clean up response (remove markdown code blocks if present)
-    clean_response = response.strip()
-    if "```json" in clean_response:
-        clean_response = clean_response.split("```json")[1].split("```")[0].strip()
-    elif "```" in clean_response:
-        clean_response = clean_response.split("```")[1].split("```")[0].strip()
-    
-    parsed = json.loads(clean_response)
-    print("\n✅ Successfully parsed as JSON:")
-    print(json.dumps(parsed, indent=2))
-except Exception as e:
-    print(f"\n⚠️  Could not parse as JSON: {e}")
+    with tracing.span("generate.structured"):
+        for key, value in call.fields():
+            print(f"  +{time.time() - start_time:5.2f}s  [attempt {call.attempt}] {key}: {value!r}")
+    print("-"*70)
+    for error in call.errors:
+        print(f"✂️  Aborted early, then retried with format='json': {error}")
+    print("\n✅ Validated JSON:")
+    print(json.dumps(call.result, indent=2))
+except StructuredOutputError as e:
+    print(f"\n⚠️  Could not get valid JSON: {e}")
     print("(Ollama models sometimes need more explicit prompting for JSON)")
 
 input("\n⏸️  Press Enter to see summary...")
@@ -344,6 +392,7 @@ for temp in [0.0, 0.5, 1.0]:
     
     response = ollama.chat(
         model=MODEL,
+        keep_alive=KEEP_ALIVE,
         messages=[{"role": "user", "content": prompt}],
         options={"temperature": temp}
     )
@@ -382,10 +431,19 @@ Key Takeaways:
 Performance Tips:
 - Llama3.2 is good for general tasks
 - CodeLlama is better for code-specific tasks
-- First query is slower (model loading), then faster
+- Warm the model up at startup and pass keep_alive, or the first query pays for loading it
+- Keep the system prompt first and byte-identical so prefix caching kicks in
 - Responses are slower than cloud APIs but 100% free!
 
 Next: You'll combine this with embeddings and FAISS to build a full RAG system!
 """)
 
+print("=" * 70)
+print("LATENCY BREAKDOWN (tracing)")
+print("=" * 70)
+tracing.report()
+print()
+cold_warm.report()
+print()
+
 print("🎉 Ready to continue to Exercise 5: Mini RAG System?")
\ No newline at end of file
@@ -0,0 +1,403 @@
+"""
+Structured (JSON) output from a token stream
+
+Example 5 in ollama_llm_call.py waits for the whole answer, strips ```json
+fences with string splits and only then finds out whether json.loads works;
+a failure means paying for the whole generation again. Here:
+
+- tokens are fed into an incremental parser as they stream in
+- each top-level field is validated against a (small JSON Schema subset)
+  schema the moment it is complete, and its type is checked as soon as its
+  first character arrives
+- an invalid shape (prose instead of an object, an unknown key, a string
+  where a number belongs, ...) aborts the stream immediately and the call is
+  retried with Ollama's format="json" option
+- completed fields can be consumed before generation ends
+
+Usage:
+    call = StructuredCall(ollama_stream("llama3.2"), messages, SCHEMA)
+    for key, value in call.fields():
+        print(key, value)          # arrives while the model is still writing
+    result = call.result
+"""
+
+import json
+import re
+
+JSON_TYPES = {
+    'string': str,
+    'number': (int, float),
+    'integer': int,
+    'boolean': bool,
+    'array': list,
+    'object': dict,
+    'null': type(None),
+}
+
+# JSON type implied by the first character of a value
+FIRST_CHAR_TYPES = {'"': 'string', '{': 'object', '[': 'array', 't': 'boolean', 'f': 'boolean', 'n': 'null'}
+NUMBER_START = set('-0123456789')
+WHITESPACE = ' \t\r\n'
+FENCE_PREFIX = re.compile(r'^(`{0,3}|```[A-Za-z]*\s*)$')
+
+
+class StructuredOutputError(ValueError):
+    """The stream can no longer produce a valid document"""
+
+
+class SchemaError(StructuredOutputError):
+    pass
+
+
+class JSONSyntaxError(StructuredOutputError):
+    pass
+
+
+# ============================================================================
+# VALIDATION
+# ============================================================================
+
+def _type_ok(value, expected):
+    if expected in ('integer', 'number') and isinstance(value, bool):
+        return False
+    if expected == 'integer' and isinstance(value, float) and value.is_integer():
+        return True
+    return isinstance(value, JSON_TYPES[expected])
+
+
+def validate(value, schema, path='$'):
+    """Check a decoded value against a JSON Schema subset (type, enum, properties, required, items)"""
+    expected = schema.get('type')
+    if expected is not None:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_type_ok(value, t) for t in types):
+            raise SchemaError(f"{path}: expected {expected}, got {type(value).__name__}")
+    if 'enum' in schema and value not in schema['enum']:
+        raise SchemaError(f"{path}: {value!r} is not one of {schema['enum']}")
+    if isinstance(value, dict):
+        properties = schema.get('properties', {})
+        for key, item in value.items():
+            if key in properties:
+                validate(item, properties[key], f"{path}.{key}")
+            elif schema.get('additionalProperties') is False:
+                raise SchemaError(f"{path}: unexpected field {key!r}")
+        missing = [key for key in schema.get('required', []) if key not in value]
+        if missing:
+            raise SchemaError(f"{path}: missing required field(s) {missing}")
+    if isinstance(value, list) and 'items' in schema:
+        for i, item in enumerate(value):
+            validate(item, schema['items'], f"{path}[{i}]")
+
+
+def _check_first_char(char, schema, path):
+    """Reject a value by its first character, before the rest of it is generated"""
+    expected = schema.get('type')
+    if expected is None:
+        return
+    types = expected if isinstance(expected, list) else [expected]
+    actual = 'number' if char in NUMBER_START else FIRST_CHAR_TYPES.get(char)
+    if actual is None:
+        raise JSONSyntaxError(f"{path}: unexpected character {char!r} at start of value")
+    if actual == 'number' and ('number' in types or 'integer' in types):
+        return
+    if actual not in types:
+        raise SchemaError(f"{path}: expected {expected}, got {actual}")
+
+
+# ============================================================================
+# INCREMENTAL PARSER
+# ============================================================================
+
+class IncrementalObjectParser:
+    """
+    Parse one top-level JSON object from text chunks
+
+    feed() returns the (key, value) pairs completed by that chunk. Leading
+    whitespace and a ```json fence are skipped; anything after the closing
+    brace is ignored.
+    """
+
+    def __init__(self, schema=None):
+        self.schema = schema or {}
+        self.properties = self.schema.get('properties', {})
+        self.result = {}
+        self.done = False
+        self._state = 'start'       # start, key_or_end, key_start, key, colon, value_start, value, comma_or_end
+        self._preamble = ''         # text before the opening brace
+        self._key = []
+        self._key_escape = False
+        self._value = []
+        self._value_kind = None     # 'string', 'container', 'scalar'
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._current_key = None
+
+    def feed(self, text):
+        completed = []
+        for char in text:
+            if self.done:
+                break
+            pair = self._step(char)
+            if pair is not None:
+                completed.append(pair)
+        return completed
+
+    def close(self):
+        """End of stream: the object must be complete and have every required field"""
+        if not self.done:
+            raise JSONSyntaxError("stream ended before the JSON object was closed")
+        return self.result
+
+    # ------------------------------------------------------------ state machine
+
+    def _step(self, char):
+        state = self._state
+        if state == 'start':
+            # Only whitespace or a markdown fence (```json) may precede the object
+            if char == '{':
+                self._state = 'key_or_end'
+                return None
+            self._preamble += char
+            if not FENCE_PREFIX.match(self._preamble.lstrip()):
+                raise SchemaError(f"expected a JSON object, got {self._preamble.strip()[:40]!r}")
+            return None
+
+        if state in ('key_or_end', 'key_start'):
+            if char in WHITESPACE:
+                return None
+            if char == '"':
+                self._state = 'key'
+                self._key = []
+                return None
+            if char == '}' and state == 'key_or_end':
+                return self._finish_object()
+            raise JSONSyntaxError(f"expected a field name, got {char!r}")
+
+        if state == 'key':
+            if self._key_escape:
+                self._key.append(char)
+                self._key_escape = False
+            elif char == '\\':
+                self._key.append(char)
+                self._key_escape = True
+            elif char == '"':
+                self._current_key = json.loads('"' + ''.join(self._key) + '"')
+                if (self.schema.get('additionalProperties') is False
+                        and self._current_key not in self.properties):
+                    raise SchemaError(f"$: unexpected field {self._current_key!r}")
+                self._state = 'colon'
+            else:
+                self._key.append(char)
+            return None
+
+        if state == 'colon':
+            if char in WHITESPACE:
+                return None
+            if char != ':':
+                raise JSONSyntaxError(f"expected ':' after {self._current_key!r}, got {char!r}")
+            self._state = 'value_start'
+            return None
+
+        if state == 'value_start':
+            if char in WHITESPACE:
+                return None
+            _check_first_char(char, self.properties.get(self._current_key, {}), f"$.{self._current_key}")
+            self._value = [char]
+            if char == '"':
+                self._value_kind, self._in_string = 'string', True
+            elif char in '{[':
+                self._value_kind, self._depth = 'container', 1
+            else:
+                self._value_kind = 'scalar'
+            self._state = 'value'
+            return None
+
+        if state == 'value':
+            return self._step_value(char)
+
+        if state == 'comma_or_end':
+            if char in WHITESPACE:
+                return None
+            if char == ',':
+                self._state = 'key_start'
+                return None
+            if char == '}':
+                return self._finish_object()
+            raise JSONSyntaxError(f"expected ',' or '}}', got {char!r}")
+        return None
+
+    def _step_value(self, char):
+        kind = self._value_kind
+        if kind == 'scalar':
+            if char in WHITESPACE or char in ',}':
+                pair = self._finish_value()
+                if char == ',':
+                    self._state = 'key_start'
+                elif char == '}':
+                    self._finish_object()
+                return pair
+            self._value.append(char)
+            return None
+
+        self._value.append(char)
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == '\\':
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if kind == 'string':
+                    return self._finish_value()
+            return None
+        if char == '"':
+            self._in_string = True
+        elif char in '{[':
+            self._depth += 1
+        elif char in '}]':
+            self._depth -= 1
+            if self._depth == 0:
+                return self._finish_value()
+        return None
+
+    def _finish_value(self):
+        raw = ''.join(self._value)
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise JSONSyntaxError(f"$.{self._current_key}: invalid value {raw[:40]!r} ({e.msg})")
+        validate(value, self.properties.get(self._current_key, {}), f"$.{self._current_key}")
+        self.result[self._current_key] = value
+        self._state = 'comma_or_end'
+        return self._current_key, value
+
+    def _finish_object(self):
+        missing = [key for key in self.schema.get('required', []) if key not in self.result]
+        if missing:
+            raise SchemaError(f"$: missing required field(s) {missing}")
+        self.done = True
+        return None
+
+
+# ============================================================================
+# STREAMING CALL WITH RETRY
+# ============================================================================
+
+def ollama_stream(model, keep_alive=None, **options):
+    """chat_fn for StructuredCall: streams text pieces from Ollama (keep_alive: e.g. "30m")"""
+    import ollama
+
+    def chat(messages, format=None):
+        kwargs = {'format': format} if format else {}
+        if keep_alive is not None:
+            kwargs['keep_alive'] = keep_alive
+        stream = ollama.chat(model=model, messages=messages, stream=True, options=options, **kwargs)
+        for chunk in stream:
+            yield chunk['message']['content']
+
+    return chat
+
+
+class StructuredCall:
+    """
+    Stream a structured answer; abort and retry on the first invalid token
+
+    chat_fn(messages, format=None) must yield text pieces; the first attempt
+    runs with format=None, retries with format='json' (Ollama then constrains
+    generation to valid JSON).
+    """
+
+    def __init__(self, chat_fn, messages, schema, max_attempts=2):
+        self.chat_fn = chat_fn
+        self.messages = messages
+        self.schema = schema
+        self.max_attempts = max_attempts
+        self.result = None
+        self.attempt = 0
+        self.errors = []           # one message per aborted attempt
+        self.chars_streamed = 0
+
+    def fields(self):
+        """
+        Yield (key, value) for each top-level field as soon as it is complete
+
+        After an aborted attempt the retry starts a fresh object, so fields
+        may be yielded again (check self.attempt if that matters).
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            self.attempt = attempt
+            parser = IncrementalObjectParser(self.schema)
+            stream = self.chat_fn(self.messages, format=None if attempt == 1 else 'json')
+            try:
+                for piece in stream:
+                    self.chars_streamed += len(piece)
+                    for pair in parser.feed(piece):
+                        yield pair
+                    if parser.done:
+                        break
+                self.result = parser.close()
+                return
+            except StructuredOutputError as e:
+                self.errors.append(f"attempt {attempt}: {e}")
+            finally:
+                close = getattr(stream, 'close', None)
+                if close is not None:
+                    close()  # stop generating: this attempt's output is already useless
+        raise StructuredOutputError(f"No valid output after {self.max_attempts} attempts: "
+                                    + '; '.join(self.errors))
+
+    def run(self):
+        """Consume the stream and return the validated object"""
+        for _ in self.fields():
+            pass
+        return self.result
+
+
+# Main execution
+if __name__ == "__main__":
+    import time
+
+    print("=" * 70)
+    print("STREAMING STRUCTURED OUTPUT")
+    print("=" * 70)
+
+    schema = {
+        "type": "object",
+        "properties": {
+            "function_name": {"type": "string"},
+            "purpose": {"type": "string"},
+            "parameters": {"type": "array", "items": {"type": "string"}},
+            "complexity": {"type": "string", "enum": ["simple", "moderate", "complex"]},
+            "line_count": {"type": "integer"},
+        },
+        "required": ["function_name", "purpose", "parameters", "complexity", "line_count"],
+        "additionalProperties": False,
+    }
+
+    good = ('```json\n{"function_name": "process_user_data", "purpose": "Validates and saves '
+            'user data.", "parameters": ["user_id", "data", "validate"], "complexity": "moderate", '
+            '"line_count": 20}\n```')
+    chatty = "Sure! Here is the analysis you asked for:\n" + good
+    wrong_type = '{"function_name": "process_user_data", "purpose": "Saves data.", "line_count": "twenty"...'
+
+    def fake_chat(first_attempt_text):
+        """Fake model: first attempt says first_attempt_text, the JSON-mode retry says good"""
+        def chat(messages, format=None):
+            text = good if format == 'json' else first_attempt_text
+            for i in range(0, len(text), 4):  # ~4 characters per token
+                time.sleep(0.002)
+                yield text[i:i + 4]
+        return chat
+
+    for label, first in (("fenced JSON", good), ("prose before JSON", chatty), ("wrong field type", wrong_type)):
+        print(f"\n🔹 {label}")
+        call = StructuredCall(fake_chat(first), [], schema)
+        start = time.perf_counter()
+        for key, value in call.fields():
+            print(f"   +{(time.perf_counter() - start) * 1000:5.0f} ms  [attempt {call.attempt}] {key} = {value!r}")
+        for error in call.errors:
+            print(f"   ✂️  aborted {error}")
+        print(f"   ✓ {len(call.result)} fields after {call.chars_streamed} streamed characters")
+
+    print("\n✅ Structured output complete!")
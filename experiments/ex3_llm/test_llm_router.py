@@ -0,0 +1,132 @@
+"""
+Test: hedging, cancellation, fallback and EWMA routing with fake backends
+
+No LLM needed - fake_backend sleeps, stalls or fails on demand.
+
+Run with:  python test_llm_router.py   (or: pytest test_llm_router.py)
+"""
+
+import threading
+import time
+
+from llm_router import AllBackendsFailed, LLMRouter, fake_backend
+
+MESSAGES = [{"role": "user", "content": "Where is user authentication handled?"}]
+
+
+def test_stalled_primary_is_hedged_and_cancelled():
+    cancelled = threading.Event()
+    stalled = fake_backend('stalled', stall_rate=1.0, stall_seconds=5.0)
+
+    def watched(messages, cancel):
+        try:
+            return stalled(messages, cancel)
+        finally:
+            if cancel.is_set():
+                cancelled.set()
+    watched.name = 'stalled'
+
+    router = LLMRouter([watched, fake_backend('steady', delay=0.02)], default_deadline=0.05)
+    start = time.perf_counter()
+    answer = router.chat(MESSAGES)
+    elapsed = time.perf_counter() - start
+    router.close()
+
+    assert answer.startswith('[steady]')
+    assert elapsed < 1.0, f"hedge should answer in ~70 ms, took {elapsed:.2f}s"
+    assert cancelled.wait(1.0), "the losing request was not cancelled"
+    report = router.report()
+    assert report['hedges'] == 1
+    assert report['backends'][0]['cancelled'] == 1
+
+
+def test_backends_stuck_before_first_token_never_block_hedges():
+    release = threading.Event()
+
+    def hung(messages, cancel):
+        release.wait(5.0)  # blocked in I/O: never looks at cancel
+        return "[hung] too late"
+    hung.name = 'hung'
+
+    steady = fake_backend('steady', delay=0.01)
+    router = LLMRouter([hung, steady], default_deadline=0.02, explore_rate=0.0)
+    router.ranked = lambda: [hung, steady]  # keep sending the primary to the hung backend
+    try:
+        # More stuck calls than any fixed worker pool would have
+        for _ in range(12):
+            start = time.perf_counter()
+            assert router.chat(MESSAGES).startswith('[steady]')
+            assert time.perf_counter() - start < 0.5, "hedge queued behind stuck calls"
+        assert router.report()['running'] == 12
+    finally:
+        release.set()
+        router.close()
+
+
+def test_quickly_cancelled_hedge_does_not_become_preferred():
+    fast = fake_backend('fast', delay=0.02)
+    slow = fake_backend('slow', delay=0.2)
+    router = LLMRouter([fast, slow], explore_rate=0.0)
+    for _ in range(5):
+        router.stats['fast'].record_success(0.02)
+        router.stats['slow'].record_success(0.2)
+    # The slow backend keeps losing hedges a few ms after launch
+    for _ in range(20):
+        router.stats['slow'].record_cancelled(0.003)
+    assert [b.name for b in router.ranked()] == ['fast', 'slow']
+    assert router.stats['slow'].ewma >= 0.2
+    # ...while a cancellation slower than its estimate still pushes it further back
+    router.stats['fast'].record_cancelled(1.0)
+    assert router.stats['fast'].ewma > 0.02
+    router.close()
+
+
+def test_errors_fall_back_to_next_backend():
+    router = LLMRouter([fake_backend('broken', error_rate=1.0), fake_backend('backup', delay=0.01)],
+                       explore_rate=0.0)
+    assert router.chat(MESSAGES).startswith('[backup]')
+    assert router.report()['fallbacks'] == 1
+    # The failing backend is now routed last
+    assert [b.name for b in router.ranked()] == ['backup', 'broken']
+    router.close()
+
+
+def test_all_backends_failing_raises():
+    router = LLMRouter([fake_backend('a', error_rate=1.0), fake_backend('b', error_rate=1.0)])
+    try:
+        router.chat(MESSAGES)
+    except AllBackendsFailed as e:
+        assert set(e.errors) == {'a', 'b'}
+    else:
+        raise AssertionError("expected AllBackendsFailed")
+    finally:
+        router.close()
+
+
+def test_ewma_prefers_faster_backend_and_deadline_follows_p95():
+    slow = fake_backend('slow', delay=0.03)
+    fast = fake_backend('fast', delay=0.005, jitter=0.002, seed=1)
+    router = LLMRouter([slow, fast], min_samples=10, explore_rate=0.0, default_deadline=1.0)
+    # Untried backends go first, so both get measured once
+    for _ in range(2):
+        router.chat(MESSAGES)
+    assert router.ranked()[0].name == 'fast'
+
+    for _ in range(20):
+        router.chat(MESSAGES)
+    deadline = router.deadline(fast)
+    assert router.min_deadline <= deadline < 1.0, "deadline should come from measured p95"
+    router.close()
+
+
+# Main execution
+if __name__ == "__main__":
+    for test in (test_stalled_primary_is_hedged_and_cancelled,
+                 test_backends_stuck_before_first_token_never_block_hedges,
+                 test_quickly_cancelled_hedge_does_not_become_preferred,
+                 test_errors_fall_back_to_next_backend,
+                 test_all_backends_failing_raises,
+                 test_ewma_prefers_faster_backend_and_deadline_follows_p95):
+        test()
+        print(f"✓ {test.__name__}")
+    print("\n✅ Router tests passed!")
@@ -0,0 +1,203 @@
+"""
+Warm-up, keep-alive and a stable prompt prefix
+
+"First query is slower (model loading)" has three causes:
+
+- Ollama loads the model weights on the first request and unloads them
+  after 5 idle minutes -> warm_up_ollama() at startup and keep_alive on
+  every call
+- the embedding model initialises lazily on its first encode() ->
+  warm_up_embedder()
+- prefix (KV) caches in Ollama/llama.cpp and in hosted APIs only help when
+  a prompt starts with exactly the same bytes as the last one. RAG prompts
+  that mix system text, retrieved code and the question in a different
+  order every time never hit. build_rag_messages() always sends the system
+  prompt + instruction block first and byte-identical, then the code
+  context (in a deterministic order), then the question.
+
+ColdWarmStats records the first call of each kind as "cold" and the rest as
+"warm", so the effect shows up as numbers.
+"""
+
+import time
+
+KEEP_ALIVE = "30m"
+
+SYSTEM_PROMPT = ("You are a helpful code assistant. Answer questions based ONLY on the "
+                 "provided code context.")
+
+INSTRUCTIONS = """Rules:
+- Always cite the file and line numbers you are referring to, as file:line.
+- If the context does not contain the answer, say so instead of guessing.
+- Keep your answer concise and accurate."""
+
+
+def stable_prefix(system_prompt=SYSTEM_PROMPT, instructions=INSTRUCTIONS):
+    """The system message every RAG call starts with - never add per-query data here"""
+    return f"{system_prompt}\n\n{instructions}"
+
+
+def format_chunk(chunk):
+    location = chunk.get('file', chunk.get('id', '?'))
+    if 'start_line' in chunk:
+        end_line = chunk.get('end_line')
+        location += f", Lines: {chunk['start_line']}-{end_line}" if end_line else f":{chunk['start_line']}"
+    return f"File: {location}\n```python\n{chunk['code']}\n```"
+
+
+def build_rag_messages(question, chunks, system_prompt=SYSTEM_PROMPT, instructions=INSTRUCTIONS):
+    """
+    [fixed system message, user message with context then question]
+
+    Chunks are ordered by location, not by score, so the same retrieved set
+    always serialises to the same bytes.
+    """
+    ordered = sorted(chunks, key=lambda c: (c.get('file', ''), c.get('start_line', 0), c.get('id', '')))
+    context = '\n\n'.join(format_chunk(chunk) for chunk in ordered)
+    return [
+        {"role": "system", "content": stable_prefix(system_prompt, instructions)},
+        {"role": "user", "content": f"Code context:\n{context}\n\nQuestion: {question}"},
+    ]
+
+
+def shared_prefix_chars(messages_a, messages_b):
+    """How many leading characters two prompts have in common (what a prefix cache can reuse)"""
+    a = ''.join(m['content'] for m in messages_a)
+    b = ''.join(m['content'] for m in messages_b)
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+# ============================================================================
+# WARM-UP
+# ============================================================================
+
+def warm_up_ollama(model, keep_alive=KEEP_ALIVE, prefix=True):
+    """
+    Load the model and keep it resident; with prefix=True also run the
+    stable system prefix once so its KV cache is ready for the first user
+
+    Returns {'load_seconds', 'prefix_seconds'}.
+    """
+    import ollama
+
+    start = time.perf_counter()
+    ollama.generate(model=model, prompt='', keep_alive=keep_alive)  # empty prompt = load only
+    result = {'load_seconds': time.perf_counter() - start, 'prefix_seconds': 0.0}
+    if prefix:
+        start = time.perf_counter()
+        ollama.chat(model=model, keep_alive=keep_alive, options={'num_predict': 1},
+                    messages=[{"role": "system", "content": stable_prefix()},
+                              {"role": "user", "content": "Ready?"}])
+        result['prefix_seconds'] = time.perf_counter() - start
+    return result
+
+
+def warm_up_embedder(embed_fn, texts=("def warm_up():\n    return None",)):
+    """One throw-away encode so weights, tokenizer and kernels are initialised; returns seconds"""
+    start = time.perf_counter()
+    embed_fn(list(texts))
+    return time.perf_counter() - start
+
+
+# ============================================================================
+# COLD VS WARM METRICS
+# ============================================================================
+
+class ColdWarmStats:
+    """
+    The first call of each name is cold, the rest are warm
+
+    Pass warm=True for calls made after a warm-up: the first of those is not
+    a cold start and must not be reported as one.
+    """
+
+    def __init__(self):
+        self.cold = {}
+        self.warm = {}
+
+    def record(self, name, seconds, warm=False):
+        if not warm and name not in self.cold and name not in self.warm:
+            self.cold[name] = seconds
+        else:
+            self.warm.setdefault(name, []).append(seconds)
+
+    def timed(self, name, fn, *args, warm=False, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.record(name, time.perf_counter() - start, warm)
+
+    def summary(self):
+        result = {}
+        for name in list(self.cold) + [name for name in self.warm if name not in self.cold]:
+            cold = self.cold.get(name)
+            warm = sorted(self.warm.get(name, []))
+            result[name] = {
+                'cold_ms': cold * 1000 if cold is not None else None,
+                'warm_p50_ms': warm[len(warm) // 2] * 1000 if warm else None,
+                'warm_calls': len(warm),
+            }
+        return result
+
+    def report(self):
+        print(f"  {'call':<20} {'cold ms':>10} {'warm p50 ms':>12} {'warm calls':>11}")
+        for name, s in self.summary().items():
+            cold = f"{s['cold_ms']:>10.1f}" if s['cold_ms'] is not None else f"{'-':>10}"
+            warm = f"{s['warm_p50_ms']:>12.1f}" if s['warm_p50_ms'] is not None else f"{'-':>12}"
+            print(f"  {name:<20} {cold} {warm} {s['warm_calls']:>11}")
+
+
+# Main execution
+if __name__ == "__main__":
+    import sys
+
+    model = sys.argv[1] if len(sys.argv) > 1 else "llama3.2"
+
+    print("=" * 70)
+    print("WARM-UP, KEEP-ALIVE AND STABLE PROMPT PREFIXES")
+    print("=" * 70)
+
+    auth = {'file': 'auth.py', 'start_line': 45, 'end_line': 52,
+            'code': "def authenticate_user(token: str) -> bool:\n    return jwt.decode(token, SECRET_KEY)"}
+    middleware = {'file': 'middleware.py', 'start_line': 12, 'end_line': 18,
+                  'code': "def verify_token(token: str) -> dict:\n    return jwt.decode(token)"}
+
+    # Same chunks retrieved in a different score order, different question
+    first = build_rag_messages("Where is authentication handled?", [auth, middleware])
+    second = build_rag_messages("Which function decodes JWTs?", [middleware, auth])
+    total = sum(len(m['content']) for m in second)
+    print(f"\n🔁 Two queries share {shared_prefix_chars(first, second)}/{total} leading characters "
+          f"(system + instructions + context)")
+
+    stats = ColdWarmStats()
+    try:
+        import ollama
+
+        # Measure the cold start first: unload, then time the first real call
+        ollama.generate(model=model, prompt='', keep_alive=0)
+        questions = ["Where is authentication handled?", "Which function decodes JWTs?",
+                     "What happens with an invalid token?"]
+        for question in questions:
+            stats.timed('chat (no warm-up)', ollama.chat, model=model, keep_alive=KEEP_ALIVE,
+                        messages=build_rag_messages(question, [auth, middleware]),
+                        options={'num_predict': 32})
+
+        ollama.generate(model=model, prompt='', keep_alive=0)
+        warm = warm_up_ollama(model)
+        print(f"\n🔥 Warm-up: load {warm['load_seconds']:.2f}s, prefix {warm['prefix_seconds']:.2f}s")
+        for question in questions:
+            stats.timed('chat (warmed up)', ollama.chat, model=model, keep_alive=KEEP_ALIVE,
+                        messages=build_rag_messages(question, [auth, middleware]),
+                        options={'num_predict': 32}, warm=True)
+        print()
+        stats.report()
+    except Exception as e:
+        print(f"\n⚠️  Ollama not available ({e}); skipping the cold/warm LLM measurement")
+
+    print("\n✅ Warm start complete!")
@@ -0,0 +1,311 @@
+"""
+Exercise 12: Code Graph for Graph-Expanded Retrieval
+Goal: Follow calls, imports and class membership to pull in related chunks
+
+Vector search finds verify_token, but the answer often lives in its callers
+(the middleware that uses it) or callees (jwt.decode wrappers). This exercise:
+
+1. extracts call sites, imports and class membership with tree-sitter
+2. stores them as a symbol graph in CSR form (indptr + indices arrays) keyed
+   by the ids live_index.assign_chunk_ids gives the indexed chunks: one node
+   per function window, same-named functions in a file kept apart
+3. expands vector hits by one or two hops under a budget
+
+CSR arrays are saved as .npy files and loaded with mmap_mode='r', so a graph
+with millions of edges costs almost no RSS and each neighbour lookup reads
+only that node's slice: O(degree) after an O(log n) id -> row lookup.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+from live_index import assign_chunk_ids
+from pipeline_index import load_parse_code, thread_parser
+
+# Classes are not indexed chunks, so class membership links the methods of a
+# class to each other ('same_class') instead of going through a class node
+EDGE_KINDS = ('calls', 'called_by', 'imports', 'imported_by', 'same_class')
+
+
+# ============================================================================
+# EXTRACTION (tree-sitter)
+# ============================================================================
+
+def _text(source_code, node):
+    return source_code[node.start_byte:node.end_byte].decode('utf8')
+
+
+def _callee_name(source_code, call_node):
+    """Name being called: foo(...) -> foo, self.db.query(...) -> query"""
+    function = call_node.child_by_field_name('function')
+    if function is None:
+        return None
+    if function.type == 'attribute':
+        attribute = function.child_by_field_name('attribute')
+        return _text(source_code, attribute) if attribute else None
+    if function.type == 'identifier':
+        return _text(source_code, function)
+    return None
+
+
+def _imported_names(source_code, node):
+    """Names bound by an import statement: import a.b -> a.b, from m import x as y -> x"""
+    names = []
+    for child in node.children_by_field_name('name'):
+        if child.type == 'aliased_import':
+            child = child.child_by_field_name('name')
+        names.append(_text(source_code, child))
+    return names
+
+
+def extract_symbols(tree, source_code):
+    """
+    Functions/classes with the names they call and the class they belong to,
+    plus the module-level imports
+
+    Returns (symbols, imports) where each symbol is
+    {'name', 'kind', 'class', 'calls', 'start_line', 'end_line'}
+    """
+    symbols = []
+    imports = []
+
+    def collect_calls(node, calls):
+        if node.type == 'call':
+            name = _callee_name(source_code, node)
+            if name:
+                calls.add(name)
+        for child in node.children:
+            # Nested definitions are symbols of their own
+            if child.type not in ('function_definition', 'class_definition'):
+                collect_calls(child, calls)
+
+    def traverse(node, current_class=None):
+        if node.type in ('import_statement', 'import_from_statement'):
+            imports.extend(name.split('.')[-1] for name in _imported_names(source_code, node))
+        elif node.type == 'class_definition':
+            name = _text(source_code, node.child_by_field_name('name'))
+            symbols.append({'name': name, 'kind': 'class', 'class': None, 'calls': [],
+                            'start_line': node.start_point[0] + 1, 'end_line': node.end_point[0] + 1})
+            for child in node.children:
+                traverse(child, current_class=name)
+            return
+        elif node.type == 'function_definition':
+            name = _text(source_code, node.child_by_field_name('name'))
+            calls = set()
+            collect_calls(node.child_by_field_name('body'), calls)
+            symbols.append({'name': name, 'kind': 'function', 'class': current_class,
+                            'calls': sorted(calls), 'start_line': node.start_point[0] + 1,
+                            'end_line': node.end_point[0] + 1})
+            # Functions nested in a function don't belong to the class
+            for child in node.children:
+                traverse(child, current_class=None)
+            return
+        for child in node.children:
+            traverse(child, current_class)
+
+    traverse(tree.root_node)
+    return symbols, imports
+
+
+def parse_symbols(filepath):
+    """Read + parse one file with the Exercise 3 parser"""
+    parse_code = load_parse_code()
+    source_code = parse_code.read_file(filepath)
+    return extract_symbols(thread_parser().parse(source_code), source_code)
+
+
+# ============================================================================
+# CSR GRAPH
+# ============================================================================
+
+def _to_csr(node_ids, edges):
+    """edges: iterable of (src_id, dst_id) -> (indptr, indices) over rows of node_ids"""
+    if not edges:
+        return np.zeros(len(node_ids) + 1, dtype='int64'), np.zeros(0, dtype='int64')
+    pairs = np.unique(np.array(edges, dtype='int64'), axis=0)
+    src_rows = np.searchsorted(node_ids, pairs[:, 0])
+    order = np.lexsort((pairs[:, 1], src_rows))
+    counts = np.bincount(src_rows, minlength=len(node_ids))
+    indptr = np.zeros(len(node_ids) + 1, dtype='int64')
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, pairs[order, 1]
+
+
+class CodeGraph:
+    """Symbol graph as CSR adjacency arrays (one pair per edge kind)"""
+
+    def __init__(self, node_ids, adjacency, names=None):
+        self.node_ids = node_ids      # sorted int64 chunk ids
+        self.adjacency = adjacency    # kind -> (indptr, indices)
+        self.names = names or {}      # chunk id -> "file::name" (for display only)
+
+    @classmethod
+    def build(cls, files_symbols, max_targets_per_name=8, max_lines=60):
+        """
+        files_symbols: {file: (symbols, imports)} as returned by extract_symbols
+
+        Node ids are the ids live_index.assign_chunk_ids gives the chunks
+        chunk_functions(file, functions, max_lines) makes of the same file,
+        so max_lines must match the chunking of the index. Every window of a
+        function is a node with its function's edges; edges point at the
+        first window of the target. Call targets are resolved by name; a name
+        defined in many places (e.g. __init__) links to at most
+        max_targets_per_name of them.
+        """
+        windows = {}      # (file, symbol index) -> chunk ids of its windows
+        by_name = {}
+        class_heads = {}  # (file, class) -> first-window ids of its methods
+        names = {}
+        for file, (symbols, _) in files_symbols.items():
+            # Same order and window count as extract_functions + chunk_functions
+            functions = [(i, s) for i, s in enumerate(symbols) if s['kind'] == 'function']
+            placeholders = []
+            for i, symbol in functions:
+                n_windows = -(-(symbol['end_line'] - symbol['start_line'] + 1) // max_lines)
+                placeholders.extend({'file': file, 'function': symbol['name'], 'symbol': i}
+                                    for _ in range(n_windows))
+            for chunk in assign_chunk_ids(placeholders):
+                windows.setdefault((file, chunk['symbol']), []).append(chunk['id'])
+            for i, symbol in functions:
+                ids = windows[(file, i)]
+                for part, cid in enumerate(ids):
+                    names[cid] = f"{file}::{symbol['name']}" + (f" [window {part + 1}]" if part else "")
+                by_name.setdefault(symbol['name'], []).append(ids[0])
+                if symbol['class'] is not None:
+                    class_heads.setdefault((file, symbol['class']), []).append(ids[0])
+
+        edges = {kind: [] for kind in EDGE_KINDS}
+        for file, (symbols, imports) in files_symbols.items():
+            imported_ids = [target for name in imports
+                            for target in by_name.get(name, [])[:max_targets_per_name]]
+            for i, symbol in enumerate(symbols):
+                if symbol['kind'] != 'function':
+                    continue
+                ids = windows[(file, i)]
+                targets = {
+                    'calls': [target for callee in symbol['calls']
+                              for target in by_name.get(callee, [])[:max_targets_per_name]],
+                    'imports': imported_ids,
+                    'same_class': class_heads.get((file, symbol['class']), [])[:max_targets_per_name + 1],
+                }
+                for cid in ids:
+                    for target in targets['calls']:
+                        if target != ids[0]:
+                            edges['calls'].append((cid, target))
+                            edges['called_by'].append((target, cid))
+                    for target in targets['imports']:
+                        edges['imports'].append((cid, target))
+                        edges['imported_by'].append((target, cid))
+                    for target in targets['same_class']:
+                        if target != ids[0]:
+                            edges['same_class'].append((cid, target))
+
+        node_ids = np.array(sorted(names), dtype='int64')
+        adjacency = {kind: _to_csr(node_ids, kind_edges) for kind, kind_edges in edges.items()}
+        return cls(node_ids, adjacency, names)
+
+    def num_edges(self):
+        return sum(len(indices) for _, indices in self.adjacency.values())
+
+    def neighbors(self, node_id, kind='calls'):
+        """Chunk ids adjacent to node_id: O(log n) row lookup + O(degree) slice"""
+        row = np.searchsorted(self.node_ids, node_id)
+        if row >= len(self.node_ids) or self.node_ids[row] != node_id:
+            return np.zeros(0, dtype='int64')
+        indptr, indices = self.adjacency[kind]
+        return indices[indptr[row]:indptr[row + 1]]
+
+    def save(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        np.save(os.path.join(out_dir, 'node_ids.npy'), self.node_ids)
+        for kind, (indptr, indices) in self.adjacency.items():
+            np.save(os.path.join(out_dir, f'{kind}_indptr.npy'), indptr)
+            np.save(os.path.join(out_dir, f'{kind}_indices.npy'), indices)
+
+    @classmethod
+    def load(cls, out_dir, mmap=True):
+        """Load the arrays memory-mapped: pages are read lazily and shared between processes"""
+        mode = 'r' if mmap else None
+        node_ids = np.load(os.path.join(out_dir, 'node_ids.npy'), mmap_mode=mode)
+        adjacency = {
+            kind: (np.load(os.path.join(out_dir, f'{kind}_indptr.npy'), mmap_mode=mode),
+                   np.load(os.path.join(out_dir, f'{kind}_indices.npy'), mmap_mode=mode))
+            for kind in EDGE_KINDS
+        }
+        return cls(node_ids, adjacency)
+
+
+# ============================================================================
+# GRAPH-EXPANDED RETRIEVAL
+# ============================================================================
+
+def expand_hits(graph, hit_ids, hops=1, budget=10,
+                kinds=('calls', 'called_by', 'same_class'), decay=0.5):
+    """
+    Add graph neighbours of vector hits, breadth-first, until budget chunks
+
+    Returns [(chunk_id, score, hop)]: vector hits keep score 1/rank, each hop
+    multiplies by decay, so direct hits always outrank expansions.
+    """
+    results = {}
+    frontier = []
+    for rank, hit in enumerate(hit_ids, 1):
+        if hit not in results:
+            results[hit] = (1.0 / rank, 0)
+            frontier.append(hit)
+
+    for hop in range(1, hops + 1):
+        next_frontier = []
+        for node in frontier:
+            base_score = results[node][0]
+            for kind in kinds:
+                for neighbor in graph.neighbors(node, kind).tolist():
+                    if len(results) >= budget:
+                        break
+                    if neighbor not in results:
+                        results[neighbor] = (base_score * decay, hop)
+                        next_frontier.append(neighbor)
+        frontier = next_frontier
+        if len(results) >= budget:
+            break
+
+    ranked = sorted(results.items(), key=lambda item: -item[1][0])
+    return [(cid, score, hop) for cid, (score, hop) in ranked[:budget]]
+
+
+# Main execution
+if __name__ == "__main__":
+    import tempfile
+
+    from pipeline_index import EXPERIMENTS_DIR, discover_files
+
+    root = sys.argv[1] if len(sys.argv) > 1 else os.path.join(EXPERIMENTS_DIR, 'ex2_parsing')
+
+    print("=" * 70)
+    print("CODE GRAPH: CALLS, IMPORTS, CLASS MEMBERSHIP")
+    print("=" * 70)
+
+    files_symbols = {}
+    for path in discover_files(root):
+        try:
+            files_symbols[os.path.relpath(path, root)] = parse_symbols(path)
+        except Exception as e:
+            print(f"⚠️  Skipping {path}: {e}")
+
+    graph = CodeGraph.build(files_symbols)
+    print(f"\n✓ {len(graph.node_ids)} chunk nodes, {graph.num_edges()} edges")
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        graph.save(out_dir)
+        mapped = CodeGraph.load(out_dir)
+        mapped.names = graph.names
+
+        start_name = 'authenticate_user'
+        start_ids = [cid for cid, name in graph.names.items() if name.endswith(f"::{start_name}")]
+        print(f"\n🔍 Vector hit: {start_name}")
+        for cid, score, hop in expand_hits(mapped, start_ids, hops=2, budget=6):
+            print(f"   hop {hop}  score {score:.2f}  {mapped.names.get(cid, cid)}")
+
+    print("\n✅ Graph expansion complete!")
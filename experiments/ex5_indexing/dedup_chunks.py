@@ -0,0 +1,187 @@
+"""
+Exercise 14: Near-Duplicate Chunk Detection
+Goal: Embed and store each copy-pasted / vendored function only once
+
+Real repositories contain vendored libraries, generated code and
+copy-pasted helpers. Every copy costs an embedding, index memory and a
+top-k slot. Between extract_functions and embedding we:
+
+1. shingle each chunk into token 3-grams
+2. compute a MinHash signature (num_perm hash functions)
+3. bucket signatures with LSH (bands x rows) so only likely matches are compared
+4. collapse chunks of the same function name whose estimated Jaccard
+   similarity >= threshold onto one canonical chunk that keeps the list of
+   all its locations
+
+Generated or templated code (handler_a, handler_b, ...) is highly similar
+but not duplicated: differently named functions are never merged.
+"""
+
+import re
+import time
+import zlib
+
+import numpy as np
+
+TOKEN_RE = re.compile(r'\w+|[^\s\w]')
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def shingles(code, k=3):
+    """Token k-grams; whitespace and formatting differences don't matter"""
+    tokens = TOKEN_RE.findall(code)
+    if len(tokens) <= k:
+        return {' '.join(tokens)}
+    return {' '.join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)}
+
+
+def chunk_location(chunk):
+    return {key: chunk[key] for key in ('file', 'function', 'start_line', 'end_line') if key in chunk}
+
+
+class NearDuplicateIndex:
+    """
+    Incremental MinHash + LSH: add() a chunk, get back its canonical chunk
+    if it is a near-duplicate of one seen before
+    """
+
+    def __init__(self, num_perm=64, bands=16, threshold=0.9, seed=1):
+        assert num_perm % bands == 0, "num_perm must be divisible by bands"
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        rng = np.random.default_rng(seed)
+        # a, b < 2**31 and 32-bit shingle hashes keep a * x + b inside uint64
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype='uint64')
+        self._b = rng.integers(0, 1 << 31, size=num_perm, dtype='uint64')
+        self._buckets = {}       # (band, band bytes) -> [canonical index]
+        self._signatures = []    # canonical id -> signature
+        self._names = []         # canonical id -> function name
+        self.locations = []      # canonical id -> every location of that chunk
+        self.seen = 0
+        self.duplicates = 0
+        self.seconds = 0.0
+
+    def signature(self, code):
+        hashes = np.array([zlib.crc32(s.encode('utf8')) for s in shingles(code)], dtype='uint64')
+        # (a * x + b) mod p for every permutation at once
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % MERSENNE_PRIME
+        return (permuted & MAX_HASH).min(axis=1).astype('uint32')
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, chunk):
+        """
+        Register a chunk; returns (canonical_id, is_duplicate)
+
+        Only signatures and locations are kept, not the code, so this can sit
+        in a streaming pipeline without holding every chunk in memory.
+        """
+        start = time.perf_counter()
+        self.seen += 1
+        signature = self.signature(chunk['code'])
+        keys = list(self._band_keys(signature))
+
+        candidates = set()
+        for key in keys:
+            candidates.update(self._buckets.get(key, ()))
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            if self._names[candidate] != chunk.get('function'):
+                continue  # a template instance, not a copy
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+
+        if best is not None:
+            self.locations[best].append(chunk_location(chunk))
+            self.duplicates += 1
+            self.seconds += time.perf_counter() - start
+            return best, True
+
+        canonical_id = len(self._signatures)
+        self._signatures.append(signature)
+        self._names.append(chunk.get('function'))
+        self.locations.append([chunk_location(chunk)])
+        for key in keys:
+            self._buckets.setdefault(key, []).append(canonical_id)
+        self.seconds += time.perf_counter() - start
+        return canonical_id, False
+
+    def stats(self, embed_seconds_per_chunk=None):
+        """Dedup ratio, dedup cost and (if the embed cost is known) the embedding time it saved"""
+        result = {
+            'chunks_seen': self.seen,
+            'unique_chunks': len(self._signatures),
+            'duplicates': self.duplicates,
+            'dedup_ratio': self.duplicates / self.seen if self.seen else 0.0,
+            'dedup_seconds': self.seconds,
+        }
+        if embed_seconds_per_chunk is not None:
+            result['embed_seconds_saved'] = self.duplicates * embed_seconds_per_chunk  # gross: see dedup_seconds
+        return result
+
+
+def dedup_chunks(chunks, **kwargs):
+    """Batch helper: returns (canonical chunks with 'locations', NearDuplicateIndex)"""
+    index = NearDuplicateIndex(**kwargs)
+    canonicals = []
+    for chunk in chunks:
+        canonical_id, is_duplicate = index.add(chunk)
+        if not is_duplicate:
+            canonicals.append(dict(chunk, locations=index.locations[canonical_id]))
+    return canonicals, index
+
+
+# Main execution
+if __name__ == "__main__":
+    import os
+    import sys
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    'ex6_benchmarks'))
+    from benchmark import hashing_embedder
+
+    print("=" * 70)
+    print("NEAR-DUPLICATE DETECTION (MinHash + LSH)")
+    print("=" * 70)
+
+    original = '''def calculate_total(items: List[dict]) -> float:
+    """Calculate total price from list of items"""
+    total = 0.0
+    for item in items:
+        total += item['price'] * item.get('quantity', 1)
+    return total'''
+    reformatted = original.replace('\n    total', '\n\n    total').replace('    ', '  ')  # layout only
+    templated = original.replace('calculate_total', 'calculate_subtotal')
+    chunks = [
+        {'file': 'billing.py', 'function': 'calculate_total', 'start_line': 57, 'code': original},
+        {'file': 'vendor/shop/billing.py', 'function': 'calculate_total', 'start_line': 12, 'code': original},
+        {'file': 'legacy/cart.py', 'function': 'calculate_total', 'start_line': 88, 'code': reformatted},
+        {'file': 'cart.py', 'function': 'calculate_subtotal', 'start_line': 30, 'code': templated},
+        {'file': 'auth.py', 'function': 'authenticate_user', 'start_line': 12,
+         'code': "def authenticate_user(token: str) -> bool:\n    return decode_token(token) is not None"},
+    ]
+
+    embed = hashing_embedder()
+    start = time.perf_counter()
+    embed([c['code'] for c in chunks])
+    per_chunk = (time.perf_counter() - start) / len(chunks)
+
+    canonicals, index = dedup_chunks(chunks)
+    for chunk in canonicals:
+        print(f"\n🔹 {chunk['function']} ({len(chunk['locations'])} location(s))")
+        for location in chunk['locations']:
+            print(f"   {location['file']}:{location['start_line']}")
+
+    stats = index.stats(per_chunk)
+    print(f"\n  Dedup ratio: {stats['dedup_ratio']:.0%} "
+          f"({stats['duplicates']} of {stats['chunks_seen']} chunks collapsed)")
+    print(f"  Embed time saved: {stats['embed_seconds_saved'] * 1000:.2f} ms, "
+          f"dedup cost: {stats['dedup_seconds'] * 1000:.2f} ms")
+    print("  (the hashing embedder is nearly free; with a real model each skipped chunk saves ms)")
+    print("\n✅ Dedup complete!")
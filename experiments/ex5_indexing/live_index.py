@@ -0,0 +1,275 @@
+"""
+Exercise 10: Live Index Updates
+Goal: Upsert and delete chunks without rebuilding the whole index
+
+ex1_vectors/faiss_vector_store.py uses positional ids (row i of IndexFlatL2 is
+code_snippets[i]), so nothing can be removed without a full rebuild. Here:
+
+- every chunk gets a stable 64-bit id derived from file + function name,
+  stored in the index itself via faiss.IndexIDMap2
+- delete() only records a tombstone; tombstoned ids are filtered out of
+  search results, so a deleted function disappears immediately
+- a background compactor physically removes tombstoned vectors once they
+  make up more than compact_ratio of the index
+- apply_commit() re-indexes only the files a git commit touched, reading
+  them from the commit itself (no checkout needed)
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import faiss
+import numpy as np
+
+from pipeline_index import chunk_functions, parse_source
+
+
+def chunk_id(file, function, part=0):
+    """Stable 63-bit id for a chunk (positive, so it fits FAISS's int64 ids)"""
+    key = f"{file}::{function}::{part}".encode('utf8')
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little') & (2 ** 63 - 1)
+
+
+def assign_chunk_ids(chunks):
+    """Add an 'id' to each chunk; windows of the same function get part 0, 1, ..."""
+    seen = {}
+    for chunk in chunks:
+        key = (chunk['file'], chunk['function'])
+        part = seen.get(key, 0)
+        seen[key] = part + 1
+        chunk['id'] = chunk_id(chunk['file'], chunk['function'], part)
+    return chunks
+
+
+class LiveIndex:
+    """IndexIDMap2 + tombstones + background compaction"""
+
+    def __init__(self, dimension, compact_ratio=0.2, compact_interval=5.0):
+        self.dimension = dimension
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+        self.metadata = {}        # chunk id -> chunk (live chunks only)
+        self.file_chunks = {}     # file -> set of chunk ids
+        self.tombstones = set()   # ids still in self.index but deleted
+        self.compact_ratio = compact_ratio
+        self.compactions = 0
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._compactor = None
+        self.compact_interval = compact_interval
+
+    # ------------------------------------------------------------------ writes
+
+    def upsert(self, chunks, vectors):
+        """Add or replace chunks (each chunk needs an 'id', see assign_chunk_ids)"""
+        ids = np.array([c['id'] for c in chunks], dtype='int64')
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        with self._lock:
+            # Replaced chunks (and re-added tombstoned ones) still have a vector
+            # under the same id; drop those rows in one pass before adding.
+            stale = [i for i in ids.tolist() if i in self.metadata or i in self.tombstones]
+            if stale:
+                self.index.remove_ids(faiss.IDSelectorBatch(np.array(stale, dtype='int64')))
+                self.tombstones.difference_update(stale)
+            self.index.add_with_ids(vectors, ids)
+            for chunk in chunks:
+                self.metadata[chunk['id']] = chunk
+                self.file_chunks.setdefault(chunk['file'], set()).add(chunk['id'])
+
+    def delete(self, ids):
+        """Tombstone chunks: they vanish from results now, and from memory at compaction"""
+        with self._lock:
+            for i in ids:
+                chunk = self.metadata.pop(i, None)
+                if chunk is None:
+                    continue
+                self.tombstones.add(i)
+                file_ids = self.file_chunks.get(chunk['file'])
+                if file_ids is not None:
+                    file_ids.discard(i)
+                    if not file_ids:
+                        del self.file_chunks[chunk['file']]
+
+    def replace_file(self, file, chunks, vectors):
+        """Make the index match the current chunks of one file"""
+        with self._lock:
+            old_ids = self.file_chunks.get(file, set())
+            removed = old_ids - {c['id'] for c in chunks}
+            self.delete(removed)
+            if chunks:
+                self.upsert(chunks, vectors)
+        return len(removed)
+
+    def delete_file(self, file):
+        with self._lock:
+            ids = list(self.file_chunks.get(file, ()))
+            self.delete(ids)
+        return len(ids)
+
+    # ------------------------------------------------------------------- reads
+
+    def search(self, query_vectors, k=5):
+        """Top-k live chunks per query as lists of (distance, chunk)"""
+        query_vectors = np.ascontiguousarray(query_vectors, dtype='float32').reshape(-1, self.dimension)
+        with self._lock:
+            live = self.index.ntotal - len(self.tombstones)
+            if live <= 0:
+                return [[] for _ in range(len(query_vectors))]
+            # Over-fetch by the tombstone count so filtering never leaves us short
+            fetch = min(self.index.ntotal, k + len(self.tombstones))
+            distances, ids = self.index.search(query_vectors, fetch)
+            results = []
+            for row_distances, row_ids in zip(distances, ids):
+                hits = [(float(d), self.metadata[i]) for d, i in zip(row_distances, row_ids)
+                        if i >= 0 and i not in self.tombstones]
+                results.append(hits[:k])
+            return results
+
+    def tombstone_ratio(self):
+        with self._lock:
+            return len(self.tombstones) / self.index.ntotal if self.index.ntotal else 0.0
+
+    # -------------------------------------------------------------- compaction
+
+    def compact(self):
+        """Physically remove tombstoned vectors; returns how many were removed"""
+        with self._lock:
+            if not self.tombstones:
+                return 0
+            removed = self.index.remove_ids(
+                faiss.IDSelectorBatch(np.array(sorted(self.tombstones), dtype='int64')))
+            self.tombstones.clear()
+            self.compactions += 1
+            return removed
+
+    def start_compactor(self):
+        """Compact in the background whenever the tombstone ratio passes the threshold"""
+        def run():
+            while not self._stop.wait(self.compact_interval):
+                if self.tombstone_ratio() > self.compact_ratio:
+                    self.compact()
+
+        self._stop.clear()
+        self._compactor = threading.Thread(target=run, name='compactor', daemon=True)
+        self._compactor.start()
+
+    def stop_compactor(self):
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+
+    # ------------------------------------------------------------- persistence
+
+    def save(self, out_dir):
+        """Write index.faiss + metadata.json (compacting first)"""
+        os.makedirs(out_dir, exist_ok=True)
+        with self._lock:
+            self.compact()
+            faiss.write_index(self.index, os.path.join(out_dir, 'index.faiss'))
+            with open(os.path.join(out_dir, 'metadata.json'), 'w', encoding='utf8') as f:
+                json.dump(list(self.metadata.values()), f)
+
+    @classmethod
+    def load(cls, out_dir, **kwargs):
+        index = faiss.read_index(os.path.join(out_dir, 'index.faiss'))
+        live = cls(index.d, **kwargs)
+        live.index = index
+        with open(os.path.join(out_dir, 'metadata.json'), encoding='utf8') as f:
+            for chunk in json.load(f):
+                live.metadata[chunk['id']] = chunk
+                live.file_chunks.setdefault(chunk['file'], set()).add(chunk['id'])
+        return live
+
+
+# ============================================================================
+# GIT INTEGRATION
+# ============================================================================
+
+def changed_files(repo, old_rev, new_rev='HEAD'):
+    """Python files added/modified/deleted between two revisions: [(status, path)]"""
+    output = subprocess.run(
+        ['git', '-C', repo, 'diff', '--name-status', '--no-renames', old_rev, new_rev],
+        check=True, capture_output=True, text=True).stdout
+    changes = []
+    for line in output.splitlines():
+        status, path = line.split('\t', 1)
+        if path.endswith('.py'):
+            changes.append((status[0], path))
+    return changes
+
+
+def apply_commit(live, repo, old_rev, new_rev, embed_fn, parse_fn=parse_source):
+    """
+    Bring the index from old_rev to new_rev by re-indexing only the touched files
+
+    File contents come from new_rev's blobs (parse_fn takes bytes), not from
+    the working tree, which may be checked out at another revision.
+    """
+    from revision_index import read_blobs
+
+    start = time.perf_counter()
+    stats = {'files': 0, 'upserted': 0, 'deleted': 0}
+    changes = changed_files(repo, old_rev, new_rev)
+    present = [path for status, path in changes if status != 'D']
+    blobs = dict(read_blobs(repo, [f"{new_rev}:{path}" for path in present]))
+    for status, path in changes:
+        stats['files'] += 1
+        if status == 'D':
+            stats['deleted'] += live.delete_file(path)
+            continue
+        chunks = assign_chunk_ids(chunk_functions(path, parse_fn(blobs[f"{new_rev}:{path}"])))
+        vectors = embed_fn([c['code'] for c in chunks]) if chunks else None
+        stats['deleted'] += live.replace_file(path, chunks, vectors)
+        stats['upserted'] += len(chunks)
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+# Main execution
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    'ex6_benchmarks'))
+    from benchmark import hashing_embedder
+
+    print("=" * 70)
+    print("LIVE INDEX: UPSERTS, TOMBSTONES, COMPACTION")
+    print("=" * 70)
+
+    embed = hashing_embedder()
+    live = LiveIndex(embed.dimension, compact_ratio=0.2)
+
+    files = {
+        'auth.py': [('authenticate_user', "def authenticate_user(token):\n    return jwt.decode(token, SECRET_KEY)"),
+                    ('login', "def login(username, password):\n    return verify_credentials(username, password)")],
+        'middleware.py': [('verify_token', "def verify_token(token):\n    return jwt.decode(token)")],
+        'billing.py': [('process_payment', "def process_payment(amount, card):\n    return gateway.charge(card, amount)")],
+    }
+    for file, functions in files.items():
+        chunks = assign_chunk_ids([{'file': file, 'function': name, 'start_line': 1, 'code': code}
+                                   for name, code in functions])
+        live.upsert(chunks, embed([c['code'] for c in chunks]))
+    print(f"\n✓ Indexed {live.index.ntotal} chunks")
+
+    def show(query):
+        hits = live.search(embed([query]), k=3)[0]
+        print(f"\n🔍 '{query}'")
+        for distance, chunk in hits:
+            print(f"   {chunk['file']}::{chunk['function']} (distance {distance:.3f})")
+
+    show("jwt decode token")
+
+    print("\n✂️  Commit renames verify_token -> check_token in middleware.py")
+    renamed = assign_chunk_ids([{'file': 'middleware.py', 'function': 'check_token', 'start_line': 1,
+                                 'code': "def check_token(token):\n    return jwt.decode(token)"}])
+    live.replace_file('middleware.py', renamed, embed([c['code'] for c in renamed]))
+    print(f"   tombstones: {len(live.tombstones)} ({live.tombstone_ratio():.0%} of index)")
+    show("jwt decode token")
+
+    print("\n🧹 Compacting...")
+    print(f"   removed {live.compact()} vectors, index now holds {live.index.ntotal}")
+    print("\n✅ Live updates complete!")
@@ -0,0 +1,201 @@
+"""
+Exercise 15: On-Disk Parse Cache
+Goal: Skip tree-sitter entirely for files that haven't changed
+
+Every index run re-parses every file, even when nothing changed. This cache
+stores the extracted function records per file *content hash* in a small
+binary format:
+
+    b'PCC1' | uint32 record count
+    per record: uint32 start_line, end_line, start_byte, end_byte
+                + length-prefixed UTF-8 name, parameters, docstring
+
+The code itself is not stored: it is re-sliced from the file bytes we
+already read to compute the hash. Renames and branch switches hit the cache
+too, since the key is the content, not the path. The key also covers a
+fingerprint of the extractor (parse_code.py), so changing what
+extract_functions returns turns every old record into a miss.
+"""
+
+import hashlib
+import os
+import struct
+import threading
+import time
+
+from pipeline_index import load_parse_code, parse_source
+
+MAGIC = b'PCC1'
+_HEADER = struct.Struct('<4sI')
+_RANGES = struct.Struct('<IIII')
+_LENGTH = struct.Struct('<I')
+_NONE = 0xFFFFFFFF  # length marker for a missing docstring
+
+
+def extractor_fingerprint():
+    """Hash of parse_code.py + this record format: changes whenever the cached fields could"""
+    with open(load_parse_code().__file__, 'rb') as f:
+        return hashlib.sha256(MAGIC + f.read()).hexdigest()[:16]
+
+
+def _pack_str(value):
+    if value is None:
+        return _LENGTH.pack(_NONE)
+    data = value.encode('utf8')
+    return _LENGTH.pack(len(data)) + data
+
+
+def _unpack_str(buffer, offset):
+    (length,) = _LENGTH.unpack_from(buffer, offset)
+    offset += _LENGTH.size
+    if length == _NONE:
+        return None, offset
+    return buffer[offset:offset + length].decode('utf8'), offset + length
+
+
+def encode_records(functions):
+    parts = [_HEADER.pack(MAGIC, len(functions))]
+    for func in functions:
+        parts.append(_RANGES.pack(func['start_line'], func['end_line'],
+                                  func['start_byte'], func['end_byte']))
+        parts.append(_pack_str(func['name']))
+        parts.append(_pack_str(func.get('parameters')))
+        parts.append(_pack_str(func.get('docstring')))
+    return b''.join(parts)
+
+
+def decode_records(buffer, source_code, include_code=True):
+    """Inverse of encode_records; 'code' is sliced back out of source_code"""
+    magic, count = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a parse cache record")
+    offset = _HEADER.size
+    functions = []
+    for _ in range(count):
+        start_line, end_line, start_byte, end_byte = _RANGES.unpack_from(buffer, offset)
+        offset += _RANGES.size
+        name, offset = _unpack_str(buffer, offset)
+        parameters, offset = _unpack_str(buffer, offset)
+        docstring, offset = _unpack_str(buffer, offset)
+        function = {
+            'name': name,
+            'parameters': parameters,
+            'docstring': docstring,
+            'start_line': start_line,
+            'end_line': end_line,
+            'start_byte': start_byte,
+            'end_byte': end_byte,
+        }
+        if include_code:
+            function['code'] = source_code[start_byte:end_byte].decode('utf8')
+        functions.append(function)
+    return functions
+
+
+class ParseCache:
+    """Content-hash keyed cache of extract_functions output"""
+
+    def __init__(self, cache_dir='output/parse_cache', extract_fn=parse_source, version=None):
+        """version: part of every key; defaults to extractor_fingerprint() (pass your own with a custom extract_fn)"""
+        self.cache_dir = cache_dir
+        self.extract_fn = extract_fn
+        self.version = (version if version is not None else extractor_fingerprint()).encode('utf8')
+        self.hits = 0
+        self.misses = 0
+        self.cache_bytes_read = 0
+        self.cache_bytes_written = 0
+        self.source_bytes_read = 0
+        self.parse_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], digest[2:] + '.bin')
+
+    def parse(self, filepath):
+        """Same result as pipeline_index.parse_python_file, served from cache when possible"""
+        source_code = load_parse_code().read_file(filepath)
+        return self.cached(source_code, lambda: self.extract_fn(source_code))
+
+    def cached(self, source_code, extract, include_code=True):
+        """
+        Records for source_code (bytes or an mmap) from the cache, or from
+        extract() on a miss; with include_code=False no 'code' is sliced out
+        (source_store.SourceStore.parse output)
+        """
+        # update() piecewise: concatenating would copy a whole mmap into a new bytes object
+        digest = hashlib.sha256(self.version)
+        digest.update(b'\0')
+        digest.update(memoryview(source_code))
+        digest = digest.hexdigest()
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                buffer = f.read()
+            functions = decode_records(buffer, source_code, include_code)
+        except (OSError, ValueError, struct.error):
+            functions = None
+
+        if functions is not None:
+            with self._lock:
+                self.hits += 1
+                self.cache_bytes_read += len(buffer)
+                self.source_bytes_read += len(source_code)
+            return functions
+
+        start = time.perf_counter()
+        functions = extract()
+        elapsed = time.perf_counter() - start
+        buffer = encode_records(functions)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer)
+        os.replace(tmp_path, path)  # readers never see a half-written record
+        with self._lock:
+            self.misses += 1
+            self.cache_bytes_written += len(buffer)
+            self.source_bytes_read += len(source_code)
+            self.parse_seconds += elapsed
+        return functions
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'cache_bytes_read': self.cache_bytes_read,
+            'cache_bytes_written': self.cache_bytes_written,
+            'source_bytes_read': self.source_bytes_read,
+            'parse_seconds': self.parse_seconds,
+        }
+
+
+# Main execution
+if __name__ == "__main__":
+    import sys
+
+    from pipeline_index import EXPERIMENTS_DIR, discover_files
+
+    root = sys.argv[1] if len(sys.argv) > 1 else EXPERIMENTS_DIR
+    files = list(discover_files(root))
+
+    print("=" * 70)
+    print("PARSE CACHE")
+    print("=" * 70)
+
+    cache = ParseCache()
+    for run in ('cold', 'warm'):
+        cache.hits = cache.misses = cache.cache_bytes_read = 0
+        start = time.perf_counter()
+        for path in files:
+            try:
+                cache.parse(path)
+            except Exception as e:
+                print(f"⚠️  {path}: {e}")
+        elapsed = time.perf_counter() - start
+        stats = cache.stats()
+        print(f"\n{run:>5} run: {len(files)} files in {elapsed * 1000:.1f} ms, "
+              f"hit rate {stats['hit_rate']:.0%}, {stats['cache_bytes_read']} cache bytes read")
+
+    print("\n✅ Unchanged files skip tree-sitter on re-index!")
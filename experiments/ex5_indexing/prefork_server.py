@@ -0,0 +1,329 @@
+"""
+Exercise 20: Pre-Forked Query Workers
+Goal: Serve searches from N processes that share one copy of the model and index
+
+Every process that loads SentenceTransformer and the FAISS index pays
+hundreds of MB and seconds of startup. Here the master does that once:
+
+1. load the embedder (and warm it up) and memory-map index.faiss
+2. load the chunk metadata, gc.collect() and gc.freeze() - frozen objects
+   are never traversed by the cyclic GC again, so the children don't write
+   to (and thereby copy) every page of the master's heap on their first
+   collection
+3. bind the listening socket, then fork N workers; each worker accept()s on
+   the shared socket, so the kernel hands every connection to an idle worker
+
+Pages loaded before the fork are shared copy-on-write. What a worker really
+costs is its USS (unique set size: pages only it maps), which is what
+memory_report() shows next to RSS and PSS.
+
+Usage:
+    python prefork_server.py <index_dir> --workers 4 --port 8765
+    python prefork_server.py <index_dir> --embedder hashing
+    curl 'localhost:8765/search?q=validate+user+token&k=3'
+    python prefork_server.py                 # self-contained demo
+"""
+
+import argparse
+import gc
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ex6_benchmarks'))
+
+import tracing
+from shard_build import get_embedder
+from snapshot_store import read_index_mmap
+
+
+# ============================================================================
+# MEMORY ACCOUNTING
+# ============================================================================
+
+def process_memory(pid):
+    """
+    {'rss_mb', 'pss_mb', 'uss_mb', 'shared_mb'} from /proc/<pid>/smaps_rollup
+
+    USS = private clean + private dirty pages: what killing this process
+    would give back. Returns None where smaps_rollup is unavailable (non-Linux).
+    """
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', encoding='ascii') as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    except OSError:
+        return None
+    return {
+        'rss_mb': fields.get('Rss', 0.0),
+        'pss_mb': fields.get('Pss', 0.0),
+        'uss_mb': fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0),
+        'shared_mb': fields.get('Shared_Clean', 0.0) + fields.get('Shared_Dirty', 0.0),
+    }
+
+
+def print_memory_report(report):
+    print(f"  {'process':<16} {'RSS MB':>9} {'PSS MB':>9} {'USS MB':>9} {'shared MB':>10}")
+    for name, m in report.items():
+        if m is None:
+            print(f"  {name:<16} {'n/a':>9}")
+            continue
+        print(f"  {name:<16} {m['rss_mb']:>9.1f} {m['pss_mb']:>9.1f} {m['uss_mb']:>9.1f} {m['shared_mb']:>10.1f}")
+
+
+# ============================================================================
+# WORKER
+# ============================================================================
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """GET /search?q=...&k=5 and GET /memory; self.server.state is the master's shared state"""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == '/search' and 'q' in params:
+            body = self.server.state.search(params['q'][0], int(params.get('k', ['5'])[0]))
+        elif url.path == '/memory':
+            body = process_memory(os.getpid())
+        else:
+            self.send_error(404, "use /search?q=...&k=5 or /memory")
+            return
+        payload = json.dumps({'worker': os.getpid(), 'result': body}).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # one line per query from N workers is just noise
+
+
+def _limit_threads():
+    """One compute thread per worker: N workers already fill the cores"""
+    faiss.omp_set_num_threads(1)
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(1)
+
+
+def _worker_main(sock, state):
+    _limit_threads()
+    signal.signal(signal.SIGTERM, lambda signum, frame: os._exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C is the master's to handle
+    server = HTTPServer(sock.getsockname(), SearchHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = sock  # the listening socket inherited from the master
+    server.state = state
+    server.serve_forever()
+
+
+# ============================================================================
+# MASTER
+# ============================================================================
+
+class SharedState:
+    """Everything loaded once in the master and inherited by the workers"""
+
+    def __init__(self, index_dir, embed_fn):
+        self.embed_fn = embed_fn
+        self.index = read_index_mmap(os.path.join(index_dir, 'index.faiss'))
+        self.chunks = {}
+        with open(os.path.join(index_dir, 'metadata.jsonl'), encoding='utf8') as f:
+            for line in f:
+                chunk = json.loads(line)
+                self.chunks[chunk['id']] = chunk
+
+    def search(self, query, k=5):
+        with tracing.span("embed"):
+            vector = np.ascontiguousarray(self.embed_fn([query]), dtype='float32')
+        with tracing.span("search"):
+            distances, ids = self.index.search(vector, min(k, self.index.ntotal))
+        return [dict(self.chunks[int(i)], distance=float(d))
+                for d, i in zip(distances[0], ids[0]) if i >= 0]
+
+
+class PreforkServer:
+    """Load once, fork N workers that accept() on one shared socket"""
+
+    def __init__(self, state, workers=4, host='127.0.0.1', port=8765, freeze=True):
+        self.state = state
+        self.workers = workers
+        self.freeze = freeze
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(128)
+        self.address = self.sock.getsockname()
+        self.pids = []
+        self._stopping = False
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _worker_main(self.sock, self.state)
+            finally:
+                os._exit(0)  # never fall back into the master's code
+        self.pids.append(pid)
+        return pid
+
+    def start(self):
+        if self.freeze:
+            gc.collect()  # don't freeze garbage
+            gc.freeze()
+        for _ in range(self.workers):
+            self._spawn()
+        return self
+
+    def supervise(self, report_interval=None):
+        """Block in the master: respawn workers that die, optionally print memory"""
+        last_report = time.monotonic()
+        while not self._stopping:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid and pid in self.pids:
+                self.pids.remove(pid)
+                print(f"⚠️  Worker {pid} exited, respawned as {self._spawn()}")
+            if report_interval and time.monotonic() - last_report >= report_interval:
+                last_report = time.monotonic()
+                print_memory_report(self.memory_report())
+            time.sleep(0.2)
+
+    def memory_report(self):
+        report = {f'master {os.getpid()}': process_memory(os.getpid())}
+        for pid in self.pids:
+            report[f'worker {pid}'] = process_memory(pid)
+        return report
+
+    def stop(self):
+        self._stopping = True
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self.pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.pids = []
+        self.sock.close()
+        if self.freeze:
+            gc.unfreeze()
+
+
+# ============================================================================
+# DEMO
+# ============================================================================
+
+def build_demo_index(out_dir, embed_fn, n_chunks=100_000, seed=0):
+    """Random vectors + synthetic metadata, big enough for the sharing to show in MB"""
+    rng = np.random.default_rng(seed)
+    index = faiss.IndexFlatL2(embed_fn.dimension)
+    for start in range(0, n_chunks, 10_000):
+        index.add(rng.random((min(10_000, n_chunks - start), embed_fn.dimension), dtype='float32'))
+    os.makedirs(out_dir, exist_ok=True)
+    faiss.write_index(index, os.path.join(out_dir, 'index.faiss'))
+    with open(os.path.join(out_dir, 'metadata.jsonl'), 'w', encoding='utf8') as f:
+        for i in range(n_chunks):
+            f.write(json.dumps({'id': i, 'file': f'module_{i // 50}.py', 'function': f'func_{i}',
+                                'start_line': (i % 50) * 20 + 1}) + '\n')
+
+
+def run_demo(workers=4, n_requests=400, freeze=True):
+    import tempfile
+    from collections import Counter
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.request import urlopen
+
+    embed = get_embedder('hashing')
+    queries = ["validate user token", "send invoice email", "refresh session", "export report"]
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        print("\n🏗️  Building a 100,000-chunk demo index...")
+        build_demo_index(out_dir, embed)
+
+        start = time.perf_counter()
+        state = SharedState(out_dir, embed)
+        state.index.search(np.zeros((1, embed.dimension), dtype='float32'), 1)  # fault pages in once
+        print(f"✓ Master loaded {state.index.ntotal} vectors + metadata in {time.perf_counter() - start:.2f}s")
+
+        server = PreforkServer(state, workers=workers, port=0, freeze=freeze).start()
+        host, port = server.address
+        print(f"✓ Forked {workers} workers on {host}:{port} (gc.freeze: {freeze})")
+
+        def ask(i):
+            with urlopen(f"http://{host}:{port}/search?q={queries[i % len(queries)].replace(' ', '+')}&k=5") as r:
+                return json.loads(r.read())['worker']
+
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers * 2) as pool:
+                served_by = Counter(pool.map(ask, range(n_requests)))
+            elapsed = time.perf_counter() - start
+            print(f"\n🔹 {n_requests} requests in {elapsed:.2f}s ({n_requests / elapsed:.0f} req/s)")
+            for pid, count in sorted(served_by.items()):
+                print(f"   worker {pid}: {count} requests")
+
+            print("\n🔹 Memory after serving:")
+            report = server.memory_report()
+            print_memory_report(report)
+            workers_only = [m for name, m in report.items() if name.startswith('worker') and m]
+            if workers_only:
+                uss = sum(m['uss_mb'] for m in workers_only) / len(workers_only)
+                rss = sum(m['rss_mb'] for m in workers_only) / len(workers_only)
+                print(f"\n   Each extra worker costs ~{uss:.1f} MB (USS), not the {rss:.1f} MB its RSS suggests")
+        finally:
+            server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-forked search workers sharing one embedder + index")
+    parser.add_argument('index_dir', nargs='?', help="directory with index.faiss + metadata.jsonl")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--embedder', default='all-MiniLM-L6-v2', help="model name or 'hashing'")
+    parser.add_argument('--no-freeze', action='store_true', help="skip gc.freeze() (for comparison)")
+    parser.add_argument('--report-interval', type=float, default=60.0)
+    args = parser.parse_args(argv)
+
+    print("=" * 70)
+    print("PRE-FORKED QUERY WORKERS")
+    print("=" * 70)
+
+    if args.index_dir is None:
+        run_demo(workers=args.workers, freeze=not args.no_freeze)
+        print("\n✅ Pre-fork serving complete!")
+        return
+
+    start = time.perf_counter()
+    state = SharedState(args.index_dir, get_embedder(args.embedder))
+    print(f"\n✓ Loaded embedder + {state.index.ntotal} vectors in {time.perf_counter() - start:.2f}s")
+    server = PreforkServer(state, workers=args.workers, host=args.host, port=args.port,
+                           freeze=not args.no_freeze).start()
+    print(f"✓ {args.workers} workers serving http://{args.host}:{server.address[1]}/search?q=...")
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # stop the workers too
+    try:
+        server.supervise(report_interval=args.report_interval)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping workers...")
+    finally:
+        server.stop()
+
+
+# Main execution
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Exercise 19: Dimension Reduction with PCA / OPQ
+Goal: Search 128 or 64-dim vectors instead of 384 without changing the model
+
+all-MiniLM-L6-v2 vectors are 384-dim, but code embeddings sit in a much
+smaller subspace. A linear projection learned on a sample of the corpus
+keeps most of the geometry:
+
+- PCA:  faiss.PCAMatrix, the top principal directions
+- OPQ:  faiss.OPQMatrix, a rotation (+ reduction) tuned for PQ codes
+
+The projection is wrapped with the index in a faiss.IndexPreTransform, so
+it is applied at ingest and at query time automatically and is saved in
+the same index.faiss file - callers keep passing full 384-dim vectors.
+"""
+
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+
+def train_projection(sample, out_dim, method='pca'):
+    """Learn a d -> out_dim linear projection from a (n, d) sample of corpus vectors"""
+    sample = np.ascontiguousarray(sample, dtype='float32')
+    n, d = sample.shape
+    if n < out_dim:
+        raise ValueError(f"Need at least {out_dim} sample vectors to train a {out_dim}-dim "
+                         f"projection, got {n}")
+    if method == 'pca':
+        transform = faiss.PCAMatrix(d, out_dim)
+    elif method == 'opq':
+        # 8 dims per sub-quantizer is the usual OPQ setting
+        transform = faiss.OPQMatrix(d, max(1, out_dim // 8), out_dim)
+    else:
+        raise ValueError(f"Unknown projection method: {method}")
+    transform.train(sample)
+    return transform
+
+
+def explained_variance(transform, sample):
+    """Share of the sample's variance that survives a PCA projection"""
+    sample = np.ascontiguousarray(sample, dtype='float32')
+    centered = sample - sample.mean(axis=0)
+    reduced = transform.apply(sample)
+    return float(reduced.var(axis=0).sum() / centered.var(axis=0).sum())
+
+
+def reduced_index(transform, index=None):
+    """Wrap an index (default IndexFlatL2) so it stores and searches projected vectors"""
+    index = index or faiss.IndexFlatL2(transform.d_out)
+    return faiss.IndexPreTransform(transform, index)
+
+
+def sample_rows(vectors, sample_size, seed=0):
+    if len(vectors) <= sample_size:
+        return vectors
+    rows = np.random.default_rng(seed).choice(len(vectors), sample_size, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def reduce_index(index_path, out_path, out_dim=128, method='pca', sample_size=20000):
+    """Re-encode a saved flat index at out_dim (vector ids / metadata order are unchanged)"""
+    index = faiss.read_index(index_path)
+    vectors = index.reconstruct_n(0, index.ntotal)
+    transform = train_projection(sample_rows(vectors, sample_size), out_dim, method)
+    reduced = reduced_index(transform)
+    reduced.add(vectors)
+    faiss.write_index(reduced, out_path)
+    return reduced
+
+
+def queries_per_second(index, queries, k=10, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        index.search(queries, k)
+        best = min(best, time.perf_counter() - start)
+    return len(queries) / best
+
+
+# Main execution
+if __name__ == "__main__":
+    import tempfile
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    'ex6_benchmarks'))
+    from benchmark import generate_codebase, generate_queries, hashing_embedder, parse_with_ast
+    from pipeline_index import chunk_functions, discover_files
+
+    if len(sys.argv) > 2:
+        # python reduce_dims.py output/index/index.faiss output/index/index_pca128.faiss [dims] [pca|opq]
+        out_dim = int(sys.argv[3]) if len(sys.argv) > 3 else 128
+        method = sys.argv[4] if len(sys.argv) > 4 else 'pca'
+        reduced = reduce_index(sys.argv[1], sys.argv[2], out_dim, method)
+        print(f"✓ {reduced.ntotal} vectors re-encoded at {out_dim} dims ({method}) -> {sys.argv[2]}")
+        sys.exit(0)
+
+    print("=" * 70)
+    print("DIMENSION REDUCTION: PCA / OPQ")
+    print("=" * 70)
+
+    embed = hashing_embedder()
+    with tempfile.TemporaryDirectory() as root:
+        generate_codebase(root, 400)
+        chunks = [chunk for path in discover_files(root)
+                  for chunk in chunk_functions(path, parse_with_ast(path))]
+    vectors = embed([c['code'] for c in chunks])
+    queries = embed(generate_queries(500))
+    k = 10
+
+    flat = faiss.IndexFlatL2(embed.dimension)
+    flat.add(vectors)
+    _, truth = flat.search(queries, k)
+    flat_qps = queries_per_second(flat, queries, k)
+    print(f"\n📦 {len(vectors)} chunk vectors, {embed.dimension} dims, {len(queries)} queries")
+    print(f"\n  {'config':<10} {'dims':>5} {f'recall@{k}':>10} {'queries/s':>10} {'speedup':>8} {'MB':>7}")
+    print(f"  {'flat':<10} {embed.dimension:>5} {1.0:>10.3f} {flat_qps:>10.0f} {1.0:>7.2f}x "
+          f"{vectors.nbytes / 1e6:>7.2f}")
+
+    sample = sample_rows(vectors, 4000)
+    # (OPQ wants ~10k training vectors per 256-centroid sub-quantizer; too few here)
+    for method, out_dim in (('pca', 128), ('pca', 64), ('pca', 32)):
+        index = reduced_index(train_projection(sample, out_dim, method))
+        index.add(vectors)
+        _, found = index.search(queries, k)
+        # Recall against exact full-width search: how many true top-k neighbours survive
+        recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+        qps = queries_per_second(index, queries, k)
+        print(f"  {method + str(out_dim):<10} {out_dim:>5} {recall:>10.3f} {qps:>10.0f} "
+              f"{qps / flat_qps:>7.2f}x {index.ntotal * out_dim * 4 / 1e6:>7.2f}")
+
+    pca = train_projection(sample, 128)
+    print(f"\n  PCA128 keeps {explained_variance(pca, sample):.1%} of the variance")
+    print("\n✅ Dimension reduction complete!")
@@ -0,0 +1,298 @@
+"""
+Exercise 17: Revision-Aware Multi-Branch Index
+Goal: Search main, release branches and open PRs from one shared index
+
+Re-indexing every branch from scratch multiplies storage and build time,
+although branches share almost all of their code. Here:
+
+- chunks are content-addressed (file + function + code hash), so an
+  identical chunk on ten branches is parsed, embedded and stored once;
+  its line range is kept per (path, blob), since the same function can
+  sit at different lines on different branches
+- files are read straight from git objects (`git ls-tree` + `git cat-file`),
+  no checkout needed; a blob already seen at the same path on another
+  revision is not even re-parsed
+- a revision is just a bitmap over chunk slots (1 bit per stored chunk),
+  passed to FAISS as an IDSelectorBitmap search filter
+
+Adding a branch that differs from main by a few files only embeds the
+chunks of those files and costs ntotal / 8 bytes for its bitmap.
+"""
+
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import faiss
+import numpy as np
+
+from pipeline_index import chunk_functions, parse_source
+
+
+def content_key(chunk):
+    """Content address of a chunk: same file, function and code -> same key"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (chunk['file'], chunk['function'], chunk['code']):
+        digest.update(part.encode('utf8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def blob_key(path, sha):
+    """Chunks carry their file path, so a blob's slots are only valid at that path"""
+    return f"{sha}:{path}"
+
+
+# ============================================================================
+# GIT OBJECTS
+# ============================================================================
+
+def resolve(repo, rev):
+    return subprocess.run(['git', '-C', repo, 'rev-parse', rev],
+                          check=True, capture_output=True, text=True).stdout.strip()
+
+
+def list_blobs(repo, rev, extensions=('.py',)):
+    """{path: blob sha} of the source files in a revision (no checkout)"""
+    output = subprocess.run(['git', '-C', repo, 'ls-tree', '-r', '--full-tree', rev],
+                            check=True, capture_output=True, text=True).stdout
+    blobs = {}
+    for line in output.splitlines():
+        info, path = line.split('\t', 1)
+        _, kind, sha = info.split()
+        if kind == 'blob' and path.endswith(extensions):
+            blobs[path] = sha
+    return blobs
+
+
+def read_blobs(repo, shas):
+    """Yield (sha, bytes) for each blob through a single `git cat-file --batch`"""
+    if not shas:
+        return
+    process = subprocess.Popen(['git', '-C', repo, 'cat-file', '--batch'],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    # Feed shas from a thread so a large batch can't deadlock on full pipes
+    def feed():
+        process.stdin.write(''.join(f"{sha}\n" for sha in shas).encode())
+        process.stdin.close()
+    threading.Thread(target=feed, daemon=True).start()
+    try:
+        for sha in shas:
+            header = process.stdout.readline().split()
+            size = int(header[2])
+            data = process.stdout.read(size)
+            process.stdout.read(1)  # trailing newline
+            yield sha, data
+    finally:
+        process.stdout.close()
+        process.wait()
+
+
+# ============================================================================
+# INDEX
+# ============================================================================
+
+class RevisionIndex:
+    """One vector store shared by every revision; revisions are bitmaps over it"""
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self.index = faiss.IndexFlatL2(dimension)  # row number == chunk slot
+        self.chunks = []          # slot -> chunk metadata
+        self.slots = {}           # content key -> slot
+        self.blob_slots = {}      # blob_key(path, sha) -> [slot, start_line, end_line] per chunk
+        self.revisions = {}       # name -> {'commit', 'files', 'bitmap', 'chunks'}
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------ writes
+
+    def _index_blobs(self, repo, paths_by_blob, embed_fn, parse_fn):
+        """Parse/embed (path, blob) pairs never seen before; returns number of new chunks"""
+        new_chunks = []
+        for sha, data in read_blobs(repo, list(paths_by_blob)):
+            try:
+                functions = parse_fn(data)
+            except Exception as e:
+                print(f"⚠️  Could not parse {paths_by_blob[sha][0]}@{sha[:8]}: {e}")
+                functions = []
+            # A renamed or copied file is parsed once but chunked under each path,
+            # so search results report the path the revision actually has
+            for path in paths_by_blob[sha]:
+                slots = []
+                for chunk in chunk_functions(path, functions):
+                    key = content_key(chunk)
+                    if key not in self.slots:
+                        self.slots[key] = len(self.chunks) + len(new_chunks)
+                        # Lines differ between revisions: they live in blob_slots, not here
+                        new_chunks.append(dict({field: value for field, value in chunk.items()
+                                                if field not in ('start_line', 'end_line')}, key=key))
+                    slots.append([self.slots[key], chunk['start_line'], chunk['end_line']])
+                self.blob_slots[blob_key(path, sha)] = slots
+
+        if new_chunks:
+            vectors = embed_fn([c['code'] for c in new_chunks])
+            self.index.add(np.ascontiguousarray(vectors, dtype='float32'))
+            self.chunks.extend(new_chunks)
+        return len(new_chunks)
+
+    def add_revision(self, name, repo, rev=None, embed_fn=None, parse_fn=parse_source):
+        """
+        Index a branch/tag/commit; only blobs no other revision had are parsed
+        and only chunks with new content are embedded
+        """
+        start = time.perf_counter()
+        commit = resolve(repo, rev or name)
+        files = list_blobs(repo, commit)
+        with self._lock:
+            # The same blob under two paths is chunked separately (file is part of the key)
+            unseen = {}
+            for path, sha in files.items():
+                if blob_key(path, sha) not in self.blob_slots:
+                    unseen.setdefault(sha, []).append(path)
+            embedded = self._index_blobs(repo, unseen, embed_fn, parse_fn)
+
+            bits = np.zeros(len(self.chunks), dtype=bool)
+            for path, sha in files.items():
+                bits[[slot for slot, _, _ in self.blob_slots.get(blob_key(path, sha), [])]] = True
+            self.revisions[name] = {
+                'commit': commit,
+                'files': files,
+                'bitmap': np.packbits(bits, bitorder='little'),  # IDSelectorBitmap bit order
+                'chunks': int(bits.sum()),
+            }
+        return {
+            'revision': name,
+            'commit': commit,
+            'files': len(files),
+            'files_parsed': len(unseen),
+            'chunks': self.revisions[name]['chunks'],
+            'chunks_embedded': embedded,
+            'bitmap_bytes': self.revisions[name]['bitmap'].nbytes,
+            'seconds': time.perf_counter() - start,
+        }
+
+    def drop_revision(self, name):
+        """Forget a revision (its chunks stay shared storage for the others)"""
+        with self._lock:
+            self.revisions.pop(name, None)
+
+    # ------------------------------------------------------------------- reads
+
+    def _locate(self, info, slot):
+        """The stored chunk with its line range in the revision described by info"""
+        chunk = self.chunks[slot]
+        for candidate, start_line, end_line in self.blob_slots[blob_key(chunk['file'], info['files'][chunk['file']])]:
+            if candidate == slot:
+                return dict(chunk, start_line=start_line, end_line=end_line)
+        return chunk
+
+    def search(self, query_vectors, revision, k=5):
+        """Top-k chunks of one revision per query as lists of (distance, chunk)"""
+        query_vectors = np.ascontiguousarray(query_vectors, dtype='float32').reshape(-1, self.dimension)
+        with self._lock:
+            info = self.revisions[revision]
+            if info['chunks'] == 0:
+                return [[] for _ in range(len(query_vectors))]
+            # IDSelectorBitmap takes the bitmap length in bytes; newer slots fall outside it
+            selector = faiss.IDSelectorBitmap(info['bitmap'].nbytes, faiss.swig_ptr(info['bitmap']))
+            distances, slots = self.index.search(
+                query_vectors, min(k, info['chunks']), params=faiss.SearchParameters(sel=selector))
+            return [[(float(d), self._locate(info, s)) for d, s in zip(row_d, row_s) if s >= 0]
+                    for row_d, row_s in zip(distances, slots)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'stored_chunks': len(self.chunks),
+                'vector_bytes': self.index.ntotal * self.dimension * 4,
+                'revisions': {name: {'commit': info['commit'][:12], 'chunks': info['chunks'],
+                                     'bitmap_bytes': info['bitmap'].nbytes}
+                              for name, info in self.revisions.items()},
+            }
+
+    # ------------------------------------------------------------- persistence
+
+    def save(self, out_dir):
+        """index.faiss + chunks.jsonl + one bitmap .npy per revision"""
+        os.makedirs(out_dir, exist_ok=True)
+        with self._lock:
+            faiss.write_index(self.index, os.path.join(out_dir, 'index.faiss'))
+            with open(os.path.join(out_dir, 'chunks.jsonl'), 'w', encoding='utf8') as f:
+                for chunk in self.chunks:
+                    f.write(json.dumps(chunk) + '\n')
+            revisions = {}
+            for i, (name, info) in enumerate(self.revisions.items()):
+                np.save(os.path.join(out_dir, f'revision_{i}.npy'), info['bitmap'])
+                revisions[name] = {key: info[key] for key in ('commit', 'files', 'chunks')}
+                revisions[name]['bitmap'] = f'revision_{i}.npy'
+            with open(os.path.join(out_dir, 'revisions.json'), 'w', encoding='utf8') as f:
+                json.dump({'revisions': revisions, 'blob_slots': self.blob_slots}, f)
+
+    @classmethod
+    def load(cls, out_dir):
+        index = faiss.read_index(os.path.join(out_dir, 'index.faiss'))
+        revision_index = cls(index.d)
+        revision_index.index = index
+        with open(os.path.join(out_dir, 'chunks.jsonl'), encoding='utf8') as f:
+            revision_index.chunks = [json.loads(line) for line in f]
+        revision_index.slots = {chunk['key']: slot for slot, chunk in enumerate(revision_index.chunks)}
+        with open(os.path.join(out_dir, 'revisions.json'), encoding='utf8') as f:
+            state = json.load(f)
+        revision_index.blob_slots = state['blob_slots']
+        for name, info in state['revisions'].items():
+            info['bitmap'] = np.load(os.path.join(out_dir, info['bitmap']))
+            revision_index.revisions[name] = info
+        return revision_index
+
+
+# Main execution
+if __name__ == "__main__":
+    import tempfile
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    'ex6_benchmarks'))
+    from benchmark import generate_codebase, hashing_embedder
+
+    print("=" * 70)
+    print("REVISION-AWARE INDEX: MAIN + BRANCHES, SHARED CHUNKS")
+    print("=" * 70)
+
+    def git(repo, *args):
+        subprocess.run(['git', '-C', repo, *args], check=True, capture_output=True)
+
+    embed = hashing_embedder()
+    with tempfile.TemporaryDirectory() as repo:
+        generate_codebase(repo, 200)
+        git(repo, 'init', '-q', '-b', 'main')
+        git(repo, 'add', '.')
+        git(repo, '-c', 'user.name=demo', '-c', 'user.email=demo@example.com', 'commit', '-qm', 'main')
+
+        git(repo, 'checkout', '-qb', 'feature/token-refresh')
+        with open(os.path.join(repo, 'token_refresh.py'), 'w') as f:
+            f.write("def refresh_token(token):\n    \"\"\"Issue a new JWT before the old one expires\"\"\"\n"
+                    "    return jwt.encode(jwt.decode(token), SECRET_KEY)\n")
+        git(repo, 'add', '.')
+        git(repo, '-c', 'user.name=demo', '-c', 'user.email=demo@example.com', 'commit', '-qm', 'refresh')
+
+        revisions = RevisionIndex(embed.dimension)
+        for name in ('main', 'feature/token-refresh'):
+            report = revisions.add_revision(name, repo, embed_fn=embed)
+            print(f"\n✓ {name} @ {report['commit'][:8]}: {report['chunks']} chunks in "
+                  f"{report['seconds'] * 1000:.0f} ms")
+            print(f"   parsed {report['files_parsed']}/{report['files']} files, "
+                  f"embedded {report['chunks_embedded']} new chunks, bitmap {report['bitmap_bytes']} bytes")
+
+        query = embed(["refresh jwt token"])
+        for name in ('main', 'feature/token-refresh'):
+            distance, chunk = revisions.search(query, name, k=1)[0][0]
+            print(f"\n🔍 [{name}] refresh jwt token -> {chunk['file']}::{chunk['function']}")
+
+        stats = revisions.stats()
+        print(f"\n  {stats['stored_chunks']} chunks stored once, "
+              f"{stats['vector_bytes'] / 1e6:.2f} MB of vectors shared by {len(stats['revisions'])} revisions")
+
+    print("\n✅ Revision-aware search complete!")
@@ -0,0 +1,252 @@
+"""
+Exercise 18: Distributed Index Build (map-reduce over shards)
+Goal: Split a full rebuild across processes or hosts and merge the results
+
+1. map:    files are assigned to shards by a hash of their relative path, so
+           every worker (or host) agrees on the partition without talking
+2. build:  each shard parses, chunks and embeds only its files into its own
+           IndexIDMap2 + metadata.jsonl under <out>/shards/shard_<i>
+3. reduce: shard indexes are merged with FAISS merge_from and the metadata
+           files concatenated in shard order
+
+Chunk ids come from live_index.chunk_id (file + function + part), so they
+are the same whichever shard built a chunk and however many shards there are.
+
+Usage:
+    python shard_build.py build <repo> <out> --workers 4        # local processes
+    python shard_build.py shard <repo> <out> --shard 2 --num-shards 8   # on one host
+    python shard_build.py merge <out> --num-shards 8             # once all shards exist
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import faiss
+import numpy as np
+
+from live_index import assign_chunk_ids
+from pipeline_index import EXPERIMENTS_DIR, chunk_functions, discover_files, load_embedder, parse_python_file
+
+
+def shard_of(relpath, num_shards):
+    """Stable shard assignment (same on every host and Python run, unlike hash())"""
+    return zlib.crc32(relpath.encode('utf8')) % num_shards
+
+
+def shard_files(root, shard, num_shards):
+    paths = sorted(discover_files(root))
+    return [path for path in paths if shard_of(os.path.relpath(path, root), num_shards) == shard]
+
+
+def shard_dir(out_dir, shard):
+    return os.path.join(out_dir, 'shards', f'shard_{shard}')
+
+
+def get_embedder(embedder):
+    if embedder == 'hashing':
+        sys.path.insert(0, os.path.join(EXPERIMENTS_DIR, 'ex6_benchmarks'))
+        from benchmark import hashing_embedder
+        return hashing_embedder()
+    return load_embedder(embedder)
+
+
+# ============================================================================
+# MAP: BUILD ONE SHARD
+# ============================================================================
+
+def build_shard(root, out_dir, shard, num_shards, embedder='hashing',
+                parse_fn=parse_python_file, batch_size=64):
+    """
+    Build index.faiss + metadata.jsonl for one shard
+
+    Written to a temporary directory and renamed into place, so a crashed
+    worker never leaves a half-built shard that merge would pick up.
+    """
+    start = time.perf_counter()
+    embed_fn = get_embedder(embedder)
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(embed_fn.dimension))
+    final_dir = shard_dir(out_dir, shard)
+    tmp_dir = f"{final_dir}.{os.getpid()}.tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    files = shard_files(root, shard, num_shards)
+    errors = 0
+    with open(os.path.join(tmp_dir, 'metadata.jsonl'), 'w', encoding='utf8') as metadata:
+        batch = []
+
+        def flush():
+            vectors = embed_fn([c['code'] for c in batch])
+            index.add_with_ids(np.ascontiguousarray(vectors, dtype='float32'),
+                               np.array([c['id'] for c in batch], dtype='int64'))
+            for chunk in batch:
+                metadata.write(json.dumps(chunk) + '\n')
+            batch.clear()
+
+        for path in files:
+            try:
+                chunks = assign_chunk_ids(chunk_functions(os.path.relpath(path, root), parse_fn(path)))
+            except Exception as e:
+                errors += 1
+                print(f"⚠️  [shard {shard}] {path}: {e}")
+                continue
+            batch.extend(chunks)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+    faiss.write_index(index, os.path.join(tmp_dir, 'index.faiss'))
+    stats = {'shard': shard, 'files': len(files), 'vectors': index.ntotal,
+             'errors': errors, 'seconds': time.perf_counter() - start}
+    with open(os.path.join(tmp_dir, 'stats.json'), 'w', encoding='utf8') as f:
+        json.dump(stats, f)
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+    return stats
+
+
+# ============================================================================
+# REDUCE: MERGE SHARDS
+# ============================================================================
+
+def merge_shards(out_dir, num_shards):
+    """Merge every shard into <out>/index.faiss + metadata.jsonl"""
+    start = time.perf_counter()
+    missing = [i for i in range(num_shards)
+               if not os.path.exists(os.path.join(shard_dir(out_dir, i), 'index.faiss'))]
+    if missing:
+        raise FileNotFoundError(f"Shards not built yet: {missing}")
+
+    merged = None
+    seen_ids = set()
+    with open(os.path.join(out_dir, 'metadata.jsonl'), 'w', encoding='utf8') as metadata:
+        for i in range(num_shards):
+            index = faiss.read_index(os.path.join(shard_dir(out_dir, i), 'index.faiss'))
+            ids = faiss.vector_to_array(index.id_map)
+            duplicates = seen_ids.intersection(ids.tolist())
+            if duplicates:
+                raise ValueError(f"Shard {i} repeats {len(duplicates)} chunk id(s) from earlier shards")
+            seen_ids.update(ids.tolist())
+            if merged is None:
+                merged = index
+            else:
+                merged.merge_from(index, 0)  # keep the ids as they are (no offset)
+            with open(os.path.join(shard_dir(out_dir, i), 'metadata.jsonl'), encoding='utf8') as f:
+                shutil.copyfileobj(f, metadata)
+
+    index_path = os.path.join(out_dir, 'index.faiss')
+    faiss.write_index(merged, index_path)
+    return {'shards': num_shards, 'vectors': merged.ntotal, 'index_path': index_path,
+            'seconds': time.perf_counter() - start}
+
+
+def build_distributed(root, out_dir, workers=4, num_shards=None, embedder='hashing', parse_fn=parse_python_file):
+    """Map with a local process pool, then reduce; returns a summary dict"""
+    num_shards = num_shards or workers
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(build_shard, root, out_dir, shard, num_shards, embedder, parse_fn)
+                   for shard in range(num_shards)]
+        shards = [future.result() for future in futures]
+    map_seconds = time.perf_counter() - start
+    merge = merge_shards(out_dir, num_shards)
+    return {
+        'workers': workers,
+        'shards': shards,
+        'map_seconds': map_seconds,
+        'merge_seconds': merge['seconds'],
+        'seconds': time.perf_counter() - start,
+        'vectors': merge['vectors'],
+        'index_path': merge['index_path'],
+    }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Sharded index build")
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="map + reduce with local worker processes")
+    build.add_argument('root')
+    build.add_argument('out')
+    build.add_argument('--workers', type=int, default=os.cpu_count())
+    build.add_argument('--num-shards', type=int, default=None)
+    build.add_argument('--embedder', default='hashing')
+
+    shard = commands.add_parser('shard', help="build a single shard (one host)")
+    shard.add_argument('root')
+    shard.add_argument('out')
+    shard.add_argument('--shard', type=int, required=True)
+    shard.add_argument('--num-shards', type=int, required=True)
+    shard.add_argument('--embedder', default='hashing')
+
+    merge = commands.add_parser('merge', help="merge shards built elsewhere")
+    merge.add_argument('out')
+    merge.add_argument('--num-shards', type=int, required=True)
+
+    args = arg_parser.parse_args(argv)
+
+    print("=" * 70)
+    print("SHARDED INDEX BUILD")
+    print("=" * 70)
+
+    if args.command == 'shard':
+        stats = build_shard(args.root, args.out, args.shard, args.num_shards, args.embedder)
+        print(f"\n✓ Shard {stats['shard']}: {stats['files']} files -> {stats['vectors']} vectors "
+              f"in {stats['seconds']:.2f}s")
+        return
+    if args.command == 'merge':
+        result = merge_shards(args.out, args.num_shards)
+        print(f"\n✓ Merged {result['shards']} shards -> {result['vectors']} vectors in "
+              f"{result['seconds']:.2f}s ({result['index_path']})")
+        return
+
+    summary = build_distributed(args.root, args.out, args.workers, args.num_shards, args.embedder)
+    for stats in summary['shards']:
+        print(f"  shard {stats['shard']:>3}: {stats['files']:>6} files {stats['vectors']:>8} vectors "
+              f"{stats['seconds']:8.2f}s")
+    print(f"\n✓ {summary['vectors']} vectors with {summary['workers']} worker(s): "
+          f"map {summary['map_seconds']:.2f}s + merge {summary['merge_seconds']:.2f}s")
+
+
+# Main execution
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main()
+        sys.exit(0)
+
+    # No arguments: scaling demo on a generated codebase
+    import tempfile
+
+    sys.path.insert(0, os.path.join(EXPERIMENTS_DIR, 'ex6_benchmarks'))
+    from benchmark import generate_codebase
+
+    print("=" * 70)
+    print("SHARDED INDEX BUILD: SCALING WITH WORKER PROCESSES")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        root = os.path.join(workdir, 'repo')
+        generate_codebase(root, 400)
+        print(f"\n📦 400 generated files, {os.cpu_count()} CPU(s)\n")
+        baseline = None
+        reference_ids = None
+        for workers in (1, 2, 4):
+            out_dir = os.path.join(workdir, f'out_{workers}')
+            summary = build_distributed(root, out_dir, workers=workers)
+            baseline = baseline or summary['seconds']
+            merged = faiss.read_index(summary['index_path'])  # keep alive: id_map is a view into it
+            ids = np.sort(faiss.vector_to_array(merged.id_map))
+            reference_ids = ids if reference_ids is None else reference_ids
+            print(f"  {workers} worker(s): {summary['seconds']:.2f}s "
+                  f"(map {summary['map_seconds']:.2f}s, merge {summary['merge_seconds']:.3f}s), "
+                  f"speedup {baseline / summary['seconds']:.2f}x, "
+                  f"ids identical: {np.array_equal(ids, reference_ids)}")
+
+    print("\n✅ Sharded build complete!")
@@ -0,0 +1,252 @@
+"""
+Exercise 11: Snapshot-Isolated Index Swapping
+Goal: Rebuild or retrain the index while queries keep running
+
+Each build is written as an immutable, versioned snapshot:
+
+    snapshots/v000001/index.faiss
+    snapshots/v000001/metadata.json
+    CURRENT                       <- "v000001", replaced atomically
+
+Readers acquire() the current snapshot and hold a reference to it for the
+whole query. A builder prepares the next version on the side, then publish()
+swaps the pointer in one step. The old snapshot is only closed (and its
+files unmapped/deleted) when the last reader holding it lets go.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+
+CURRENT_FILE = 'CURRENT'
+SNAPSHOT_DIR = 'snapshots'
+
+
+def read_index_mmap(path):
+    """Memory-map the index when this FAISS build/index type supports it"""
+    try:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+class Snapshot:
+    """One immutable version of index + metadata, reference counted"""
+
+    def __init__(self, version, path, index, metadata, on_retire=None):
+        self.version = version
+        self.path = path
+        self.index = index
+        self.metadata = metadata
+        self._refs = 1  # the store's own reference while this is CURRENT
+        self._lock = threading.Lock()
+        self._on_retire = on_retire
+
+    def acquire(self):
+        with self._lock:
+            if self._refs == 0:
+                return False
+            self._refs += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            retire = self._refs == 0
+        if retire:
+            self.index = None
+            self.metadata = None
+            if self._on_retire is not None:
+                self._on_retire(self)
+
+    def search(self, query_vectors, k=5):
+        """Top-k (distance, chunk) per query"""
+        query_vectors = np.ascontiguousarray(query_vectors, dtype='float32').reshape(-1, self.index.d)
+        distances, ids = self.index.search(query_vectors, min(k, self.index.ntotal))
+        return [[(float(d), self.metadata[i]) for d, i in zip(row_d, row_i) if i >= 0]
+                for row_d, row_i in zip(distances, ids)]
+
+
+class SnapshotStore:
+    """Versioned snapshots on disk with an atomically swapped CURRENT pointer"""
+
+    def __init__(self, root, keep_versions=2):
+        self.root = root
+        self.keep_versions = keep_versions
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()  # one publish at a time: version numbers and swaps stay in order
+        self._current = None
+        self._live = {}  # version -> Snapshot still referenced by someone
+        self.retired = []
+        os.makedirs(os.path.join(root, SNAPSHOT_DIR), exist_ok=True)
+        if os.path.exists(os.path.join(root, CURRENT_FILE)):
+            with open(os.path.join(root, CURRENT_FILE), encoding='utf8') as f:
+                self._current = self._open(f.read().strip())
+
+    def _version_path(self, version):
+        return os.path.join(self.root, SNAPSHOT_DIR, version)
+
+    def _open(self, version):
+        path = self._version_path(version)
+        index = read_index_mmap(os.path.join(path, 'index.faiss'))
+        with open(os.path.join(path, 'metadata.json'), encoding='utf8') as f:
+            metadata = json.load(f)
+        snapshot = Snapshot(version, path, index, metadata, on_retire=self._retire)
+        with self._lock:
+            self._live[version] = snapshot
+        return snapshot
+
+    def _next_version(self):
+        versions = [v for v in os.listdir(os.path.join(self.root, SNAPSHOT_DIR))
+                    if v.startswith('v') and not v.endswith('.tmp')]
+        latest = max((int(v[1:]) for v in versions), default=0)
+        return f"v{latest + 1:06d}"
+
+    def _retire(self, snapshot):
+        """Called once nobody references the snapshot any more"""
+        with self._lock:
+            self._live.pop(snapshot.version, None)
+            self.retired.append(snapshot.version)
+            live = set(self._live)
+        versions = sorted(v for v in os.listdir(os.path.join(self.root, SNAPSHOT_DIR))
+                          if v.startswith('v') and not v.endswith('.tmp'))
+        # Keep the newest few versions on disk for rollback, delete the rest once unreferenced
+        for version in versions[:-self.keep_versions]:
+            if version not in live:
+                shutil.rmtree(self._version_path(version), ignore_errors=True)
+
+    # ------------------------------------------------------------------ readers
+
+    def acquire(self):
+        """The current snapshot with a reference held; call release() when done"""
+        while True:
+            with self._lock:
+                snapshot = self._current
+            if snapshot is None:
+                raise RuntimeError("No snapshot has been published yet")
+            if snapshot.acquire():
+                return snapshot
+            # Lost a race with a swap that just retired it; pick up the new one
+
+    @contextmanager
+    def reader(self):
+        snapshot = self.acquire()
+        try:
+            yield snapshot
+        finally:
+            snapshot.release()
+
+    def current_version(self):
+        with self._lock:
+            return self._current.version if self._current else None
+
+    # ------------------------------------------------------------------ builders
+
+    def publish(self, index, metadata):
+        """Write a new snapshot next to the current one and swap it in atomically"""
+        with self._publish_lock:
+            return self._publish(index, metadata)
+
+    def _publish(self, index, metadata):
+        # Under _publish_lock: the next version number can't be taken twice, and
+        # CURRENT always ends up naming the newest snapshot
+        version = self._next_version()
+        path = self._version_path(version)
+        tmp_path = path + '.tmp'
+        os.makedirs(tmp_path, exist_ok=True)
+        faiss.write_index(index, os.path.join(tmp_path, 'index.faiss'))
+        with open(os.path.join(tmp_path, 'metadata.json'), 'w', encoding='utf8') as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, path)  # the snapshot directory appears complete or not at all
+
+        snapshot = self._open(version)
+        pointer_tmp = os.path.join(self.root, CURRENT_FILE + '.tmp')
+        with open(pointer_tmp, 'w', encoding='utf8') as f:
+            f.write(version)
+        os.replace(pointer_tmp, os.path.join(self.root, CURRENT_FILE))
+
+        with self._lock:
+            old, self._current = self._current, snapshot
+        if old is not None:
+            old.release()  # drop the store's reference; readers may still hold theirs
+        return version
+
+    def rebuild_async(self, build_fn):
+        """
+        Run build_fn() -> (index, metadata) in a thread and publish the result
+
+        Returns (thread, result); after join() result holds 'version', or
+        'error' if the build or publish failed (the old snapshot keeps serving).
+        """
+        result = {}
+
+        def run():
+            try:
+                index, metadata = build_fn()
+                result['version'] = self.publish(index, metadata)
+            except Exception as e:
+                result['error'] = e
+                print(f"⚠️  Snapshot rebuild failed, still serving {self.current_version()}: {e!r}")
+
+        thread = threading.Thread(target=run, name='snapshot-builder', daemon=True)
+        thread.start()
+        return thread, result
+
+
+# Main execution
+if __name__ == "__main__":
+    import tempfile
+
+    print("=" * 70)
+    print("SNAPSHOT-ISOLATED INDEX SWAPS")
+    print("=" * 70)
+
+    rng = np.random.default_rng(0)
+    dimension = 64
+
+    def build(n):
+        vectors = rng.random((n, dimension), dtype='float32')
+        index = faiss.IndexFlatL2(dimension)
+        index.add(vectors)
+        return index, [{'function': f'func_{i}'} for i in range(n)]
+
+    with tempfile.TemporaryDirectory() as root:
+        store = SnapshotStore(root)
+        print(f"\n✓ Published {store.publish(*build(20_000))}")
+
+        latencies, errors = [], 0
+        stop = threading.Event()
+
+        def query_loop(seed):
+            global errors
+            query_rng = np.random.default_rng(seed)  # Generators aren't thread-safe
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    with store.reader() as snapshot:
+                        snapshot.search(query_rng.random((1, dimension), dtype='float32'), k=5)
+                except Exception:
+                    errors += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        readers = [threading.Thread(target=query_loop, args=(seed,)) for seed in range(4)]
+        for thread in readers:
+            thread.start()
+        for _ in range(3):
+            thread, result = store.rebuild_async(lambda: build(20_000))
+            thread.join()
+            print(f"✓ Swapped in {result['version']} while queries kept running")
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        print(f"\n  Queries: {len(latencies)}, errors: {errors}")
+        print(f"  p50: {np.percentile(latencies, 50):.2f} ms, p99: {np.percentile(latencies, 99):.2f} ms")
+        print(f"  Retired snapshots: {store.retired}")
+    print("\n✅ Snapshot swapping complete!")
@@ -0,0 +1,200 @@
+"""
+Exercise 16: Zero-Copy Source Handling
+Goal: Keep chunk code as byte ranges into memory-mapped files, not strings
+
+read_file loads each file into a bytes object and extract_functions then
+decodes every function body into a new str that lives on in every chunk
+dict - two or three copies of the repository in RAM. Here:
+
+- files are memory-mapped (pages come from the OS page cache, shared and
+  reclaimable) and tree-sitter reads straight from the map
+- a chunk is just (file_id, start_byte, end_byte) + line numbers
+- text is decoded only at the moment a chunk is embedded or shown
+- save()/load() persist the file id -> path table next to the index, so
+  chunk metadata written by one process resolves in another
+"""
+
+import json
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+from pipeline_index import load_parse_code, thread_parser
+
+_EMPTY = b''
+
+
+class SourceStore:
+    """
+    Memory-mapped source files addressed by file id
+
+    At most max_open maps are kept by the store (least recently used are
+    released and transparently reopened), so huge repositories don't run
+    out of file descriptors or address space.
+    """
+
+    def __init__(self, max_open=256):
+        self.paths = []
+        self._ids = {}
+        self._maps = OrderedDict()  # file id -> mmap (or b'' for empty files)
+        self.max_open = max_open
+        self.bytes_decoded = 0
+        self._lock = threading.Lock()
+
+    def add(self, path):
+        """Register a file and return its id"""
+        with self._lock:
+            if path not in self._ids:
+                self._ids[path] = len(self.paths)
+                self.paths.append(path)
+            return self._ids[path]
+
+    def source(self, file_id):
+        """The mapped bytes of a file (reopened if it was evicted)"""
+        with self._lock:
+            mapped = self._maps.get(file_id)
+            if mapped is not None:
+                self._maps.move_to_end(file_id)
+                return mapped
+            with open(self.paths[file_id], 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    mapped = _EMPTY  # mmap can't map empty files
+                else:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[file_id] = mapped
+            while len(self._maps) > self.max_open:
+                # Don't close() here: another thread may still be reading the
+                # map. Dropping our reference unmaps it once the last user is done.
+                self._maps.popitem(last=False)
+            return mapped
+
+    def view(self, file_id, start_byte, end_byte):
+        """Zero-copy memoryview of a byte range"""
+        return memoryview(self.source(file_id))[start_byte:end_byte]
+
+    def text(self, chunk):
+        """Decode a chunk reference to str (the only place code becomes text)"""
+        data = self.source(chunk['file_id'])[chunk['start_byte']:chunk['end_byte']]
+        with self._lock:
+            self.bytes_decoded += len(data)
+        return data.decode('utf8', errors='replace')
+
+    def texts(self, chunks):
+        return [self.text(chunk) for chunk in chunks]
+
+    def parse(self, file_id):
+        """
+        Parse straight from the map: tree-sitter pulls bytes through a read
+        callback and names/docstrings are sliced from the map, so no
+        whole-file bytes copy is made
+        """
+        parse_code = load_parse_code()
+        source = self.source(file_id)
+        size = len(source)
+
+        def read(byte_offset, point):
+            return source[byte_offset:byte_offset + 65536] if byte_offset < size else b''
+
+        tree = thread_parser().parse(read)
+        return parse_code.extract_functions(tree, source, include_code=False)
+
+    def save(self, path):
+        """Write the file id -> path table (JSON list, index = file id)"""
+        with self._lock:
+            paths = list(self.paths)
+        with open(path, 'w', encoding='utf8') as f:
+            json.dump(paths, f)
+
+    @classmethod
+    def load(cls, path, max_open=256):
+        """A store whose file ids match the ones in chunk metadata written alongside path"""
+        store = cls(max_open)
+        with open(path, encoding='utf8') as f:
+            for file_path in json.load(f):
+                store.add(file_path)
+        return store
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                if mapped is not _EMPTY:
+                    mapped.close()
+            self._maps.clear()
+
+
+def chunk_refs(store, file_id, functions, max_lines=60):
+    """
+    Byte-range version of pipeline_index.chunk_functions: same windows of
+    max_lines, but each chunk is (file_id, start_byte, end_byte), no code
+    """
+    source = store.source(file_id)
+    path = store.paths[file_id]
+    chunks = []
+    for func in functions:
+        start_byte, end_byte = func['start_byte'], func['end_byte']
+        start_line = func['start_line']
+        while start_byte < end_byte:
+            # Walk up to max_lines newlines forward inside the map (no decoding)
+            cursor, lines, content_end = start_byte, 0, end_byte
+            while lines < max_lines and cursor < end_byte:
+                newline = source.find(b'\n', cursor, end_byte)
+                lines += 1
+                if newline == -1:
+                    content_end, cursor = end_byte, end_byte
+                else:
+                    content_end, cursor = newline, newline + 1
+            chunks.append({
+                'file': path,
+                'file_id': file_id,
+                'function': func['name'],
+                'start_line': start_line,
+                'end_line': start_line + lines - 1,
+                'start_byte': start_byte,
+                'end_byte': content_end,  # same text as chunk_functions: no trailing newline
+            })
+            start_line += lines
+            start_byte = cursor
+    return chunks
+
+
+# Main execution
+if __name__ == "__main__":
+    import sys
+    import tracemalloc
+
+    from pipeline_index import EXPERIMENTS_DIR, chunk_functions, discover_files, parse_python_file
+
+    root = sys.argv[1] if len(sys.argv) > 1 else EXPERIMENTS_DIR
+    files = list(discover_files(root))
+
+    print("=" * 70)
+    print("ZERO-COPY SOURCE STORE")
+    print("=" * 70)
+
+    tracemalloc.start()
+    string_chunks = []
+    for path in files:
+        string_chunks.extend(chunk_functions(path, parse_python_file(path)))
+    _, string_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    store = SourceStore()
+    ref_chunks = []
+    for path in files:
+        file_id = store.add(path)
+        ref_chunks.extend(chunk_refs(store, file_id, store.parse(file_id)))
+    _, ref_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"\n  {len(files)} files, {len(ref_chunks)} chunks")
+    print(f"  str chunks  (read_file + decode): {string_peak / 1024:8.1f} KB peak Python memory")
+    print(f"  byte ranges (mmap + views):       {ref_peak / 1024:8.1f} KB peak Python memory")
+
+    sample = ref_chunks[0]
+    print(f"\n🔹 Decoded on demand: {sample['function']} "
+          f"({sample['end_byte'] - sample['start_byte']} bytes)")
+    print(store.text(sample)[:120] + "...")
+    store.close()
+    print("\n✅ Code is only decoded when it is embedded or shown!")
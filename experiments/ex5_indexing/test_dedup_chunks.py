@@ -0,0 +1,54 @@
+"""
+Test: copies are collapsed, templated functions with different names are not
+
+Run with:  python test_dedup_chunks.py   (or: pytest test_dedup_chunks.py)
+"""
+
+from dedup_chunks import NearDuplicateIndex, dedup_chunks
+
+TEMPLATE = '''def handle_{0}(request):
+    """Handle the {0} endpoint"""
+    payload = request.json()
+    validate(payload, schema=SCHEMAS['{0}'])
+    return respond(process(payload), status=200)'''
+
+
+def chunk(name, file='handlers.py', code=None):
+    return {'file': file, 'function': name, 'start_line': 1, 'code': code or TEMPLATE.format(name)}
+
+
+def test_templated_functions_with_different_names_stay_separate():
+    names = [f"resource_{i}" for i in range(20)]
+    canonicals, index = dedup_chunks([chunk(name) for name in names])
+    assert [c['function'] for c in canonicals] == names
+    assert index.duplicates == 0
+
+
+def test_copies_and_reformatted_copies_are_collapsed():
+    code = TEMPLATE.format('users')
+    chunks = [chunk('handle_users', 'api.py', code),
+              chunk('handle_users', 'vendor/api.py', code),
+              chunk('handle_users', 'legacy/api.py', code.replace('    ', '  '))]
+    canonicals, index = dedup_chunks(chunks)
+    assert len(canonicals) == 1
+    assert [loc['file'] for loc in canonicals[0]['locations']] == ['api.py', 'vendor/api.py', 'legacy/api.py']
+
+
+def test_stats_report_gross_savings_and_cost_separately():
+    index = NearDuplicateIndex()
+    for _ in range(3):
+        index.add(chunk('handle_users'))
+    stats = index.stats(embed_seconds_per_chunk=0.0)
+    assert stats['duplicates'] == 2
+    assert stats['embed_seconds_saved'] == 0.0  # never negative, even when dedup cost more
+    assert stats['dedup_seconds'] > 0.0
+
+
+# Main execution
+if __name__ == "__main__":
+    for test in (test_templated_functions_with_different_names_stay_separate,
+                 test_copies_and_reformatted_copies_are_collapsed,
+                 test_stats_report_gross_savings_and_cost_separately):
+        test()
+        print(f"✓ {test.__name__}")
+    print("\n✅ Dedup tests passed!")
@@ -0,0 +1,127 @@
+"""
+Test: queries keep working while the index is rebuilt and swapped
+
+Runs a sustained query load from several threads while snapshots are
+rebuilt and published, then checks that no query failed and that p99
+latency stayed bounded.
+
+Run with:  python test_snapshot_swap.py   (or: pytest test_snapshot_swap.py)
+"""
+
+import tempfile
+import threading
+import time
+
+import faiss
+import numpy as np
+
+from snapshot_store import SnapshotStore
+
+DIMENSION = 64
+N_VECTORS = 20_000
+READERS = 4
+REBUILDS = 3
+P99_BUDGET_MS = 250.0
+
+
+def build_snapshot(seed):
+    rng = np.random.default_rng(seed)
+    index = faiss.IndexFlatL2(DIMENSION)
+    index.add(rng.random((N_VECTORS, DIMENSION), dtype='float32'))
+    return index, [{'function': f'func_{seed}_{i}'} for i in range(N_VECTORS)]
+
+
+def run_query_load_during_rebuilds():
+    """Returns (latencies_ms, errors, versions_seen, final_version)"""
+    with tempfile.TemporaryDirectory() as root:
+        store = SnapshotStore(root)
+        store.publish(*build_snapshot(0))
+
+        latencies, errors, versions_seen = [], [], set()
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def query_loop(seed):
+            rng = np.random.default_rng(seed)
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    with store.reader() as snapshot:
+                        hits = snapshot.search(rng.random((1, DIMENSION), dtype='float32'), k=5)
+                        assert len(hits[0]) == 5
+                        version = snapshot.version
+                except Exception as e:
+                    with lock:
+                        errors.append(e)
+                    continue
+                with lock:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    versions_seen.add(version)
+
+        readers = [threading.Thread(target=query_loop, args=(100 + i,)) for i in range(READERS)]
+        for thread in readers:
+            thread.start()
+        for rebuild in range(1, REBUILDS + 1):
+            thread, _ = store.rebuild_async(lambda seed=rebuild: build_snapshot(seed))
+            thread.join()
+        time.sleep(0.1)  # some queries against the final snapshot too
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+        return latencies, errors, versions_seen, store.current_version()
+
+
+def test_concurrent_publishes_get_distinct_versions():
+    with tempfile.TemporaryDirectory() as root:
+        store = SnapshotStore(root, keep_versions=10)
+        index = faiss.IndexFlatL2(DIMENSION)
+        index.add(np.zeros((10, DIMENSION), dtype='float32'))
+        versions, start = [], threading.Barrier(8)
+
+        def publish():
+            start.wait()
+            versions.append(store.publish(index, [{'function': 'f'}] * 10))
+
+        threads = [threading.Thread(target=publish) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(versions) == [f"v{i:06d}" for i in range(1, 9)]
+        assert store.current_version() == "v000008"
+
+
+def test_failed_rebuild_is_reported_and_old_snapshot_kept():
+    with tempfile.TemporaryDirectory() as root:
+        store = SnapshotStore(root)
+        store.publish(*build_snapshot(0))
+
+        def broken_build():
+            raise RuntimeError("embedding service down")
+
+        thread, result = store.rebuild_async(broken_build)
+        thread.join()
+        assert isinstance(result.get('error'), RuntimeError)
+        assert 'version' not in result
+        assert store.current_version() == "v000001"
+
+
+def test_queries_survive_rebuilds():
+    latencies, errors, versions_seen, final_version = run_query_load_during_rebuilds()
+    p99 = float(np.percentile(latencies, 99))
+    assert not errors, f"{len(errors)} queries failed, first: {errors[0]!r}"
+    assert len(versions_seen) > 1, "queries never observed a swap"
+    assert p99 < P99_BUDGET_MS, f"p99 {p99:.1f} ms over budget"
+    assert final_version == f"v{REBUILDS + 1:06d}"
+
+
+if __name__ == "__main__":
+    test_concurrent_publishes_get_distinct_versions()
+    print("✓ Concurrent publishes get distinct versions")
+    test_failed_rebuild_is_reported_and_old_snapshot_kept()
+    print("✓ A failed rebuild is reported and the old snapshot keeps serving")
+    print("Testing snapshot swaps under query load...")
+    test_queries_survive_rebuilds()
+    print("✓ No query errors and p99 within budget")
+    print("✅ Snapshot swap test passed!")
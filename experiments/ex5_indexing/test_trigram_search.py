@@ -0,0 +1,54 @@
+"""
+Test: the trigram prefilter never drops a file the regex actually matches
+
+Run with:  python test_trigram_search.py   (or: pytest test_trigram_search.py)
+"""
+
+import re
+
+from trigram_search import TrigramIndex, required_literals
+
+FILES = {
+    'config.py': b"Secret_KEY = os.environ['SECRET']\n",
+    'auth.py': b"def get_user(token):\n    return jwt.decode(token, SECRET_KEY)\n",
+    'views.py': b"def set_user(request):\n    return render(request)\n",
+}
+
+
+def build():
+    return TrigramIndex.build(list(FILES), read_fn=FILES.__getitem__)
+
+
+def matching_files(pattern):
+    regex = re.compile(pattern.encode('utf8'))
+    return sorted(path for path, data in FILES.items() if regex.search(data))
+
+
+def test_inline_ignorecase_group_yields_no_literal():
+    assert required_literals(r'(?i:secret)_KEY') == [['_KEY']]
+    assert required_literals(r'(?i)secret_key') == [[]]
+
+
+def test_inline_ignorecase_match_is_found():
+    index = build()
+    results = index.search(r'(?i:secret)_KEY', is_regex=True, read_fn=FILES.__getitem__)
+    assert sorted({hit['file'] for hit in results}) == matching_files(r'(?i:secret)_KEY')
+    assert 'config.py' in {hit['file'] for hit in results}
+
+
+def test_prefilter_keeps_every_true_match():
+    index = build()
+    for pattern in (r'def (get|set)_user\(', r'jwt\.decode\(', r'(?i:SECRET)_key|SECRET_KEY',
+                    r'SECRET(?i:_key)', r'[Ss]ecret_KEY'):
+        candidates = {index.files[i] for i in index.candidate_files(pattern, is_regex=True)}
+        assert set(matching_files(pattern)) <= candidates, pattern
+
+
+# Main execution
+if __name__ == "__main__":
+    for test in (test_inline_ignorecase_group_yields_no_literal,
+                 test_inline_ignorecase_match_is_found,
+                 test_prefilter_keeps_every_true_match):
+        test()
+        print(f"✓ {test.__name__}")
+    print("\n✅ Trigram search tests passed!")
@@ -0,0 +1,259 @@
+"""
+Exercise 13: Trigram Index for Exact and Regex Code Search
+Goal: Answer `jwt.decode(` or SECRET_KEY style queries without grepping every file
+
+Semantic search is the wrong tool for exact identifiers. A trigram index
+maps every 3-byte sequence to the files containing it:
+
+    "jwt.decode(" -> {"jwt", "wt.", "t.d", ".de", ...} -> intersect postings
+
+Only the few files that contain every trigram are actually scanned, and
+each match is mapped back to its enclosing function/class chunk so exact
+hits can go into the same context packer as vector hits.
+
+Postings are stored CSR-style (sorted trigram keys + indptr + file ids) as
+.npy files and can be memory-mapped.
+"""
+
+import os
+import re
+import sys
+
+import numpy as np
+
+from pipeline_index import chunk_functions, discover_files, load_parse_code
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+try:
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_constants
+
+
+def file_trigrams(data):
+    """Sorted unique trigrams of a byte string, packed into 24-bit ints"""
+    if len(data) < 3:
+        return np.zeros(0, dtype='uint32')
+    b = np.frombuffer(data, dtype='uint8').astype('uint32')
+    return np.unique((b[:-2] << 16) | (b[1:-1] << 8) | b[2:])
+
+
+def literal_trigrams(literal):
+    return file_trigrams(literal.encode('utf8') if isinstance(literal, str) else literal)
+
+
+# ============================================================================
+# REGEX -> REQUIRED LITERALS
+# ============================================================================
+
+def required_literals(pattern):
+    """
+    Literal strings a regex match must contain, as alternatives of AND-sets
+
+    Returns a list of alternatives; each is a list of literals that must all
+    appear. An alternative with no literals (e.g. `.*`) means "can't filter".
+    `def (get|set)_user` -> [['def ', 'get', '_user'], ['def ', 'set', '_user']]
+    """
+    parsed = sre_parse.parse(pattern)
+    state = getattr(parsed, 'state', None) or parsed.pattern  # renamed in Python 3.11
+    if state.flags & re.IGNORECASE:
+        return [[]]
+    return _sequence_literals(list(parsed))
+
+
+def _sequence_literals(items):
+    """AND-literals for a sequence of regex items, branching on alternations"""
+    alternatives = [([], '')]  # (finished literals, current run)
+    for op, arg in items:
+        if op is sre_constants.LITERAL:
+            alternatives = [(done, run + chr(arg)) for done, run in alternatives]
+            continue
+
+        # Anything else ends the current literal run
+        alternatives = [(done + [run] if run else done, '') for done, run in alternatives]
+        inner = None
+        if op is sre_constants.SUBPATTERN:
+            group, add_flags, del_flags, subpattern = arg
+            if add_flags & re.IGNORECASE:
+                continue  # (?i:...) matches any case: its literals can't filter trigrams
+            inner = _sequence_literals(list(subpattern))
+        elif op is sre_constants.BRANCH:
+            inner = [alt for branch in arg[1] for alt in _sequence_literals(list(branch))]
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and arg[0] >= 1:
+            inner = _sequence_literals(list(arg[2]))
+        if inner:
+            if len(alternatives) * len(inner) > 64:  # don't explode on big alternations
+                continue
+            alternatives = [(done + extra, '') for done, _ in alternatives for extra in inner]
+
+    return [done + [run] if run else done for done, run in alternatives]
+
+
+# ============================================================================
+# INDEX
+# ============================================================================
+
+class TrigramIndex:
+    """Trigram -> file id postings in CSR form"""
+
+    def __init__(self, files, keys, indptr, postings):
+        self.files = files          # file id -> path
+        self.keys = keys            # sorted uint32 trigrams
+        self.indptr = indptr        # keys[i] postings are postings[indptr[i]:indptr[i+1]]
+        self.postings = postings    # int32 file ids, sorted within each trigram
+        self.chunk_ranges = {}      # path -> [(start_line, end_line, chunk)]
+
+    @classmethod
+    def build(cls, paths, read_fn=None):
+        read_fn = read_fn or load_parse_code().read_file
+        files, all_trigrams, all_file_ids = [], [], []
+        for file_id, path in enumerate(paths):
+            trigrams = file_trigrams(read_fn(path))
+            files.append(path)
+            all_trigrams.append(trigrams)
+            all_file_ids.append(np.full(len(trigrams), file_id, dtype='int32'))
+        trigrams = np.concatenate(all_trigrams) if all_trigrams else np.zeros(0, dtype='uint32')
+        file_ids = np.concatenate(all_file_ids) if all_file_ids else np.zeros(0, dtype='int32')
+        order = np.lexsort((file_ids, trigrams))
+        trigrams, file_ids = trigrams[order], file_ids[order]
+        keys, starts = np.unique(trigrams, return_index=True)
+        indptr = np.append(starts, len(trigrams)).astype('int64')
+        return cls(files, keys, indptr, file_ids)
+
+    def postings_for(self, trigram):
+        i = np.searchsorted(self.keys, trigram)
+        if i >= len(self.keys) or self.keys[i] != trigram:
+            return np.zeros(0, dtype='int32')
+        return self.postings[self.indptr[i]:self.indptr[i + 1]]
+
+    def candidates(self, literals):
+        """File ids containing every trigram of every literal (None = no filter possible)"""
+        trigrams = np.unique(np.concatenate(
+            [literal_trigrams(lit) for lit in literals] or [np.zeros(0, dtype='uint32')]))
+        if len(trigrams) == 0:
+            return None
+        lists = sorted((self.postings_for(t) for t in trigrams), key=len)
+        result = lists[0]
+        for postings in lists[1:]:
+            if len(result) == 0:
+                break
+            result = np.intersect1d(result, postings, assume_unique=True)
+        return result
+
+    def candidate_files(self, pattern, is_regex=False):
+        if not is_regex:
+            ids = self.candidates([pattern])
+            return range(len(self.files)) if ids is None else ids.tolist()
+        union = set()
+        for literals in required_literals(pattern):
+            ids = self.candidates(literals)
+            if ids is None:
+                return range(len(self.files))
+            union.update(ids.tolist())
+        return sorted(union)
+
+    # ------------------------------------------------------------- chunk mapping
+
+    def attach_chunks(self, chunks):
+        """Remember chunk line ranges so matches map to their enclosing chunk"""
+        self.chunk_ranges = {}
+        for chunk in chunks:
+            self.chunk_ranges.setdefault(chunk['file'], []).append(
+                (chunk['start_line'], chunk['end_line'], chunk))
+
+    def enclosing_chunk(self, path, line):
+        """Smallest chunk whose line range contains line"""
+        best = None
+        for start, end, chunk in self.chunk_ranges.get(path, ()):
+            if start <= line <= end and (best is None or end - start < best[1] - best[0]):
+                best = (start, end, chunk)
+        return best[2] if best else None
+
+    # -------------------------------------------------------------------- search
+
+    def search(self, pattern, is_regex=False, max_results=50, read_fn=None):
+        """Verified matches: [{'file', 'line', 'match', 'chunk'}]"""
+        read_fn = read_fn or load_parse_code().read_file
+        regex = re.compile(pattern.encode('utf8') if is_regex else re.escape(pattern.encode('utf8')))
+        results = []
+        for file_id in self.candidate_files(pattern, is_regex):
+            path = self.files[file_id]
+            data = read_fn(path)
+            for match in regex.finditer(data):
+                line = data.count(b'\n', 0, match.start()) + 1
+                results.append({
+                    'file': path,
+                    'line': line,
+                    'match': match.group(0).decode('utf8', errors='replace'),
+                    'chunk': self.enclosing_chunk(path, line),
+                })
+                if len(results) >= max_results:
+                    return results
+        return results
+
+    # --------------------------------------------------------------- persistence
+
+    def save(self, out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+        np.save(os.path.join(out_dir, 'trigram_keys.npy'), self.keys)
+        np.save(os.path.join(out_dir, 'trigram_indptr.npy'), self.indptr)
+        np.save(os.path.join(out_dir, 'trigram_postings.npy'), self.postings)
+        with open(os.path.join(out_dir, 'trigram_files.txt'), 'w', encoding='utf8') as f:
+            f.write('\n'.join(self.files))
+
+    @classmethod
+    def load(cls, out_dir, mmap=True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(out_dir, 'trigram_files.txt'), encoding='utf8') as f:
+            files = f.read().split('\n')
+        return cls(files,
+                   np.load(os.path.join(out_dir, 'trigram_keys.npy'), mmap_mode=mode),
+                   np.load(os.path.join(out_dir, 'trigram_indptr.npy'), mmap_mode=mode),
+                   np.load(os.path.join(out_dir, 'trigram_postings.npy'), mmap_mode=mode))
+
+
+def build_for_repository(root, parse_fn=None):
+    """Trigram index over every Python file, with function chunks attached"""
+    from pipeline_index import parse_python_file
+    parse_fn = parse_fn or parse_python_file
+    paths = list(discover_files(root))
+    index = TrigramIndex.build(paths)
+    chunks = []
+    for path in paths:
+        try:
+            chunks.extend(chunk_functions(path, parse_fn(path)))
+        except Exception as e:
+            print(f"⚠️  Could not parse {path}: {e}")
+    index.attach_chunks(chunks)
+    return index
+
+
+# Main execution
+if __name__ == "__main__":
+    from pipeline_index import EXPERIMENTS_DIR
+
+    root = sys.argv[1] if len(sys.argv) > 1 else EXPERIMENTS_DIR
+    queries = [('jwt.decode(', False), ('SECRET_KEY', False), (r'def (get|create)_user\(', True)]
+
+    print("=" * 70)
+    print("TRIGRAM CODE SEARCH")
+    print("=" * 70)
+
+    index = build_for_repository(root)
+    print(f"\n✓ {len(index.files)} files, {len(index.keys)} distinct trigrams, "
+          f"{len(index.postings)} postings")
+
+    for pattern, is_regex in queries:
+        candidates = index.candidate_files(pattern, is_regex)
+        results = index.search(pattern, is_regex)
+        print(f"\n🔍 {'regex' if is_regex else 'literal'}: {pattern}")
+        print(f"   scanned {len(candidates)}/{len(index.files)} files, {len(results)} matches")
+        for hit in results[:5]:
+            where = hit['chunk']['function'] if hit['chunk'] else '<module level>'
+            print(f"   {os.path.relpath(hit['file'], root)}:{hit['line']}  in {where}")
+
+    print("\n✅ Trigram search complete!")
@@ -0,0 +1,391 @@
+"""
+Exercise 7: Benchmarking the RAG Pipeline
+Goal: Measure parse, embed, index and query speed on a synthetic codebase
+
+Everything runs offline: the codebase is generated from templates in the
+style of sample_code.py and the default embedder is a deterministic hashing
+embedder, so results are reproducible and comparable between releases.
+
+Usage:
+    python benchmark.py --files 200 --functions 10 --output results.json
+    python benchmark.py --embedder all-MiniLM-L6-v2   # real model instead of the fake one
+    python benchmark.py --llm llama3.2                 # also measure answer latency via Ollama
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+EXPERIMENTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(EXPERIMENTS_DIR, 'ex5_indexing'))
+
+import tracing
+from pipeline_index import chunk_functions, discover_files, load_embedder, parse_python_file
+
+BENCHMARK_VERSION = 3  # 2: answer latency split into cold start and warm; 3: embed_cold_ms taken before any warm-up
+
+# ============================================================================
+# SYNTHETIC CODEBASE
+# ============================================================================
+
+ENTITIES = ['user', 'token', 'payment', 'order', 'invoice', 'session', 'email',
+            'report', 'cart', 'account', 'profile', 'webhook']
+ACTIONS = ['validate', 'create', 'fetch', 'update', 'delete', 'process',
+           'calculate', 'send', 'verify', 'refresh', 'archive', 'export']
+
+FUNCTION_TEMPLATE = '''
+def {action}_{entity}_{n}({entity}_id: int, data: dict, strict: bool = True) -> bool:
+    """
+    {Action} a {entity} record and report whether it succeeded.
+
+    Args:
+        {entity}_id: ID of the {entity}
+        data: Fields to {action}
+    """
+    {entity} = get_{entity}({entity}_id)
+    if {entity} is None:
+        return False
+    if strict and not validate_schema(data):
+        raise ValueError("Invalid {entity} data")
+    total = sum(item.get('amount', 0) for item in data.get('items', []))
+    {entity}.update(data, total=total)
+    log_event("{action}_{entity}", {entity}_id)
+    return True
+'''
+
+CLASS_TEMPLATE = '''
+
+class {Entity}Manager{n}:
+    """Manages {entity} operations"""
+
+    def __init__(self, db_connection):
+        self.db = db_connection
+
+    def get_{entity}(self, {entity}_id: int):
+        """Retrieve {entity} by ID"""
+        return self.db.query("SELECT * FROM {entity}s WHERE id = ?", {entity}_id)
+'''
+
+
+def generate_codebase(out_dir, n_files=100, functions_per_file=10, seed=42):
+    """Write n_files Python modules built from templates; returns the file paths"""
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(n_files):
+        entity = rng.choice(ENTITIES)
+        parts = ['"""Generated module {} for benchmarking"""\n\nimport os\n'.format(i)]
+        for n in range(functions_per_file):
+            action = rng.choice(ACTIONS)
+            parts.append(FUNCTION_TEMPLATE.format(
+                action=action, Action=action.capitalize(),
+                entity=rng.choice(ENTITIES), n=n))
+        parts.append(CLASS_TEMPLATE.format(entity=entity, Entity=entity.capitalize(), n=i))
+        path = os.path.join(out_dir, f"{entity}_module_{i}.py")
+        with open(path, 'w', encoding='utf8') as f:
+            f.write(''.join(parts))
+        paths.append(path)
+    return paths
+
+
+def generate_queries(n_queries=100, seed=7):
+    """Natural-language questions over the synthetic vocabulary"""
+    rng = random.Random(seed)
+    return [f"Where do we {rng.choice(ACTIONS)} the {rng.choice(ENTITIES)}?"
+            for _ in range(n_queries)]
+
+
+# ============================================================================
+# EMBEDDERS AND PARSERS
+# ============================================================================
+
+def hashing_embedder(dimension=384):
+    """
+    Deterministic fake embedder: hashes word tokens into a fixed-size vector
+
+    Not semantically smart, but fast, offline and stable between runs,
+    which is exactly what a regression benchmark needs.
+    """
+    token_re = re.compile(r'[A-Za-z]+')
+
+    def embed(texts):
+        vectors = np.zeros((len(texts), dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            for token in token_re.findall(text.lower()):
+                digest = hashlib.blake2b(token.encode('utf8'), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], 'little') % dimension
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    embed.dimension = dimension
+    return embed
+
+
+def parse_with_ast(filepath):
+    """Fallback parser using the stdlib ast module (when tree-sitter grammars aren't built)"""
+    with open(filepath, 'r', encoding='utf8') as f:
+        source = f.read()
+    functions = []
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions.append({
+                'name': node.name,
+                'parameters': '',
+                'docstring': ast.get_docstring(node),
+                'start_line': node.lineno,
+                'end_line': node.end_lineno,
+                'code': ast.get_source_segment(source, node),
+            })
+    return functions
+
+
+# ============================================================================
+# MEASUREMENTS
+# ============================================================================
+
+def percentile(values, p):
+    """p-th percentile (0-100) of a list of numbers"""
+    if not values:
+        return 0.0
+    return float(np.percentile(np.asarray(values, dtype='float64'), p))
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None where unsupported)"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def bench_parse(files, parse_fn):
+    start = time.perf_counter()
+    chunks = []
+    for path in files:
+        chunks.extend(chunk_functions(path, parse_fn(path)))
+    seconds = time.perf_counter() - start
+    return chunks, {
+        'files': len(files),
+        'chunks': len(chunks),
+        'seconds': seconds,
+        'files_per_sec': len(files) / seconds if seconds else 0.0,
+    }
+
+
+def bench_embed(chunks, embed_fn, batch_size=64):
+    texts = [c['code'] for c in chunks]
+    start = time.perf_counter()
+    batches = [embed_fn(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+    seconds = time.perf_counter() - start
+    vectors = np.vstack(batches).astype('float32')
+    return vectors, {
+        'chunks': len(texts),
+        'batch_size': batch_size,
+        'seconds': seconds,
+        'chunks_per_sec': len(texts) / seconds if seconds else 0.0,
+    }
+
+
+def bench_index(vectors):
+    start = time.perf_counter()
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    seconds = time.perf_counter() - start
+    return index, {
+        'vectors': index.ntotal,
+        'dimension': vectors.shape[1],
+        'seconds': seconds,
+        'index_bytes': vectors.nbytes,
+    }
+
+
+def bench_queries(index, embed_fn, queries, k=5):
+    """Embed + search one query at a time, as a user would"""
+    embed_ms, search_ms, total_ms = [], [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        with tracing.span("embed"):
+            query_vector = np.asarray(embed_fn([query]), dtype='float32').reshape(1, -1)
+        t1 = time.perf_counter()
+        with tracing.span("search"):
+            index.search(query_vector, k)
+        t2 = time.perf_counter()
+        embed_ms.append((t1 - t0) * 1000)
+        search_ms.append((t2 - t1) * 1000)
+        total_ms.append((t2 - t0) * 1000)
+    return {
+        'queries': len(queries),
+        'k': k,
+        'embed_p50_ms': percentile(embed_ms, 50),
+        'search_p50_ms': percentile(search_ms, 50),
+        'search_p99_ms': percentile(search_ms, 99),
+        'p50_ms': percentile(total_ms, 50),
+        'p99_ms': percentile(total_ms, 99),
+    }
+
+
+def bench_answers(index, embed_fn, chunks, queries, model, k=3):
+    """
+    End-to-end answer latency through Ollama (optional, needs a running server)
+
+    The model is unloaded first, so the first query shows the cold start;
+    then it is warmed up (with keep_alive) and the rest are timed warm.
+    Prompts use the stable-prefix layout from ex3_llm/warm_start.py.
+    """
+    import ollama
+
+    sys.path.insert(0, os.path.join(EXPERIMENTS_DIR, 'ex3_llm'))
+    from warm_start import KEEP_ALIVE, build_rag_messages, warm_up_ollama
+
+    def answer(query):
+        start = time.perf_counter()
+        with tracing.span("query"):
+            with tracing.span("embed"):
+                query_vector = np.asarray(embed_fn([query]), dtype='float32').reshape(1, -1)
+            with tracing.span("search"):
+                _, indices = index.search(query_vector, k)
+            with tracing.span("pack_context"):
+                messages = build_rag_messages(query, [chunks[i] for i in indices[0] if i >= 0])
+            with tracing.span("generate"):
+                ollama.chat(model=model, messages=messages, keep_alive=KEEP_ALIVE,
+                            options={"temperature": 0.0, "num_predict": 64})
+        return (time.perf_counter() - start) * 1000
+
+    ollama.generate(model=model, prompt='', keep_alive=0)  # unload: measure a true cold start
+    cold_ms = answer(queries[0])
+    ollama.generate(model=model, prompt='', keep_alive=0)
+    warm_up = warm_up_ollama(model)
+    latencies = [answer(query) for query in queries]
+    return {
+        'model': model,
+        'queries': len(queries),
+        'cold_ms': cold_ms,
+        'warm_up_seconds': warm_up['load_seconds'] + warm_up['prefix_seconds'],
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+    }
+
+
+def run_benchmark(n_files=100, functions_per_file=10, n_queries=200, k=5,
+                  embedder='hashing', parser='tree-sitter', batch_size=64,
+                  llm=None, llm_queries=5, workdir=None):
+    """Run every measurement and return one JSON-serialisable results dict"""
+    embed_fn = hashing_embedder() if embedder == 'hashing' else load_embedder(embedder, warm_up=False)
+    # The model's very first encode, before bench_embed warms it: the real cold start
+    start = time.perf_counter()
+    embed_fn(generate_queries(1))
+    embed_cold_ms = (time.perf_counter() - start) * 1000
+    parse_fn = parse_python_file if parser == 'tree-sitter' else parse_with_ast
+
+    with tempfile.TemporaryDirectory(dir=workdir) as codebase_dir:
+        generate_codebase(codebase_dir, n_files, functions_per_file)
+        files = list(discover_files(codebase_dir))
+
+        chunks, parse_result = bench_parse(files, parse_fn)
+        vectors, embed_result = bench_embed(chunks, embed_fn, batch_size)
+        index, index_result = bench_index(vectors)
+        query_result = bench_queries(index, embed_fn, generate_queries(n_queries), k)
+        query_result['embed_cold_ms'] = embed_cold_ms
+        answer_result = None
+        if llm:
+            answer_result = bench_answers(index, embed_fn, chunks,
+                                          generate_queries(llm_queries), llm)
+    return {
+        'benchmark_version': BENCHMARK_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'faiss': faiss.__version__,
+            'numpy': np.__version__,
+        },
+        'config': {
+            'files': n_files,
+            'functions_per_file': functions_per_file,
+            'queries': n_queries,
+            'k': k,
+            'embedder': embedder,
+            'parser': parser,
+            'batch_size': batch_size,
+        },
+        'parse': parse_result,
+        'embed': embed_result,
+        'index': index_result,
+        'query': query_result,
+        'answer': answer_result,
+        # ru_maxrss rather than tracemalloc: tracing every allocation would skew the timings
+        'memory': {
+            'peak_rss_mb': peak_rss_mb(),
+        },
+    }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Benchmark the code RAG pipeline")
+    arg_parser.add_argument('--files', type=int, default=100)
+    arg_parser.add_argument('--functions', type=int, default=10, help="functions per file")
+    arg_parser.add_argument('--queries', type=int, default=200)
+    arg_parser.add_argument('--k', type=int, default=5)
+    arg_parser.add_argument('--batch-size', type=int, default=64)
+    arg_parser.add_argument('--embedder', default='hashing',
+                            help="'hashing' (offline fake) or a SentenceTransformer model name")
+    arg_parser.add_argument('--parser', choices=['tree-sitter', 'ast'], default='tree-sitter')
+    arg_parser.add_argument('--llm', default=None, help="Ollama model for answer latency (optional)")
+    arg_parser.add_argument('--output', default=None, help="write JSON results to this file")
+    arg_parser.add_argument('--trace', action='store_true', help="print per-span latencies (tracing.py)")
+    args = arg_parser.parse_args(argv)
+    if args.trace:
+        tracing.enable()
+
+    print("=" * 70)
+    print("RAG PIPELINE BENCHMARK")
+    print("=" * 70)
+    print(f"\n📦 {args.files} files x {args.functions} functions, "
+          f"embedder={args.embedder}, parser={args.parser}\n")
+
+    results = run_benchmark(
+        n_files=args.files, functions_per_file=args.functions, n_queries=args.queries,
+        k=args.k, embedder=args.embedder, parser=args.parser,
+        batch_size=args.batch_size, llm=args.llm)
+
+    print(f"  Parse:  {results['parse']['files_per_sec']:10.1f} files/sec")
+    print(f"  Embed:  {results['embed']['chunks_per_sec']:10.1f} chunks/sec")
+    print(f"  Index:  {results['index']['seconds'] * 1000:10.2f} ms build "
+          f"({results['index']['vectors']} vectors)")
+    print(f"  Query:  {results['query']['p50_ms']:10.3f} ms p50, "
+          f"{results['query']['p99_ms']:.3f} ms p99")
+    if results['answer']:
+        print(f"  Answer: {results['answer']['p50_ms']:10.1f} ms p50, "
+              f"{results['answer']['p99_ms']:.1f} ms p99 warm, "
+              f"{results['answer']['cold_ms']:.1f} ms cold")
+    if results['memory']['peak_rss_mb'] is not None:
+        print(f"  Memory: {results['memory']['peak_rss_mb']:10.1f} MB peak RSS")
+    if args.trace:
+        tracing.report()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+    else:
+        print("\n" + json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Exercise 8: Evaluating Retrieval Quality vs Latency
+Goal: Put a number on what every speed optimization costs in answer quality
+
+Takes a labelled query set (query -> ids of the chunks that should come back)
+and reports recall@k, MRR and nDCG@k next to per-query latency for each
+embedder/index configuration. Configurations are built in parallel and share
+an on-disk embedding cache, so re-running with a new index type only pays for
+the search; the timed queries then run one configuration at a time, so no
+configuration's latency is measured while another one competes for the CPU.
+
+Labelled set format (JSON):
+    {
+      "chunks":  [{"id": "auth.py:authenticate_user", "code": "...", ...}, ...],
+      "queries": [{"query": "Where is user authentication handled?",
+                   "relevant": ["auth.py:authenticate_user", ...]}, ...]
+    }
+
+Configurations (JSON list, or the defaults below):
+    [{"name": "flat", "embedder": "all-MiniLM-L6-v2", "index": "Flat"},
+     {"name": "hnsw", "embedder": "all-MiniLM-L6-v2", "index": "HNSW32"}]
+
+"index" is any faiss.index_factory string, so quantized and ANN indexes
+(e.g. "SQ8", "IVF64,PQ16", "HNSW32") can be compared directly with "Flat".
+"reduce" (optional) adds a learned projection to that many dims in front of
+the index, trained on the corpus vectors ("reduce_method": "pca" or "opq"):
+    {"name": "pca128", "embedder": "all-MiniLM-L6-v2", "index": "Flat", "reduce": 128}
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import faiss
+import numpy as np
+
+EXPERIMENTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(EXPERIMENTS_DIR, 'ex5_indexing'))
+
+import tracing
+from benchmark import hashing_embedder, percentile
+from pipeline_index import load_embedder
+
+# Labelled version of the demo in ex1_vectors/faiss_vector_store.py
+DEFAULT_DATASET = {
+    "chunks": [
+        {"id": "auth.py:authenticate_user",
+         "code": "def authenticate_user(token: str) -> bool:\n    return jwt.decode(token, SECRET_KEY)"},
+        {"id": "auth.py:login",
+         "code": "def login(username: str, password: str) -> Token:\n    user = verify_credentials(username, password)"},
+        {"id": "billing.py:calculate_total",
+         "code": "def calculate_total(items: List[Item]) -> float:\n    return sum(item.price for item in items)"},
+        {"id": "middleware.py:verify_token",
+         "code": "def verify_token(token: str) -> dict:\n    try:\n        payload = jwt.decode(token)\n        return payload"},
+        {"id": "notifications.py:send_notification",
+         "code": "def send_notification(user_id: int, message: str):\n    email = get_user_email(user_id)\n    send_email(email, message)"},
+        {"id": "billing.py:process_payment",
+         "code": "def process_payment(amount: float, card: Card) -> bool:\n    return payment_gateway.charge(card, amount)"},
+    ],
+    "queries": [
+        {"query": "Where is user authentication handled?",
+         "relevant": ["auth.py:authenticate_user", "auth.py:login", "middleware.py:verify_token"]},
+        {"query": "How do we process payments?",
+         "relevant": ["billing.py:process_payment"]},
+        {"query": "Show me notification logic",
+         "relevant": ["notifications.py:send_notification"]},
+    ],
+}
+
+DEFAULT_CONFIGS = [
+    {"name": "minilm-flat", "embedder": "all-MiniLM-L6-v2", "index": "Flat"},
+    {"name": "minilm-sq8", "embedder": "all-MiniLM-L6-v2", "index": "SQ8"},
+    {"name": "minilm-hnsw", "embedder": "all-MiniLM-L6-v2", "index": "HNSW32"},
+    # PCA needs at least `reduce` corpus vectors: 4 fits the 6-chunk demo set,
+    # use 64-128 on a real labelled set
+    {"name": "minilm-pca4", "embedder": "all-MiniLM-L6-v2", "index": "Flat", "reduce": 4},
+    {"name": "hashing-flat", "embedder": "hashing", "index": "Flat"},
+]
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+def recall_at_k(retrieved, relevant, k):
+    """Fraction of the relevant chunks that appear in the top k"""
+    if not relevant:
+        return 0.0
+    return len(set(retrieved[:k]) & set(relevant)) / len(relevant)
+
+
+def reciprocal_rank(retrieved, relevant):
+    """1 / rank of the first relevant chunk (0 if none was retrieved)"""
+    for rank, chunk_id in enumerate(retrieved, 1):
+        if chunk_id in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+def ndcg_at_k(retrieved, relevant, k):
+    """Binary-relevance nDCG: rewards relevant chunks that rank near the top"""
+    dcg = sum(1.0 / math.log2(rank + 1)
+              for rank, chunk_id in enumerate(retrieved[:k], 1) if chunk_id in relevant)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(len(relevant), k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+
+# ============================================================================
+# EMBEDDING CACHE
+# ============================================================================
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by (embedder, text), kept in memory and on disk
+
+    Configurations that share an embedder only encode each chunk once, even
+    when they run in parallel; later runs load the vectors from disk, and a
+    changed corpus only re-encodes the chunks whose text changed.
+    """
+
+    def __init__(self, cache_dir='output/embedding_cache'):
+        self.cache_dir = cache_dir
+        self._memory = {}
+        self._embedders = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embedder(self, name):
+        # Loading a model takes seconds: lock only this name, not the whole cache
+        with self._key_lock(f"embedder:{name}"):
+            if name not in self._embedders:
+                self._embedders[name] = hashing_embedder() if name == 'hashing' else load_embedder(name)
+            return self._embedders[name]
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _count(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        tracing.incr("embedding_cache.hits", hits)
+        tracing.incr("embedding_cache.misses", misses)
+
+    def _lookup(self, key):
+        vector = self._memory.get(key)
+        if vector is None:
+            path = os.path.join(self.cache_dir, f"{key}.npy")
+            if os.path.exists(path):
+                vector = self._memory[key] = np.load(path)
+        return vector
+
+    def embed(self, embedder_name, texts):
+        keys = [hashlib.sha256(f"{embedder_name}\0{text}".encode('utf8')).hexdigest() for text in texts]
+        # One encoder call per embedder at a time, so parallel configurations
+        # wait for each other's vectors instead of encoding the same chunks twice
+        with self._key_lock(f"encode:{embedder_name}"):
+            vectors = [self._lookup(key) for key in keys]
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            if missing:
+                encoded = np.asarray(self.embedder(embedder_name)([texts[i] for i in missing]), dtype='float32')
+                os.makedirs(self.cache_dir, exist_ok=True)
+                for i, vector in zip(missing, encoded):
+                    np.save(os.path.join(self.cache_dir, f"{keys[i]}.npy"), vector)
+                    self._memory[keys[i]] = vectors[i] = vector
+        self._count(len(texts) - len(missing), len(missing))
+        return np.stack(vectors) if vectors else np.zeros((0, 0), dtype='float32')
+
+    def embed_one(self, embedder_name, text):
+        """Embed a single query, uncached, so its latency can be measured"""
+        return np.asarray(self.embedder(embedder_name)([text]), dtype='float32').reshape(1, -1)
+
+
+# ============================================================================
+# EVALUATION
+# ============================================================================
+
+def build_index(config, vectors):
+    """
+    Build the FAISS index described by config['index'] (an index_factory string)
+
+    With fewer corpus vectors than config['reduce'] the projection can't be
+    trained: like pipeline_index.IndexWriter, fall back to full vectors
+    (with a warning; the report's dims column shows what was used).
+    """
+    reduce_dim = config.get('reduce')
+    if reduce_dim and len(vectors) < reduce_dim:
+        print(f"⚠️  {config.get('name', config.get('index'))}: only {len(vectors)} vectors, need "
+              f"{reduce_dim} to train a {reduce_dim}-dim projection: using full {vectors.shape[1]}-dim vectors")
+        reduce_dim = None
+    index = faiss.index_factory(reduce_dim or vectors.shape[1], config.get('index', 'Flat'))
+    if reduce_dim:
+        from reduce_dims import reduced_index, train_projection
+        index = reduced_index(train_projection(vectors, reduce_dim, config.get('reduce_method', 'pca')),
+                              index)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def prepare_config(config, dataset, cache):
+    """Embed the corpus and build the index of one configuration; returns (vectors, index, seconds)"""
+    texts = [chunk['code'] for chunk in dataset['chunks']]
+    embedder = config.get('embedder', 'all-MiniLM-L6-v2')
+
+    start = time.perf_counter()
+    vectors = cache.embed(embedder, texts)
+    index = build_index(config, vectors)
+    build_seconds = time.perf_counter() - start
+    cache.embedder(embedder)  # a corpus served from disk must not leave model loading to the first timed query
+    return vectors, index, build_seconds
+
+
+def evaluate_config(config, dataset, cache, k=5, prepared=None):
+    """Run every labelled query against one configuration (prepared: from prepare_config)"""
+    chunk_ids = [chunk['id'] for chunk in dataset['chunks']]
+    embedder = config.get('embedder', 'all-MiniLM-L6-v2')
+    vectors, index, build_seconds = prepared or prepare_config(config, dataset, cache)
+
+    per_query = []
+    for labelled in dataset['queries']:
+        relevant = set(labelled['relevant'])
+        t0 = time.perf_counter()
+        with tracing.span("embed"):
+            query_vector = cache.embed_one(embedder, labelled['query'])
+        t1 = time.perf_counter()
+        with tracing.span("search"):
+            _, indices = index.search(query_vector, k)
+        t2 = time.perf_counter()
+        retrieved = [chunk_ids[i] for i in indices[0] if i >= 0]
+        per_query.append({
+            'query': labelled['query'],
+            'retrieved': retrieved,
+            f'recall@{k}': recall_at_k(retrieved, relevant, k),
+            'mrr': reciprocal_rank(retrieved, relevant),
+            f'ndcg@{k}': ndcg_at_k(retrieved, relevant, k),
+            'embed_ms': (t1 - t0) * 1000,
+            'search_ms': (t2 - t1) * 1000,
+        })
+
+    def mean(key):
+        return sum(q[key] for q in per_query) / len(per_query) if per_query else 0.0
+
+    latencies = [q['embed_ms'] + q['search_ms'] for q in per_query]
+    return {
+        'config': config,
+        'k': k,
+        f'recall@{k}': mean(f'recall@{k}'),
+        'mrr': mean('mrr'),
+        f'ndcg@{k}': mean(f'ndcg@{k}'),
+        'latency_p50_ms': percentile(latencies, 50),
+        'latency_p99_ms': percentile(latencies, 99),
+        'search_p50_ms': percentile([q['search_ms'] for q in per_query], 50),
+        'build_seconds': build_seconds,
+        'dimension': index.index.d if isinstance(index, faiss.IndexPreTransform) else index.d,
+        'index_bytes': faiss.serialize_index(index).nbytes,
+        'queries': per_query,
+    }
+
+
+def run_evaluation(dataset, configs, k=5, parallel=4, cache_dir='output/embedding_cache'):
+    """
+    Evaluate all configurations against one labelled set
+
+    Corpus embedding and index builds run in `parallel` threads; the timed
+    query pass is serial so per-query latencies are measured without
+    contention from the other configurations.
+    """
+    cache = EmbeddingCache(cache_dir)
+    with ThreadPoolExecutor(max_workers=max(1, parallel)) as pool:
+        prepared = list(pool.map(lambda config: prepare_config(config, dataset, cache), configs))
+    results = [evaluate_config(config, dataset, cache, k, prepared=ready)
+               for config, ready in zip(configs, prepared)]
+    return {
+        'k': k,
+        'queries': len(dataset['queries']),
+        'chunks': len(dataset['chunks']),
+        'cache': {'hits': cache.hits, 'misses': cache.misses},
+        'results': results,
+    }
+
+
+def print_report(report):
+    k = report['k']
+    print(f"\n  {'config':<16} {'dims':>5} {f'recall@{k}':>9} {'MRR':>6} {f'nDCG@{k}':>8} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'index KB':>9}")
+    for r in report['results']:
+        print(f"  {r['config'].get('name', r['config'].get('index')):<16} {r['dimension']:>5} "
+              f"{r[f'recall@{k}']:>9.3f} {r['mrr']:>6.3f} {r[f'ndcg@{k}']:>8.3f} "
+              f"{r['latency_p50_ms']:>8.2f} {r['latency_p99_ms']:>8.2f} "
+              f"{r['index_bytes'] / 1024:>9.1f}")
+    print(f"\n  Embedding cache: {report['cache']['hits']} hits, {report['cache']['misses']} misses")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency")
+    arg_parser.add_argument('--dataset', help="labelled query set (JSON); defaults to the ex1 demo")
+    arg_parser.add_argument('--configs', help="list of configurations (JSON)")
+    arg_parser.add_argument('--k', type=int, default=5)
+    arg_parser.add_argument('--parallel', type=int, default=4,
+                            help="threads for embedding/index builds (queries are always timed serially)")
+    arg_parser.add_argument('--cache-dir', default='output/embedding_cache')
+    arg_parser.add_argument('--output', help="write the full report as JSON")
+    arg_parser.add_argument('--trace', action='store_true', help="print per-span latencies (tracing.py)")
+    args = arg_parser.parse_args(argv)
+    if args.trace:
+        tracing.enable()
+
+    dataset = DEFAULT_DATASET
+    if args.dataset:
+        with open(args.dataset, encoding='utf8') as f:
+            dataset = json.load(f)
+    configs = DEFAULT_CONFIGS
+    if args.configs:
+        with open(args.configs, encoding='utf8') as f:
+            configs = json.load(f)
+
+    print("=" * 70)
+    print("RETRIEVAL EVALUATION")
+    print("=" * 70)
+    print(f"\n📋 {len(dataset['queries'])} labelled queries over {len(dataset['chunks'])} chunks, "
+          f"{len(configs)} configurations")
+
+    report = run_evaluation(dataset, configs, k=args.k, parallel=args.parallel,
+                            cache_dir=args.cache_dir)
+    print_report(report)
+    if args.trace:
+        tracing.report()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Report written to {args.output}")
+
+    print("\nKey Takeaways:")
+    print("- Every speed trick (quantization, ANN, smaller model) shows its recall cost here")
+    print("- MRR cares about the FIRST good hit, nDCG about the whole ranking")
+    print("- \"reduce\": 128 / 64 shows what a PCA projection costs before you ship it")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Exercise 9: Tracing the RAG Hot Path
+Goal: See where every millisecond goes in parse -> embed -> search -> rerank -> pack -> generate
+
+A tiny instrumentation layer:
+- span("embed")      times a block and records it in a latency histogram
+- incr("cache.hits") bumps a counter (cache hits, tokens in/out, ...)
+- report()           p50/p95/p99 per span plus all counters
+- prometheus_text()  the same data in Prometheus text exposition format
+
+Tracing is OFF unless enable() is called (or RAG_TRACING=1 is set). When off,
+span() returns a shared no-op object and incr() returns immediately, so the
+instrumentation can stay in hot loops in production.
+
+If the opentelemetry package is installed, enable(opentelemetry=True) also
+emits every span to the globally configured OpenTelemetry tracer.
+
+Instrumented for real: pipeline_index.build_index (parse, embed),
+benchmark.py and eval_retrieval.py query loops (embed, search; answers also
+pack_context, generate; both take --trace), prefork_server.SharedState.search
+and the LLM calls in ex3_llm/ollama_llm_call.py. The __main__ demo below
+traces a synthetic query with the same span names.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+# Keep the last N samples per histogram: exact percentiles, bounded memory
+MAX_SAMPLES = 10_000
+
+_enabled = os.getenv('RAG_TRACING', '0') == '1'
+_otel_tracer = None
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+
+class _NoopSpan:
+    """Returned by span() while tracing is disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Histogram:
+    """Latency samples (ms) for one span name"""
+
+    def __init__(self):
+        self.samples = deque(maxlen=MAX_SAMPLES)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def percentile(self, p):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+        return ordered[rank]
+
+
+class _Span:
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self._otel = None
+
+    def __enter__(self):
+        if _otel_tracer is not None:
+            self._otel = _otel_tracer.start_as_current_span(self.name, attributes=self.attributes)
+            self._otel.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, (time.perf_counter() - self._start) * 1000)
+        if exc_type is not None:
+            incr(f"{self.name}.errors")
+        if self._otel is not None:
+            self._otel.__exit__(exc_type, exc, tb)
+        return False
+
+
+# ============================================================================
+# PUBLIC API
+# ============================================================================
+
+def enable(opentelemetry=False):
+    """Turn tracing on (optionally forwarding spans to OpenTelemetry)"""
+    global _enabled, _otel_tracer
+    _enabled = True
+    if opentelemetry:
+        try:
+            from opentelemetry import trace
+        except ImportError:
+            print("⚠️  opentelemetry not installed, keeping local metrics only")
+        else:
+            _otel_tracer = trace.get_tracer("code-rag")
+
+
+def disable():
+    global _enabled, _otel_tracer
+    _enabled = False
+    _otel_tracer = None
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Forget all recorded samples and counters"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def span(name, **attributes):
+    """Context manager timing a block: `with span("search"): ...`"""
+    if not _enabled:
+        return _NOOP
+    return _Span(name, attributes)
+
+
+def traced(name):
+    """Decorator version of span()"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe(name, value_ms):
+    """Record one latency sample directly"""
+    if not _enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(value_ms)
+
+
+def incr(name, value=1):
+    """Bump a counter (cache hits, tokens in/out, ...)"""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def snapshot():
+    """All metrics as a plain dict"""
+    with _lock:
+        spans = {
+            name: {
+                'count': h.count,
+                'mean_ms': h.total / h.count if h.count else 0.0,
+                'p50_ms': h.percentile(50),
+                'p95_ms': h.percentile(95),
+                'p99_ms': h.percentile(99),
+            }
+            for name, h in _histograms.items()
+        }
+        return {'spans': spans, 'counters': dict(_counters)}
+
+
+def _metric_name(name):
+    return 'rag_' + ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def prometheus_text():
+    """Metrics in Prometheus text exposition format (serve it from /metrics)"""
+    data = snapshot()
+    lines = []
+    for name, s in sorted(data['spans'].items()):
+        metric = _metric_name(name) + '_ms'
+        lines.append(f"# TYPE {metric} summary")
+        for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms'), ('0.99', 'p99_ms')):
+            lines.append(f'{metric}{{quantile="{quantile}"}} {s[key]:.6f}')
+        lines.append(f"{metric}_sum {s['mean_ms'] * s['count']:.6f}")
+        lines.append(f"{metric}_count {s['count']}")
+    for name, value in sorted(data['counters'].items()):
+        metric = _metric_name(name) + '_total'
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def report():
+    """Print a latency/counter table"""
+    data = snapshot()
+    print(f"\n  {'span':<16} {'count':>7} {'mean ms':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, s in sorted(data['spans'].items()):
+        print(f"  {name:<16} {s['count']:>7} {s['mean_ms']:>9.3f} {s['p50_ms']:>9.3f} "
+              f"{s['p95_ms']:>9.3f} {s['p99_ms']:>9.3f}")
+    if data['counters']:
+        print()
+        for name, value in sorted(data['counters'].items()):
+            print(f"  {name:<32} {value:>10}")
+
+
+# Main execution
+if __name__ == "__main__":
+    import sys
+
+    import faiss
+    import numpy as np
+
+    from benchmark import generate_queries, hashing_embedder
+    from eval_retrieval import DEFAULT_DATASET
+
+    print("=" * 70)
+    print("TRACING A RAG QUERY")
+    print("=" * 70)
+
+    enable(opentelemetry='--otel' in sys.argv)
+    embed = hashing_embedder()
+    chunks = DEFAULT_DATASET['chunks']
+
+    with span("embed"):
+        vectors = embed([c['code'] for c in chunks])
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+
+    def rerank(query, candidates):
+        """Cheap lexical rerank: prefer chunks sharing words with the query"""
+        words = set(query.lower().split())
+        return sorted(candidates, key=lambda c: -len(words & set(c['code'].lower().split())))
+
+    def pack_context(candidates, budget_chars=1500):
+        """Concatenate chunks until the character budget is used up"""
+        parts, used = [], 0
+        for c in candidates:
+            if used + len(c['code']) > budget_chars:
+                break
+            parts.append(f"# {c['id']}\n{c['code']}")
+            used += len(c['code'])
+        return '\n\n'.join(parts)
+
+    def generate(prompt):
+        """Fake LLM call; replace with ollama.chat to trace a real model"""
+        time.sleep(0.002)
+        incr("llm.tokens_in", len(prompt.split()))
+        incr("llm.tokens_out", 20)
+        return "answer"
+
+    for query in generate_queries(200):
+        with span("query"):
+            with span("embed"):
+                query_vector = embed([query])
+            with span("search"):
+                _, indices = index.search(query_vector, 3)
+            with span("rerank"):
+                candidates = rerank(query, [chunks[i] for i in indices[0] if i >= 0])
+            with span("pack_context"):
+                context = pack_context(candidates)
+            with span("generate"):
+                generate(f"{context}\n\nQuestion: {query}")
+
+    report()
+    print("\n" + "=" * 70)
+    print("PROMETHEUS EXPORT (first lines)")
+    print("=" * 70)
+    print('\n'.join(prometheus_text().splitlines()[:8]))
+
+    disable()
+    start = time.perf_counter()
+    for _ in range(100_000):
+        with span("noop"):
+            pass
+    per_call_ns = (time.perf_counter() - start) / 100_000 * 1e9
+    print(f"\n💡 Disabled span overhead: {per_call_ns:.0f} ns per call")
+    print("\n✅ Tracing demo complete!")